@@ -6,6 +6,7 @@ from rest_framework.permissions import AllowAny,IsAuthenticated
 from django.conf import settings
 from datetime import datetime, timedelta
 from rest_framework_simplejwt.tokens import RefreshToken
+import logging
 import re
 
 from .serializers import (
@@ -15,6 +16,7 @@ from .serializers import (
     ProfileSerializer
 )
 from .otp_utils import create_otp, send_otp_email, send_otp_sms, verify_otp, resend_otp
+from user.guest_cart import merge_guest_cart
 
 
 from google.oauth2 import id_token
@@ -22,6 +24,15 @@ from google.auth.transport import requests
 
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+def merge_guest_cart_on_login(request, user):
+    """Merge the request's guest cart into the user's; a bad guest cart never blocks sign-in."""
+    try:
+        merge_guest_cart(request, user)
+    except Exception:
+        logger.exception("Could not merge the guest cart of %s", user.pk)
 
 
 class RegisterAPIView(generics.CreateAPIView):
@@ -81,6 +92,7 @@ class LoginView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
+        merge_guest_cart_on_login(request, user)
         refresh = RefreshToken.for_user(user)
         return Response({
             'access': str(refresh.access_token),
@@ -187,6 +199,7 @@ class VerifyOTPView(APIView):
             user.save()
         
         # Generate JWT tokens
+        merge_guest_cart_on_login(request, user)
         refresh = RefreshToken.for_user(user)
         
         return Response({
@@ -352,6 +365,7 @@ class GoogleAuthView(APIView):
                 defaults={"email": email, "first_name": name}
             )
 
+            merge_guest_cart_on_login(request, user)
             refresh = RefreshToken.for_user(user)
 
             return Response({
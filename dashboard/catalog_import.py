@@ -0,0 +1,396 @@
+"""
+Bulk catalog import from CSV or XLSX files.
+
+One row per variant. Products, categories, sizes and colors are matched by
+name (case-insensitive) and created when missing; existing variants are
+matched by (product, size, variant name) and updated in place. Rows are
+streamed and written in chunks, so memory stays bounded by the chunk size.
+
+Columns (header names are case-insensitive, spaces become underscores):
+    product*, category*, title, base_price, variant, size, color, price*,
+    stock*, offer_type, offer, description, height, pot_size, light, water,
+    growth_rate, is_featured_collection, is_bestseller, images,
+    care_guide_title, care_guide
+`images` lists paths of files already in media storage, separated by `|`.
+"""
+import csv
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from user.cache import bump_cache_groups
+from user.carts import recalculate_carts_for_variants
+from user.catalog import refresh_catalog_entries
+from user.inventory import record_movements
+from user.models import CareGuide, Categories, Colors, Product, ProductImage, ProductVariant, Sizes
+from user.pricing import set_derived_prices
+from user.search import reindex_variants
+
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+REQUIRED_COLUMNS = ('product', 'category', 'price', 'stock')
+VARIANT_TEXT_FIELDS = ('description', 'height', 'pot_size', 'light', 'water', 'growth_rate')
+VARIANT_UPDATE_FIELDS = [
+    'color', 'stock', 'price', 'offer_type', 'offer', *VARIANT_TEXT_FIELDS,
+    'is_featured_collection', 'is_bestseller', 'effective_price', 'offer_percentage', 'updated_at',
+]
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+
+class CatalogImportError(Exception):
+    pass
+
+
+def normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+
+def read_rows(file, filename):
+    """
+    Yield `(row_number, {column: value})` from a binary CSV or XLSX file.
+    Files that cannot be read raise CatalogImportError.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.xlsx':
+        try:
+            workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+            raise CatalogImportError("The file is not a valid .xlsx workbook.") from e
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [normalize_header(value) for value in next(rows, ())]
+            check_header(header)
+            for number, values in enumerate(rows, start=2):
+                if any(value not in (None, '') for value in values):
+                    yield number, dict(zip(header, values))
+        finally:
+            workbook.close()
+    elif extension == '.csv':
+        number = 1
+        try:
+            reader = csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+            header = [normalize_header(value) for value in next(reader, [])]
+            check_header(header)
+            for number, values in enumerate(reader, start=2):
+                if any(value.strip() for value in values):
+                    yield number, dict(zip(header, values))
+        except UnicodeDecodeError as e:
+            raise CatalogImportError(f"The file is not UTF-8 text (after row {number}); save it as CSV UTF-8.") from e
+        except csv.Error as e:
+            raise CatalogImportError(f"The CSV file could not be read after row {number}: {e}.") from e
+    else:
+        raise CatalogImportError("Upload a .csv or .xlsx file.")
+
+
+def check_header(header):
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise CatalogImportError(f"Missing columns: {', '.join(missing)}.")
+
+
+def text(raw, column):
+    value = raw.get(column)
+    return '' if value is None else str(value).strip()
+
+
+def clean_row(item):
+    """
+    Validate and convert one raw row. Pure function of the row, so chunks
+    can be validated in worker processes. Returns (row_number, data, errors).
+    """
+    number, raw = item
+    errors = []
+    data = {
+        'product': text(raw, 'product'),
+        'category': text(raw, 'category'),
+        'title': text(raw, 'title') or None,
+        'variant': text(raw, 'variant') or None,
+        'size': text(raw, 'size'),
+        'color': text(raw, 'color'),
+        'offer_type': text(raw, 'offer_type').lower() or None,
+        'images': [path.strip() for path in text(raw, 'images').split('|') if path.strip()],
+        'care_guide_title': text(raw, 'care_guide_title') or 'General Care',
+        'care_guide': text(raw, 'care_guide'),
+        'is_featured_collection': text(raw, 'is_featured_collection').lower() in TRUE_VALUES,
+        'is_bestseller': text(raw, 'is_bestseller').lower() in TRUE_VALUES,
+    }
+    for field in VARIANT_TEXT_FIELDS:
+        data[field] = text(raw, field) or (None if field != 'description' else '')
+
+    if not data['product']:
+        errors.append("product is required")
+    if not data['category']:
+        errors.append("category is required")
+
+    for column, required in (('price', True), ('base_price', False)):
+        value = text(raw, column)
+        data[column] = None
+        if not value:
+            if required:
+                errors.append(f"{column} is required")
+            continue
+        try:
+            data[column] = Decimal(value).quantize(Decimal('0.01'))
+            if data[column] < 0:
+                raise InvalidOperation
+        except InvalidOperation:
+            errors.append(f"{column} must be a non-negative amount")
+
+    try:
+        stock = Decimal(text(raw, 'stock'))
+        if stock < 0 or stock != stock.to_integral_value():
+            raise ValueError
+        data['stock'] = int(stock)
+    except (InvalidOperation, ValueError):
+        errors.append("stock must be a non-negative whole number")
+
+    if data['offer_type'] not in (None, 'percentage', 'amount'):
+        errors.append("offer_type must be percentage or amount")
+    try:
+        data['offer'] = float(text(raw, 'offer') or 0)
+        if data['offer'] < 0 or (data['offer_type'] == 'percentage' and data['offer'] > 100):
+            raise ValueError
+    except ValueError:
+        errors.append("offer must be between 0 and 100 for percentages and non-negative for amounts")
+    return number, data, errors
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def name_map(queryset, field):
+    """{lowercased name: id} of every row in `queryset`."""
+    return dict(queryset.annotate(key=Lower(field)).values_list('key', 'id'))
+
+
+def resolve_names(model, field, names, known, copy_to=()):
+    """
+    Add ids for `names` to the `known` map, creating the missing rows with
+    the name in `field` and in the `copy_to` fields.
+    """
+    missing = {}
+    for name in names:
+        if name and name.lower() not in known:
+            missing.setdefault(name.lower(), name)
+    if missing:
+        created = model.objects.bulk_create(
+            [model(**{key: name for key in (field, *copy_to)}) for name in missing.values()]
+        )
+        known.update((getattr(obj, field).lower(), obj.id) for obj in created)
+
+
+class CatalogImporter:
+    def __init__(self, chunk_size=IMPORT_CHUNK_SIZE, workers=0):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.summary = {
+            'rows': 0,
+            'products_created': 0,
+            'products_updated': 0,
+            'variants_created': 0,
+            'variants_updated': 0,
+            'images_created': 0,
+            'care_guides_saved': 0,
+            'error_count': 0,
+            'errors': [],
+        }
+
+    def add_error(self, number, message):
+        self.summary['error_count'] += 1
+        if len(self.summary['errors']) < MAX_REPORTED_ERRORS:
+            self.summary['errors'].append(f"Row {number}: {message}")
+
+    def run(self, file, filename):
+        self.categories = name_map(Categories.objects.all(), 'category_name')
+        self.sizes = name_map(Sizes.objects.all(), 'size')
+        self.colors = name_map(Colors.objects.all(), 'name')
+        self.products = name_map(Product.objects.all(), 'name')
+
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            for chunk in chunks(read_rows(file, filename), self.chunk_size):
+                self.summary['rows'] += len(chunk)
+                if executor is not None:
+                    cleaned = executor.map(clean_row, chunk, chunksize=max(1, len(chunk) // (self.workers * 4)))
+                else:
+                    cleaned = map(clean_row, chunk)
+
+                rows = []
+                for number, data, errors in cleaned:
+                    if errors:
+                        self.add_error(number, "; ".join(errors))
+                    else:
+                        rows.append(data)
+                if rows:
+                    self.write_chunk(rows)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        bump_cache_groups('catalog')
+        return self.summary
+
+    @transaction.atomic
+    def write_chunk(self, rows):
+        resolve_names(Categories, 'category_name', [row['category'] for row in rows], self.categories)
+        resolve_names(Sizes, 'size', [row['size'] for row in rows], self.sizes)
+        resolve_names(Colors, 'name', [row['color'] for row in rows], self.colors, copy_to=('color',))
+
+        product_ids = self.save_products(rows)
+        variants = self.save_variants(rows, product_ids)
+        self.save_images(rows, variants)
+        self.save_care_guides(rows, variants)
+
+        variant_ids = list({variant.id for variant in variants})
+        refresh_catalog_entries(variant_ids)
+        reindex_variants(variant_ids)
+        recalculate_carts_for_variants(variant_ids)
+
+    def save_products(self, rows):
+        # first row of each product carries its product-level columns
+        by_name = {}
+        for row in rows:
+            by_name.setdefault(row['product'].lower(), row)
+
+        new = [
+            Product(
+                name=row['product'],
+                category_id=self.categories[row['category'].lower()],
+                title=row['title'],
+                base_price=row['base_price'],
+            )
+            for key, row in by_name.items() if key not in self.products
+        ]
+        for product in Product.objects.bulk_create(new):
+            self.products[product.name.lower()] = product.id
+
+        existing = Product.objects.filter(id__in=[
+            self.products[key] for key in by_name if key in self.products
+        ]).exclude(id__in=[product.id for product in new])
+        updated = []
+        for product in existing:
+            row = by_name[product.name.lower()]
+            product.category_id = self.categories[row['category'].lower()]
+            product.title = row['title'] or product.title
+            product.base_price = row['base_price'] if row['base_price'] is not None else product.base_price
+            product.updated_at = timezone.now()
+            updated.append(product)
+        Product.objects.bulk_update(updated, ['category', 'title', 'base_price', 'updated_at'])
+
+        self.summary['products_created'] += len(new)
+        self.summary['products_updated'] += len(updated)
+        return {key: self.products[key] for key in by_name}
+
+    def variant_key(self, product_id, size_id, name):
+        return product_id, size_id, (name or '').lower()
+
+    def save_variants(self, rows, product_ids):
+        """Create or update the variants of `rows`; returns them in row order."""
+        # locked so the ledgered stock difference is exact under concurrent sales
+        existing = {
+            self.variant_key(variant.product_id, variant.size_id, variant.variant): variant
+            for variant in ProductVariant.objects.select_for_update().filter(product_id__in=set(product_ids.values()))
+        }
+        previous_stock = {variant.pk: variant.stock for variant in existing.values()}
+        now = timezone.now()
+        new, updated, saved = {}, {}, []
+        for row in rows:
+            product_id = product_ids[row['product'].lower()]
+            size_id = self.sizes.get(row['size'].lower())
+            key = self.variant_key(product_id, size_id, row['variant'])
+            variant = existing.get(key) or new.get(key)
+            if variant is None:
+                variant = new[key] = ProductVariant(product_id=product_id, size_id=size_id, variant=row['variant'])
+            elif variant.pk is not None:
+                updated[key] = variant
+
+            variant.color_id = self.colors.get(row['color'].lower())
+            for field in ('stock', 'price', 'offer_type', 'offer', *VARIANT_TEXT_FIELDS,
+                          'is_featured_collection', 'is_bestseller'):
+                setattr(variant, field, row[field])
+            variant.updated_at = now
+            saved.append(variant)
+        set_derived_prices(list({id(variant): variant for variant in saved}.values()))
+
+        ProductVariant.objects.bulk_create(list(new.values()))
+        ProductVariant.objects.bulk_update(list(updated.values()), VARIANT_UPDATE_FIELDS)
+        record_movements({
+            variant.pk: variant.stock - previous_stock.get(variant.pk, 0)
+            for variant in (*new.values(), *updated.values())
+        }, 'import')
+        self.summary['variants_created'] += len(new)
+        self.summary['variants_updated'] += len(updated)
+        return saved
+
+    def save_images(self, rows, variants):
+        wanted = [(variant, row['images']) for row, variant in zip(rows, variants) if row['images']]
+        if not wanted:
+            return
+        attached, last_order = {}, {}
+        for variant_id, image, order_by in ProductImage.objects.filter(
+            variant_id__in=[variant.id for variant, _ in wanted]
+        ).values_list('variant_id', 'image', 'order_by'):
+            attached.setdefault(variant_id, set()).add(image)
+            last_order[variant_id] = max(last_order.get(variant_id, 0), order_by)
+
+        images = []
+        for variant, paths in wanted:
+            for path in paths:
+                if path in attached.setdefault(variant.id, set()):
+                    continue
+                attached[variant.id].add(path)
+                last_order[variant.id] = last_order.get(variant.id, 0) + 1
+                images.append(ProductImage(variant_id=variant.id, image=path, order_by=last_order[variant.id]))
+        ProductImage.objects.bulk_create(images)
+        self.summary['images_created'] += len(images)
+
+    def save_care_guides(self, rows, variants):
+        wanted = {
+            (variant.id, row['care_guide_title'].lower()): (variant, row)
+            for row, variant in zip(rows, variants) if row['care_guide']
+        }
+        if not wanted:
+            return
+        existing = {
+            (guide.variant_id, guide.title.lower()): guide
+            for guide in CareGuide.objects.filter(variant_id__in={variant_id for variant_id, _ in wanted})
+        }
+        new, updated = [], []
+        for key, (variant, row) in wanted.items():
+            guide = existing.get(key)
+            if guide is None:
+                new.append(CareGuide(variant_id=variant.id, title=row['care_guide_title'], content=row['care_guide']))
+            else:
+                guide.content = row['care_guide']
+                guide.updated_at = timezone.now()
+                updated.append(guide)
+        CareGuide.objects.bulk_create(new)
+        CareGuide.objects.bulk_update(updated, ['content', 'updated_at'])
+        self.summary['care_guides_saved'] += len(new) + len(updated)
+
+
+def import_catalog(file, filename, chunk_size=IMPORT_CHUNK_SIZE, workers=0):
+    """
+    Import a catalog file opened in binary mode. `workers` > 1 validates
+    rows in that many processes. Returns the summary counters; invalid rows
+    are skipped and reported in `errors`.
+    """
+    return CatalogImporter(chunk_size=chunk_size, workers=workers).run(file, filename)
@@ -0,0 +1,36 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.catalog_import import IMPORT_CHUNK_SIZE, CatalogImportError, import_catalog
+
+
+class Command(BaseCommand):
+    help = "Import products, variants, images and care guides from a CSV or XLSX file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or XLSX file, one row per variant.")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="Rows written per transaction.")
+        parser.add_argument(
+            '--workers', type=int, default=min(4, os.cpu_count() or 1),
+            help="Processes validating rows; 0 or 1 validates inline.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as file:
+                summary = import_catalog(
+                    file, options['path'], chunk_size=options['chunk_size'], workers=options['workers']
+                )
+        except (OSError, CatalogImportError) as e:
+            raise CommandError(str(e))
+
+        for error in summary['errors']:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['rows']} rows: "
+            f"{summary['products_created']} products created, {summary['products_updated']} updated; "
+            f"{summary['variants_created']} variants created, {summary['variants_updated']} updated; "
+            f"{summary['images_created']} images, {summary['care_guides_saved']} care guides; "
+            f"{summary['error_count']} rows skipped."
+        ))
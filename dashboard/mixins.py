@@ -57,3 +57,19 @@ class PaginationSearchMixin:
         filtered_queryset = self.filter_queryset(queryset, search_query, filter_fields)
         paginated_queryset = self.paginate_queryset(request, filtered_queryset)
         return paginated_queryset, search_query, filter_fields
+
+
+class CacheInvalidationMixin:
+    """
+    Bumps the storefront response cache groups in `cache_groups` once a
+    dashboard write view redirects back after saving. Model signals already
+    cover saves and deletes; this also catches queryset updates.
+    """
+    cache_groups = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if self.cache_groups and response.status_code == 302:
+            from user.cache import bump_cache_groups
+            bump_cache_groups(*self.cache_groups)
+        return response
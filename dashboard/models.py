@@ -1,3 +1,6 @@
+from datetime import timedelta
+
+from django.contrib.contenttypes.fields import GenericRelation
 from django.db import models
 from django.utils import timezone
 from authentication.models import BaseModel
@@ -33,6 +36,32 @@ class ContactUs(BaseModel):
 
 
 
+class CustomAdQuerySet(models.QuerySet):
+    def currently_active(self, now=None):
+        """Ads live at `now`, in display order. Mirrors CustomAd.is_currently_active()."""
+        now = now or timezone.now()
+        return self.filter(
+            models.Q(start_date__isnull=True) | models.Q(start_date__lte=now),
+            models.Q(end_date__isnull=True) | models.Q(end_date__gte=now),
+            active_status=True,
+            is_active=True,
+        ).order_by('-priority', models.F('start_date').desc(nulls_last=True), '-created_at', '-id')
+
+    def next_boundary(self, now=None):
+        """Earliest start or end date after `now`: when the live set can next change."""
+        now = now or timezone.now()
+        ads = self.filter(active_status=True, is_active=True)
+        bounds = ads.aggregate(
+            start=models.Min('start_date', filter=models.Q(start_date__gt=now)),
+            end=models.Min('end_date', filter=models.Q(end_date__gte=now)),
+        )
+        # an ad stays live through its end_date and drops out just after it
+        if bounds['end'] is not None:
+            bounds['end'] += timedelta(microseconds=1)
+        candidates = [bound for bound in bounds.values() if bound is not None]
+        return min(candidates) if candidates else None
+
+
 class CustomAd(BaseModel):
     AD_TYPE_CHOICES = [
         ('banner', 'Banner'),
@@ -50,11 +79,17 @@ class CustomAd(BaseModel):
     start_date = models.DateTimeField(blank=True, null=True, verbose_name="Start Date")
     end_date = models.DateTimeField(blank=True, null=True, verbose_name="End Date")
     priority = models.PositiveIntegerField(default=0, verbose_name="Display Priority")
+    renditions = GenericRelation('user.ImageRendition')
+
+    objects = CustomAdQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Custom Advertisement'
         verbose_name_plural = 'Custom Advertisements'
         ordering = ['-priority', '-created_at']
+        indexes = [
+            models.Index(fields=['is_active', 'start_date', 'end_date', 'priority']),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.ad_type})"
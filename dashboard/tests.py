@@ -1,3 +1,86 @@
+from decimal import Decimal
+from io import BytesIO
+
+import openpyxl
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from dashboard.catalog_import import CatalogImportError, import_catalog
+from user.inventory import reconcile_stock
+from user.models import CareGuide, CatalogEntry, Categories, Product, ProductImage, ProductVariant, Sizes
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.indoor = Categories.objects.create(category_name="Indoor")
+        product = Product.objects.create(category=self.indoor, name="Fern")
+        self.small = Sizes.objects.create(size="Small")
+        self.existing = ProductVariant.objects.create(
+            product=product, size=self.small, variant="Boston", price=Decimal('80.00'), stock=1
+        )
+
+    def csv_file(self, *rows):
+        header = "Product,Category,Variant,Size,Price,Stock,Offer Type,Offer,Images,Care Guide"
+        return BytesIO("\n".join((header,) + rows).encode())
+
+    def test_csv_creates_and_updates_in_chunks(self):
+        file = self.csv_file(
+            "fern,indoor,Boston,small,90,5,percentage,10,,Mist daily",
+            "Fern,Indoor,Kimberly,Large,120.5,3,,,product_images/k1.jpg|product_images/k2.jpg,",
+            "Snake Plant,Succulents,,,300,7,amount,50,,",
+            "Broken,Indoor,,,abc,-1,,,,",
+        )
+        summary = import_catalog(file, "catalog.csv", chunk_size=2)
+
+        self.assertEqual(summary['rows'], 4)
+        self.assertEqual((summary['variants_created'], summary['variants_updated']), (2, 1))
+        self.assertEqual(summary['products_created'], 1)
+        self.assertEqual(summary['error_count'], 1)
+        self.assertIn("Row 5", summary['errors'][0])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.price, self.existing.stock), (Decimal('90.00'), 5))
+        self.assertEqual(self.existing.effective_price, Decimal('81.00'))
+        self.assertEqual(CareGuide.objects.get(variant=self.existing).content, "Mist daily")
+        self.assertEqual(list(self.existing.stock_movements.values_list('reason', 'quantity')), [('opening', 1), ('import', 4)])
+        self.assertEqual(reconcile_stock(), [])
+
+        kimberly = ProductVariant.objects.get(variant="Kimberly")
+        self.assertEqual((kimberly.product.category, kimberly.size.size), (self.indoor, "Large"))
+        self.assertEqual(
+            list(kimberly.images.order_by('order_by').values_list('image', flat=True)),
+            ["product_images/k1.jpg", "product_images/k2.jpg"],
+        )
+        snake = ProductVariant.objects.get(product__name="Snake Plant")
+        self.assertEqual(snake.product.category.category_name, "Succulents")
+        self.assertEqual(snake.effective_price, Decimal('250.00'))
+        self.assertEqual(CatalogEntry.objects.get(variant=snake).price, Decimal('250.00'))
+
+        # re-importing is idempotent
+        import_catalog(self.csv_file(
+            "Fern,Indoor,Kimberly,Large,120.5,3,,,product_images/k1.jpg,",
+        ), "catalog.csv")
+        self.assertEqual(ProductVariant.objects.count(), 3)
+        self.assertEqual(ProductImage.objects.filter(variant=kimberly).count(), 2)
+
+    def test_unreadable_files_raise_import_errors(self):
+        with self.assertRaisesMessage(CatalogImportError, "not a valid .xlsx"):
+            import_catalog(BytesIO(b"not a zip"), "catalog.xlsx")
+        latin1 = BytesIO("Product,Category,Price,Stock\nFougère,Indoor,90,5\n".encode('latin-1'))
+        with self.assertRaisesMessage(CatalogImportError, "not UTF-8"):
+            import_catalog(latin1, "catalog.csv")
+
+    def test_xlsx_streaming_with_process_pool(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["product", "category", "variant", "price", "stock"])
+        for index in range(30):
+            sheet.append(["Palm", "Outdoor", f"Pot {index}", 100 + index, 2])
+        buffer = BytesIO()
+        workbook.save(buffer)
+        buffer.seek(0)
+
+        summary = import_catalog(buffer, "catalog.xlsx", chunk_size=8, workers=2)
+        self.assertEqual((summary['variants_created'], summary['error_count']), (30, 0))
+        self.assertEqual(ProductVariant.objects.filter(product__name="Palm").count(), 30)
@@ -56,6 +56,7 @@ urlpatterns = [
     path('variants/add/', views.ProductVariantCreateView.as_view(), name='add_product_variant'),
     path('variants/edit/<int:pk>/', views.ProductVariantEditView.as_view(), name='edit_product_variant'),
     path('variants/delete/<int:variant_id>/', views.ProductVariantDeleteView.as_view(), name='delete_product_variant'),
+    path('variants/import/', views.CatalogImportView.as_view(), name='import_catalog'),
     path('delete_variant_image/<int:image_id>/', views.DeleteVariantImageView.as_view(), name='delete_variant_image'),
 
     # Care Guides
@@ -23,7 +23,8 @@ from dashboard.forms      import (
     ServiceFeatureForm, ServiceImageForm
 )
 from dashboard.excel_pdf  import download_excel_dynamic, generate_pdf_dynamic
-from .mixins             import PaginationSearchMixin
+from dashboard.catalog_import import CatalogImportError, import_catalog
+from .mixins             import CacheInvalidationMixin, PaginationSearchMixin
 from .models             import ContactUs, TermsCondition
 
 # ==== User and Authentication App Imports ====
@@ -47,6 +48,7 @@ from rest_framework import status
 
 
 from user.models import Notification
+from user.stock import release_order_stock
 from payment.models import PaymentGateway
 
 
@@ -221,7 +223,8 @@ class ViewNotifications(View):
         })
 
 
-class ProfileView(View):
+class ProfileView(CacheInvalidationMixin, View):
+    cache_groups = ('content',)
     template_name = 'profile/profile.html'
 
     def get(self, request):
@@ -376,7 +379,8 @@ class ProductCategoryView(PaginationSearchMixin, View):
 
 
 # Django form for category
-class CategoryCreateView(View):
+class CategoryCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request):
         form = CategoriesForm(request.POST, request.FILES)
         if form.is_valid():
@@ -392,7 +396,8 @@ class CategoryCreateView(View):
         return redirect('product_category')
 
 
-class CategoryEditView(View):
+class CategoryEditView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request, pk):
         category = get_object_or_404(Categories, pk=pk)
         form = CategoriesForm(request.POST, request.FILES, instance=category)
@@ -409,7 +414,8 @@ class CategoryEditView(View):
         return redirect('product_category')
 
 
-class CategoryDeleteView(View):
+class CategoryDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def get(self, request, pk):
         try:
             category = get_object_or_404(Categories, pk=pk)
@@ -511,7 +517,8 @@ class ProductsView(PaginationSearchMixin, View):
         })
 
 
-class ProductCreateView(View):
+class ProductCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request):
         form = ProductForm(request.POST)
         if form.is_valid():
@@ -527,7 +534,8 @@ class ProductCreateView(View):
         return redirect('products')
 
 
-class ProductEditView(View):
+class ProductEditView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request, pk):
         product = get_object_or_404(Product, pk=pk)
         form = ProductForm(request.POST, instance=product)
@@ -542,7 +550,8 @@ class ProductEditView(View):
         messages.error(request, "Product update failed.", extra_tags="product-error")
         return redirect('products')
 
-class ProductDeleteView(View):
+class ProductDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def get(self, request, product_id):
         try:
             product = get_object_or_404(Product, pk=product_id)
@@ -577,7 +586,8 @@ class ProductVariantsView(PaginationSearchMixin, View):
         })
 
 
-class ProductVariantCreateView(View):
+class ProductVariantCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request):
         form = ProductVariantForm(request.POST)
         images = request.FILES.getlist('variant_images')
@@ -603,7 +613,8 @@ class ProductVariantCreateView(View):
         return redirect('product_variants')
 
 
-class ProductVariantEditView(View):
+class ProductVariantEditView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request, pk):
         variant = get_object_or_404(ProductVariant, pk=pk)
         form = ProductVariantForm(request.POST, instance=variant)
@@ -636,7 +647,8 @@ class ProductVariantEditView(View):
         return redirect('product_variants')
 
 
-class ProductVariantDeleteView(View):
+class ProductVariantDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def get(self, request, variant_id):
         try:
             variant = get_object_or_404(ProductVariant, pk=variant_id)
@@ -647,6 +659,34 @@ class ProductVariantDeleteView(View):
         return redirect('product_variants')
 
 
+class CatalogImportView(AdminPermissionMixin, CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
+    def post(self, request):
+        upload = request.FILES.get('catalog_file')
+        if not upload:
+            messages.error(request, "Choose a CSV or XLSX file to import.", extra_tags="variant-error")
+            return redirect('product_variants')
+        try:
+            summary = import_catalog(upload, upload.name)
+        except CatalogImportError as e:
+            messages.error(request, str(e), extra_tags="variant-error")
+            return redirect('product_variants')
+
+        messages.success(
+            request,
+            f"Catalog imported: {summary['variants_created']} variants created, "
+            f"{summary['variants_updated']} updated, {summary['products_created']} new products.",
+            extra_tags="variant-success",
+        )
+        if summary['error_count']:
+            messages.error(
+                request,
+                f"{summary['error_count']} rows skipped. " + " ".join(summary['errors'][:5]),
+                extra_tags="variant-error",
+            )
+        return redirect('product_variants')
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CareGuideListView(View):
     def get(self, request, variant_id):
@@ -665,7 +705,8 @@ class CareGuideListView(View):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class CareGuideCreateView(View):
+class CareGuideCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request, variant_id):
         variant = get_object_or_404(ProductVariant, pk=variant_id)
         form = CareGuideForm(request.POST)
@@ -688,7 +729,8 @@ class CareGuideCreateView(View):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class CareGuideEditView(View):
+class CareGuideEditView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request, pk):
         guide = get_object_or_404(CareGuide, pk=pk)
         form = CareGuideForm(request.POST, instance=guide)
@@ -709,7 +751,8 @@ class CareGuideEditView(View):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class CareGuideDeleteView(View):
+class CareGuideDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request, pk):
         try:
             guide = get_object_or_404(CareGuide, pk=pk)
@@ -729,7 +772,8 @@ class CareGuideTemplatesView(View):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class DeleteVariantImageView(View):
+class DeleteVariantImageView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request, image_id):
         try:
             image = get_object_or_404(ProductImage, pk=image_id)
@@ -864,6 +908,8 @@ class OrderDetailView(View):
             previous_status = order.status
             order.status = new_status
             order.save()
+            if new_status == 'cancelled' and previous_status != 'cancelled':
+                release_order_stock(order)
             
             user_profile = order.user
             status_display = dict(Order.STATUS_CHOICES).get(new_status, new_status.title())
@@ -1133,7 +1179,8 @@ class SizesView(PaginationSearchMixin, View):
         })
 
 
-class SizeCreateView(View):
+class SizeCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request):
         form = SizeForm(request.POST)
         if form.is_valid():
@@ -1150,7 +1197,8 @@ class SizeCreateView(View):
         return redirect('product_size')
 
 
-class SizeEditView(View):
+class SizeEditView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def post(self, request, pk):
         size = get_object_or_404(Sizes, pk=pk)
         form = SizeForm(request.POST, instance=size)
@@ -1167,7 +1215,8 @@ class SizeEditView(View):
         return redirect('product_size')
 
 
-class SizeDeleteView(View):
+class SizeDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('catalog',)
     def get(self, request, pk):
         try:
             size = get_object_or_404(Sizes, pk=pk)
@@ -1279,7 +1328,8 @@ class TermsConditionListView(View):
         })
 
 
-class TermsConditionCreateView(View):
+class TermsConditionCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('content',)
     template_name = 'tandc/add_tandc.html'
 
     def get(self, request):
@@ -1299,7 +1349,8 @@ class TermsConditionCreateView(View):
         return redirect('terms_condition_list')
 
 
-class TermsConditionEditView(View):
+class TermsConditionEditView(CacheInvalidationMixin, View):
+    cache_groups = ('content',)
     template_name = 'tandc/edit_tandc.html'
 
     def get(self, request, pk):
@@ -1323,7 +1374,8 @@ class TermsConditionEditView(View):
         return redirect('terms_condition_list')
 
 
-class TermsConditionDeleteView(View):
+class TermsConditionDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('content',)
     def post(self, request, pk):
         try:
             term = get_object_or_404(TermsCondition, pk=pk)
@@ -1485,7 +1537,8 @@ class ServiceCategoryView(PaginationSearchMixin, View):
         })
 
 
-class ServiceCategoryCreateView(View):
+class ServiceCategoryCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def post(self, request):
         form = ServiceCategoryForm(request.POST, request.FILES)
         if form.is_valid():
@@ -1501,7 +1554,8 @@ class ServiceCategoryCreateView(View):
         return redirect('service_category')
 
 
-class ServiceCategoryEditView(View):
+class ServiceCategoryEditView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def post(self, request, pk):
         category = get_object_or_404(ServiceCategory, pk=pk)
         form = ServiceCategoryForm(request.POST, request.FILES, instance=category)
@@ -1518,7 +1572,8 @@ class ServiceCategoryEditView(View):
         return redirect('service_category')
 
 
-class ServiceCategoryDeleteView(View):
+class ServiceCategoryDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def get(self, request, pk):
         try:
             category = get_object_or_404(ServiceCategory, pk=pk)
@@ -1550,7 +1605,8 @@ class ServicesView(PaginationSearchMixin, View):
         })
 
 
-class ServiceCreateView(View):
+class ServiceCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def post(self, request):
         form = ServiceForm(request.POST, request.FILES)
         if form.is_valid():
@@ -1566,7 +1622,8 @@ class ServiceCreateView(View):
         return redirect('services')
 
 
-class ServiceEditView(View):
+class ServiceEditView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def post(self, request, pk):
         service = get_object_or_404(Service, pk=pk)
         form = ServiceForm(request.POST, request.FILES, instance=service)
@@ -1581,7 +1638,8 @@ class ServiceEditView(View):
         messages.error(request, "Service update failed.", extra_tags="service-error")
         return redirect('services')
 
-class ServiceDeleteView(View):
+class ServiceDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def get(self, request, service_id):
         try:
             service = get_object_or_404(Service, pk=service_id)
@@ -1601,7 +1659,8 @@ class ServiceFeatureListView(View):
         data = [{'id': f.id, 'name': f.name} for f in features]
         return JsonResponse({'success': True, 'features': data})
 
-class ServiceFeatureCreateView(View):
+class ServiceFeatureCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def post(self, request, service_id):
         service = get_object_or_404(Service, pk=service_id)
         form = ServiceFeatureForm(request.POST)
@@ -1612,7 +1671,8 @@ class ServiceFeatureCreateView(View):
             return JsonResponse({'success': True, 'feature': {'id': feature.id, 'name': feature.name}})
         return JsonResponse({'success': False, 'errors': form.errors}, status=400)
 
-class ServiceFeatureDeleteView(View):
+class ServiceFeatureDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def post(self, request, pk):
         feature = get_object_or_404(ServiceFeature, pk=pk)
         feature.delete()
@@ -1631,7 +1691,8 @@ class ServiceImageListView(View):
                 data.append({'id': i.id, 'url': i.image.url, 'order_by': i.order_by})
         return JsonResponse({'success': True, 'images': data})
 
-class ServiceImageCreateView(View):
+class ServiceImageCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def post(self, request, service_id):
         service = get_object_or_404(Service, pk=service_id)
         form = ServiceImageForm(request.POST, request.FILES)
@@ -1642,7 +1703,8 @@ class ServiceImageCreateView(View):
             return JsonResponse({'success': True, 'image': {'id': image.id, 'url': image.image.url, 'order_by': image.order_by}})
         return JsonResponse({'success': False, 'errors': form.errors}, status=400)
 
-class ServiceImageDeleteView(View):
+class ServiceImageDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('services',)
     def post(self, request, pk):
         image = get_object_or_404(ServiceImage, pk=pk)
         image.delete()
@@ -1669,7 +1731,8 @@ class CustomAdsView(PaginationSearchMixin, View):
         })
 
 
-class CustomAdCreateView(View):
+class CustomAdCreateView(CacheInvalidationMixin, View):
+    cache_groups = ('ads',)
     def post(self, request):
         form = CustomAdForm(request.POST, request.FILES)
         if form.is_valid():
@@ -1682,7 +1745,8 @@ class CustomAdCreateView(View):
         return redirect('custom_ads')
 
 
-class CustomAdEditView(View):
+class CustomAdEditView(CacheInvalidationMixin, View):
+    cache_groups = ('ads',)
     def post(self, request, pk):
         ad = get_object_or_404(CustomAd, pk=pk)
         form = CustomAdForm(request.POST, request.FILES, instance=ad)
@@ -1696,7 +1760,8 @@ class CustomAdEditView(View):
         return redirect('custom_ads')
 
 
-class CustomAdDeleteView(View):
+class CustomAdDeleteView(CacheInvalidationMixin, View):
+    cache_groups = ('ads',)
     def get(self, request, pk):
         ad = get_object_or_404(CustomAd, pk=pk)
         try:
@@ -0,0 +1,44 @@
+"""
+orjson-backed drop-in replacements for DRF's JSONRenderer and JSONParser,
+selected in REST_FRAMEWORK (see settings.JSON_BACKEND).
+"""
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# Datetimes are passed through to DRF's encoder as well, so payloads are
+# identical to JSONRenderer's compact output (millisecond precision, 'Z').
+# UUIDs, dicts, lists and numbers are encoded natively.
+DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_encoder = JSONEncoder()
+
+
+def encode_default(obj):
+    # Decimal, datetime, lazy strings, querysets, ... as JSONRenderer does
+    return _encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        options = DUMPS_OPTIONS
+        # orjson only indents by two spaces; any requested indent gets that
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=encode_default, option=options)
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third-party apps
     'rest_framework', 
@@ -117,6 +118,25 @@ DATABASES = {
 }
 
 
+# Cache
+# Response caches are shared between workers only with Redis; without
+# REDIS_URL each process keeps its own local-memory cache.
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -171,11 +191,40 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Image renditions
+# Generated on a bounded thread pool in each web process once uploads commit;
+# IMAGE_RENDITION_QUEUE=0 turns that off. Either way, run
+# `python manage.py generate_renditions` after deploys and on a schedule to
+# render anything dropped or lost on restart.
+IMAGE_RENDITION_WORKERS = int(os.environ.get("IMAGE_RENDITION_WORKERS", 2))
+IMAGE_RENDITION_QUEUE = int(os.environ.get("IMAGE_RENDITION_QUEUE", 20))
+
+
 ## rest_framework settings
+# JSON_BACKEND=stdlib switches the API back to DRF's json-module renderer
+# and parser; the default orjson pair produces the same payloads faster.
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "orjson")
+
+if JSON_BACKEND == "stdlib":
+    JSON_RENDERER = 'rest_framework.renderers.JSONRenderer'
+    JSON_PARSER = 'rest_framework.parsers.JSONParser'
+else:
+    JSON_RENDERER = 'leafin_backend.fastjson.ORJSONRenderer'
+    JSON_PARSER = 'leafin_backend.fastjson.ORJSONParser'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        JSON_RENDERER,
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        JSON_PARSER,
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 
@@ -205,8 +254,12 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-cart-token',
 ]
 
+# Guest carts hand their token back in this header (see user.guest_cart)
+CORS_EXPOSE_HEADERS = ['x-cart-token']
+
 
 
 
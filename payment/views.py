@@ -30,6 +30,7 @@ from .models import Payment, Transaction, PaymentLog, PaymentGateway
 from .exceptions import PaymentError, InvalidPaymentError
 from .utils import validate_amount, sanitize_user_input, get_client_ip
 from user.models import Order, OrderItem, ProductVariant, ShippingAddress
+from user.stock import InsufficientStock, commit_reservations, ensure_stock_held, release_order_stock
 
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -68,8 +69,10 @@ class PaymentManager:
                 'payment_metadata': kwargs.get('metadata', {}),
             })
 
-            if order is not None:
-                payment_data['order'] = order
+            # Payment has no order column: orders are linked through paid_for
+            if order is not None and paid_for is None:
+                payment_data['content_type'] = ContentType.objects.get_for_model(order)
+                payment_data['object_id'] = order.pk
 
             payment = Payment.objects.create(**payment_data)
 
@@ -148,12 +151,19 @@ class PaymentManager:
                 )
 
             # Update related Order status if payment relates to an order
-            order = getattr(payment, "order", None)
+            order = payment.paid_for if isinstance(payment.paid_for, Order) else None
             if order:
                 if status == "completed":
                     order.status = "processing"
+                    try:
+                        commit_reservations(order)
+                    except InsufficientStock:
+                        # the hold expired and the stock sold out before the
+                        # payment arrived: keep the order, flag it for staff
+                        logger.error(f"Paid order #{order.id} could not reserve its stock")
                 elif status == "failed":
                     order.status = "cancelled"
+                    release_order_stock(order)
                 order.save()
 
             log_details = {
@@ -263,6 +273,15 @@ class InitiatePaymentView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            if order_obj is not None:
+                try:
+                    ensure_stock_held(order_obj)
+                except InsufficientStock as e:
+                    return Response(
+                        {"error": str(e)},
+                        status=status.HTTP_409_CONFLICT
+                    )
+
             try:
                 gateway = PaymentGatewayManager.get_suitable_gateway(amount, gateway_name)
             except Exception as e:
@@ -0,0 +1,202 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+RESPONSE_CACHE_TIMEOUT = 60 * 15
+
+# Models whose changes invalidate each group of cached responses
+CACHE_GROUP_MODELS = {
+    'catalog': [
+        'user.Categories',
+        'user.Product',
+        'user.ProductVariant',
+        'user.ProductImage',
+        'user.CareGuide',
+        'user.Sizes',
+        'user.Colors',
+    ],
+    'services': [
+        'user.ServiceCategory',
+        'user.Service',
+        'user.ServiceFeature',
+        'user.ServiceImage',
+    ],
+    'content': [
+        'user.CompanyContact',
+        'dashboard.TermsCondition',
+    ],
+    'ads': [
+        'dashboard.CustomAd',
+    ],
+}
+
+
+def version_key(group):
+    return f"cache_version:{group}"
+
+
+def get_group_versions(groups):
+    """
+    Current version of each group. A missing counter (first use or evicted)
+    restarts from the clock so it never reuses a version seen before.
+    """
+    keys = [version_key(group) for group in groups]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(groups):
+    for group in groups:
+        try:
+            cache.incr(version_key(group))
+        except ValueError:
+            cache.set(version_key(group), time.time_ns(), timeout=None)
+
+
+def bump_cache_groups(*groups):
+    """
+    Invalidate every cached response of the given groups. The bump waits for
+    the surrounding transaction to commit, so a concurrent request cannot
+    cache the old rows under the new version.
+    """
+    transaction.on_commit(lambda: _bump(groups))
+
+
+def response_cache_key(request, groups):
+    params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    versions = get_group_versions(groups)
+    raw = f"{request.path}|{params}|{list(zip(groups, versions))}"
+    return f"response:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def cached_value(name, groups, params, builder, timeout=RESPONSE_CACHE_TIMEOUT):
+    """
+    Return `builder()` cached under `name`, the already normalized `params`
+    and the current versions of `groups`. A callable `timeout` is called
+    after building, for values whose lifetime is only known then.
+    """
+    versions = get_group_versions(groups)
+    raw = f"{params}|{list(zip(groups, versions))}"
+    key = f"{name}:{hashlib.md5(raw.encode()).hexdigest()}"
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, timeout() if callable(timeout) else timeout)
+    return value
+
+
+def fragment_key(name, obj, representation, versions):
+    stamp = obj.updated_at.isoformat() if obj.updated_at else ''
+    return f"fragment:{name}:{obj.uuid}:{stamp}:{representation}:{'.'.join(map(str, versions))}"
+
+
+def cached_fragments(name, objects, representation, render, groups, timeout=RESPONSE_CACHE_TIMEOUT):
+    """
+    `{pk: data}` of serialized fragments for `objects`, cached per object
+    uuid, updated_at, `representation` and the versions of `groups`. Hits
+    are read with one get_many; misses are rendered together by
+    `render(list_of_objects)` and stored with one set_many.
+    """
+    versions = get_group_versions(groups)
+    keys = {obj.pk: fragment_key(name, obj, representation, versions) for obj in objects}
+    cached = cache.get_many(list(keys.values()))
+    fragments = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [obj for obj in objects if obj.pk not in fragments]
+    if missing:
+        rendered = dict(zip([obj.pk for obj in missing], render(missing)))
+        cache.set_many({keys[pk]: data for pk, data in rendered.items()}, timeout)
+        fragments.update(rendered)
+    return fragments
+
+
+def cached_response(*groups, timeout=RESPONSE_CACHE_TIMEOUT):
+    """
+    Cache the data of successful GET responses per path, query params and
+    group versions. Use on APIView methods whose output only depends on the
+    models listed in CACHE_GROUP_MODELS for `groups`.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = response_cache_key(request, groups)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data, status=status.HTTP_200_OK)
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def source_freshness(source, request):
+    """
+    (row count, latest updated_at, id checksum) of a model's table or of the
+    queryset returned by a `source(request)` callable. One aggregate query.
+    """
+    if isinstance(source, type) and issubclass(source, models.Model):
+        queryset = source._base_manager.all()
+    else:
+        queryset = source(request)
+    return queryset.aggregate(count=Count('id'), modified=Max('updated_at'), checksum=Sum('id'))
+
+
+def get_validators(request, sources):
+    """ETag and Last-Modified timestamp of a response built from `sources`."""
+    stats = [source_freshness(source, request) for source in sources]
+    params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    raw = f"{request.path}|{params}|" + "|".join(
+        f"{row['count']}:{row['modified'].isoformat() if row['modified'] else ''}:{row['checksum']}"
+        for row in stats
+    )
+    modified = [row['modified'] for row in stats if row['modified']]
+    last_modified = int(max(modified).timestamp()) if modified else None
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest()), last_modified
+
+
+def conditional_get(*sources, groups, timeout=RESPONSE_CACHE_TIMEOUT):
+    """
+    Answer `If-None-Match` / `If-Modified-Since` with a 304 before the view
+    runs, so unchanged payloads are never queried or serialized. `sources`
+    are the models (or callables returning querysets) the response is built
+    from; any insert, update or delete in them changes the validators.
+    The validators are cached under the versions of `groups`, which must be
+    bumped by every change to `sources`, so the aggregates only run again
+    after a bump (or `timeout`, which may be callable as in `cached_value`).
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+            etag, last_modified = cached_value(
+                'validators', groups, f"{request.path}|{params}",
+                lambda: get_validators(request, sources), timeout=timeout,
+            )
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+
+            if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+                response['ETag'] = etag
+                if last_modified:
+                    response['Last-Modified'] = http_date(last_modified)
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,234 @@
+"""
+Cart totals, stored on the Cart row so reads never recompute them.
+
+`recalculate_cart_totals` prices any number of carts with one aggregate
+query over their items joined to the variants' stored effective price.
+Call it after changing items, quantities or the coupon; variant price and
+coupon edits trigger it themselves.
+"""
+import uuid
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Cart, CartItem, ProductVariant
+from .pricing import coupon_discount_paise, to_paise, to_rupees
+
+
+CART_TOTAL_FIELDS = ['subtotal', 'discount', 'total']
+CART_OPERATIONS = ('add', 'update', 'remove')
+
+
+class CartVersionConflict(Exception):
+    def __init__(self, version):
+        self.version = version
+        super().__init__("The cart has changed since it was loaded.")
+
+
+class InvalidCartOperations(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("Some cart operations are invalid.")
+
+
+def recalculate_cart_totals(cart_ids):
+    """
+    Recompute and store subtotal, coupon discount and total of the carts in
+    `cart_ids`. Only carts whose totals changed are written. Returns
+    {cart_id: (subtotal, discount, total)}.
+    """
+    cart_ids = list(cart_ids)
+    if not cart_ids:
+        return {}
+
+    carts = Cart.objects.filter(id__in=cart_ids).select_related('coupon').annotate(
+        items_subtotal=Coalesce(
+            Sum(F('items__quantity') * F('items__variant__effective_price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+    )
+    totals, changed = {}, []
+    for cart in carts:
+        subtotal = to_paise(cart.items_subtotal)
+        discount = coupon_discount_paise(subtotal, cart.coupon)
+        totals[cart.id] = (to_rupees(subtotal), to_rupees(discount), to_rupees(subtotal - discount))
+        if (cart.subtotal, cart.discount, cart.total) != totals[cart.id]:
+            cart.subtotal, cart.discount, cart.total = totals[cart.id]
+            changed.append(cart)
+    Cart.objects.bulk_update(changed, CART_TOTAL_FIELDS, batch_size=500)
+    return totals
+
+
+def recalculate_carts_for_variants(variant_ids):
+    """Recompute the totals of every cart holding one of `variant_ids`."""
+    cart_ids = CartItem.objects.filter(variant_id__in=variant_ids).values_list('cart_id', flat=True).distinct()
+    return recalculate_cart_totals(cart_ids)
+
+
+def parse_cart_lines(items):
+    """
+    Split `[{"variantUuid", "quantity"}]` into {variant_id: quantity} of the
+    valid lines (the last one wins for repeated variants) and a list of
+    rejected lines with the reason, resolving all UUIDs in one query.
+    """
+    rejected, wanted = [], {}
+    for item in items:
+        variant_uuid = item.get('variantUuid') if isinstance(item, dict) else None
+        quantity = item.get('quantity') if isinstance(item, dict) else None
+        try:
+            key = uuid.UUID(str(variant_uuid))
+        except ValueError:
+            rejected.append({'variantUuid': variant_uuid, 'error': "Invalid variant UUID."})
+            continue
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            rejected.append({'variantUuid': variant_uuid, 'error': "Quantity must be a whole number of at least 1."})
+            continue
+        wanted[key] = (variant_uuid, quantity)
+
+    variant_ids = dict(ProductVariant.objects.filter(uuid__in=wanted).values_list('uuid', 'id'))
+    lines = {}
+    for key, (variant_uuid, quantity) in wanted.items():
+        if key in variant_ids:
+            lines[variant_ids[key]] = quantity
+        else:
+            rejected.append({'variantUuid': variant_uuid, 'error': "Product Variant not found."})
+    return lines, rejected
+
+
+def save_cart_lines(cart, quantities, existing):
+    """
+    Write {variant_id: quantity} over the `existing` {variant_id: CartItem}
+    of `cart` with one bulk_create and one bulk_update. Returns the new and
+    the changed items.
+    """
+    now = timezone.now()
+    new, changed = [], []
+    for variant_id, quantity in quantities.items():
+        item = existing.get(variant_id)
+        if item is None:
+            new.append(CartItem(cart=cart, variant_id=variant_id, quantity=quantity))
+        elif item.quantity != quantity:
+            item.quantity = quantity
+            item.updated_at = now
+            changed.append(item)
+    CartItem.objects.bulk_create(new)
+    CartItem.objects.bulk_update(changed, ['quantity', 'updated_at'])
+    return new, changed
+
+
+def sync_cart(cart, items):
+    """
+    Replace the lines of `cart` with `items` as a set: one query resolves
+    the variants, then the difference with the stored lines is applied
+    with one bulk_create, one bulk_update and one delete in a transaction.
+    Returns the rejected lines.
+    """
+    lines, rejected = parse_cart_lines(items)
+    with transaction.atomic():
+        # the cart row lock serializes syncs and other writes to this cart
+        Cart.objects.select_for_update().only('pk').get(pk=cart.pk)
+        existing = {item.variant_id: item for item in CartItem.objects.filter(cart=cart, variant_id__in=lines)}
+        save_cart_lines(cart, lines, existing)
+        CartItem.objects.filter(cart=cart).exclude(variant_id__in=lines).delete()
+        cart.lines_changed()
+    return rejected
+
+
+def merge_cart_lines(cart, lines):
+    """
+    Add {variant_id: quantity} (a guest cart) to the lines of `cart` in one
+    set-based write: quantities of variants already in the cart are summed.
+    Lines without a positive quantity are dropped.
+    """
+    lines = {variant_id: quantity for variant_id, quantity in lines.items() if quantity > 0}
+    with transaction.atomic():
+        Cart.objects.select_for_update().only('pk').get(pk=cart.pk)
+        existing = {item.variant_id: item for item in CartItem.objects.filter(cart=cart, variant_id__in=lines)}
+        # variants deleted while the guest cart sat in the cache are dropped
+        live = set(ProductVariant.objects.filter(id__in=lines).values_list('id', flat=True))
+        quantities = {
+            variant_id: quantity + (existing[variant_id].quantity if variant_id in existing else 0)
+            for variant_id, quantity in lines.items() if variant_id in live
+        }
+        save_cart_lines(cart, quantities, existing)
+        cart.lines_changed()
+
+
+def parse_cart_operations(operations):
+    """
+    Validate `[{"op", "variantUuid", "quantity"}]` and resolve the variants
+    in one query. Returns [(op, variant_id, variant_uuid, quantity)] or raises
+    InvalidCartOperations listing every bad operation by index.
+    """
+    errors, parsed = [], []
+    for index, operation in enumerate(operations):
+        operation = operation if isinstance(operation, dict) else {}
+        op = operation.get('op')
+        quantity = 1 if op == 'remove' else operation.get('quantity', 1 if op == 'add' else None)
+        try:
+            key = uuid.UUID(str(operation.get('variantUuid')))
+        except ValueError:
+            errors.append({'index': index, 'error': "Invalid variant UUID."})
+            continue
+        if op not in CART_OPERATIONS:
+            errors.append({'index': index, 'error': f"op must be one of {', '.join(CART_OPERATIONS)}."})
+        elif not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            errors.append({'index': index, 'error': "Quantity must be a whole number of at least 1."})
+        else:
+            parsed.append((index, op, key, quantity))
+
+    variant_ids = dict(ProductVariant.objects.filter(uuid__in={key for _, _, key, _ in parsed}).values_list('uuid', 'id'))
+    for index, _, key, _ in parsed:
+        if key not in variant_ids:
+            errors.append({'index': index, 'error': "Product Variant not found."})
+    if errors:
+        raise InvalidCartOperations(sorted(errors, key=lambda error: error['index']))
+    return [(op, variant_ids[key], key, quantity) for _, op, key, quantity in parsed]
+
+
+def fold_cart_operations(quantities, operations):
+    """Apply parsed operations in order to {variant_id: quantity}; returns the new mapping."""
+    quantities = dict(quantities)
+    for op, variant_id, _, quantity in operations:
+        if op == 'add':
+            quantities[variant_id] = quantities.get(variant_id, 0) + quantity
+        elif op == 'update':
+            quantities[variant_id] = quantity
+        else:
+            quantities.pop(variant_id, None)
+    return quantities
+
+
+def apply_cart_operations(cart, version, operations):
+    """
+    Apply add/update/remove `operations` to `cart` atomically, provided it
+    is still at `version` (CartVersionConflict otherwise). Returns the
+    added or changed CartItems, with their variants, and the UUIDs of the
+    variants whose lines were removed.
+    """
+    operations = parse_cart_operations(operations)
+    with transaction.atomic():
+        current = Cart.objects.select_for_update().values_list('version', flat=True).get(pk=cart.pk)
+        if current != version:
+            raise CartVersionConflict(current)
+
+        variant_uuids = {variant_id: variant_uuid for _, variant_id, variant_uuid, _ in operations}
+        existing = {item.variant_id: item for item in CartItem.objects.filter(cart=cart, variant_id__in=variant_uuids)}
+        quantities = fold_cart_operations(
+            {variant_id: item.quantity for variant_id, item in existing.items()}, operations
+        )
+        removed = [variant_id for variant_id in existing if variant_id not in quantities]
+        new, changed = save_cart_lines(cart, quantities, existing)
+        CartItem.objects.filter(cart=cart, variant_id__in=removed).delete()
+
+        cart.version = current + 1
+        Cart.objects.filter(pk=cart.pk).update(version=cart.version)
+        cart.recalculate_totals()
+
+    touched = [item.variant_id for item in (*new, *changed)]
+    lines = CartItem.objects.filter(cart=cart, variant_id__in=touched).select_related('variant') if touched else []
+    return list(lines), [variant_uuids[variant_id] for variant_id in removed]
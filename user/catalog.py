@@ -0,0 +1,84 @@
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import CatalogEntry, ProductImage, ProductVariant
+
+
+CATALOG_CHUNK_SIZE = 500
+
+CATALOG_ENTRY_FIELDS = [
+    'name',
+    'price',
+    'original_price',
+    'offer_percentage',
+    'image',
+    'category',
+    'category_name',
+    'size',
+    'size_name',
+    'stock',
+    'is_featured_collection',
+    'is_bestseller',
+    'active_status',
+    'updated_at',
+]
+
+
+def build_catalog_entry(variant):
+    """Build an unsaved CatalogEntry for a variant loaded with its relations."""
+    product = variant.product
+    category = product.category
+    images = list(variant.images.all())
+
+    return CatalogEntry(
+        uuid=variant.uuid,
+        variant=variant,
+        name=f"{product.name} {variant.variant}",
+        price=variant.effective_price,
+        original_price=variant.price,
+        offer_percentage=variant.offer_percentage,
+        image=images[0].image.name if images else None,
+        category=category,
+        category_name=category.category_name if category else '',
+        size=variant.size,
+        size_name=variant.size.size if variant.size else '',
+        stock=variant.stock,
+        is_featured_collection=variant.is_featured_collection,
+        is_bestseller=variant.is_bestseller,
+        active_status=variant.active_status,
+        updated_at=timezone.now(),
+    )
+
+
+def refresh_catalog_entries(variant_ids):
+    """
+    Upsert the catalog rows of the given variants in a fixed number of
+    queries. Deleted variants lose their row through the CASCADE.
+    """
+    variant_ids = list(set(variant_ids))
+    for start in range(0, len(variant_ids), CATALOG_CHUNK_SIZE):
+        chunk = variant_ids[start:start + CATALOG_CHUNK_SIZE]
+        variants = (
+            ProductVariant.objects
+            .filter(id__in=chunk)
+            .select_related('product__category', 'size')
+            .prefetch_related(Prefetch('images', queryset=ProductImage.objects.order_by('order_by', 'id')))
+        )
+        entries = [build_catalog_entry(variant) for variant in variants]
+        if entries:
+            CatalogEntry.objects.bulk_create(
+                entries,
+                update_conflicts=True,
+                unique_fields=['variant'],
+                update_fields=CATALOG_ENTRY_FIELDS,
+            )
+
+
+def refresh_catalog_entries_for(queryset):
+    """Refresh the catalog rows of every variant in a ProductVariant queryset."""
+    refresh_catalog_entries(queryset.values_list('id', flat=True))
+
+
+def rebuild_catalog():
+    refresh_catalog_entries_for(ProductVariant.objects.all())
+    return CatalogEntry.objects.count()
@@ -0,0 +1,92 @@
+"""
+Coupon validation and redemption.
+
+A code is looked up and checked in one query on the (code, active,
+valid_from, valid_to) index, with the user's redemption count attached.
+Redeeming counts the use against the coupon and the user with conditional
+F() updates, so a limit can never be exceeded and no row stays locked for
+longer than the checkout transaction.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Coupon, CouponRedemption
+from .pricing import to_paise, to_rupees
+
+
+class CouponError(Exception):
+    pass
+
+
+def find_coupon(code, user, now=None):
+    """
+    The live coupon for `code`, annotated with `user_uses`, or None. Codes
+    outside their validity window, deactivated or deleted are not found.
+    """
+    now = now or timezone.now()
+    user_uses = CouponRedemption.objects.filter(coupon=OuterRef('pk'), user=user).values('times_used')[:1]
+    return Coupon.objects.filter(
+        code=(code or '').strip(),
+        active=True,
+        valid_from__lte=now,
+        valid_to__gte=now,
+        active_status=True,
+    ).annotate(user_uses=Coalesce(Subquery(user_uses), Value(0))).first()
+
+
+def validate_coupon(code, user, subtotal):
+    """The coupon for `code` if `user` may use it on `subtotal`; raises CouponError otherwise."""
+    coupon = find_coupon(code, user)
+    if coupon is None:
+        raise CouponError("This coupon code is invalid or has expired.")
+    if coupon.usage_limit is not None and coupon.times_used >= coupon.usage_limit:
+        raise CouponError("This coupon has been fully redeemed.")
+    if coupon.per_user_limit is not None and coupon.user_uses >= coupon.per_user_limit:
+        raise CouponError("You have already used this coupon.")
+    if to_paise(subtotal) < to_paise(coupon.min_price):
+        shortfall = to_rupees(to_paise(coupon.min_price) - to_paise(subtotal))
+        raise CouponError(f"Add items worth {shortfall} more to use this coupon.")
+    return coupon
+
+
+def apply_coupon(cart, code):
+    coupon = validate_coupon(code, cart.user, cart.subtotal)
+    cart.coupon = coupon
+    cart.save(update_fields=['coupon', 'updated_at'])
+    cart.recalculate_totals()
+    return coupon
+
+
+def remove_coupon(cart):
+    cart.coupon = None
+    cart.save(update_fields=['coupon', 'updated_at'])
+    cart.recalculate_totals()
+
+
+def redeem_coupon(coupon, user):
+    """
+    Count one use of `coupon` by `user`, inside the order's transaction.
+    Both counters move with a single conditional UPDATE each; CouponError
+    (rolling the order back) when either limit has been reached.
+    """
+    with transaction.atomic():
+        within_limit = Q(usage_limit__isnull=True) | Q(times_used__lt=F('usage_limit'))
+        if not Coupon.objects.filter(within_limit, pk=coupon.pk).update(times_used=F('times_used') + 1):
+            raise CouponError("This coupon has been fully redeemed.")
+
+        redemptions = CouponRedemption.objects.filter(coupon=coupon, user=user)
+        if coupon.per_user_limit is not None:
+            redemptions = redemptions.filter(times_used__lt=coupon.per_user_limit)
+        if redemptions.update(times_used=F('times_used') + 1, updated_at=timezone.now()):
+            return
+        if coupon.per_user_limit == 0 or CouponRedemption.objects.filter(coupon=coupon, user=user).exists():
+            raise CouponError("You have already used this coupon.")
+        try:
+            with transaction.atomic():
+                CouponRedemption.objects.create(coupon=coupon, user=user, times_used=1)
+        except IntegrityError:
+            # a concurrent first redemption by the same user won the insert
+            if not redemptions.update(times_used=F('times_used') + 1, updated_at=timezone.now()):
+                raise CouponError("You have already used this coupon.")
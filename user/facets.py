@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .cache import cached_value
+from .models import CatalogEntry
+from .search import search_variants
+
+
+# Lower bounds of the price buckets; the last bucket is open ended
+PRICE_BUCKETS = [Decimal('0'), Decimal('250'), Decimal('500'), Decimal('1000'), Decimal('2500')]
+
+
+def normalize_facet_filters(params):
+    """Canonical filter set, so equivalent query strings share a cache entry."""
+    return {
+        'q': ' '.join(params.get('q', '').lower().split()),
+        'category_id': params.get('category_id') or '',
+        'sizes': sorted(set(size for size in params.getlist('size') if size)),
+        'min_price': params.get('min_price') or '',
+        'max_price': params.get('max_price') or '',
+    }
+
+
+def price_bucket():
+    whens = [
+        When(price__gte=lower, then=Value(index))
+        for index, lower in reversed(list(enumerate(PRICE_BUCKETS)))
+    ]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def compute_facets(filters):
+    """
+    Size, category and price bucket counts for a filter set, from a single
+    GROUP BY over the catalog entries. Facets are disjunctive: each facet's
+    counts ignore its own selection, so the sidebar can offer alternatives.
+    """
+    entries = CatalogEntry.objects.filter(active_status=True)
+    if filters['min_price']:
+        entries = entries.filter(price__gte=filters['min_price'])
+    if filters['max_price']:
+        entries = entries.filter(price__lte=filters['max_price'])
+    if filters['q']:
+        matches = search_variants(CatalogEntry.objects.all(), filters['q'], prefix='variant__')
+        entries = entries.filter(pk__in=matches.values('pk'))
+
+    rows = (
+        entries
+        .annotate(bucket=price_bucket())
+        .values('size_id', 'size_name', 'category_id', 'category_name', 'bucket')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+    category_id = filters['category_id']
+    sizes = set(filters['sizes'])
+    size_counts, category_counts, bucket_counts = {}, {}, {}
+    total = 0
+    for row in rows:
+        in_category = not category_id or str(row['category_id']) == category_id
+        in_sizes = not sizes or str(row['size_id']) in sizes
+
+        if in_category and row['size_id'] is not None:
+            key = (row['size_id'], row['size_name'])
+            size_counts[key] = size_counts.get(key, 0) + row['count']
+        if in_sizes and row['category_id'] is not None:
+            key = (row['category_id'], row['category_name'])
+            category_counts[key] = category_counts.get(key, 0) + row['count']
+        if in_category and in_sizes:
+            bucket_counts[row['bucket']] = bucket_counts.get(row['bucket'], 0) + row['count']
+            total += row['count']
+
+    bounds = PRICE_BUCKETS[1:] + [None]
+    return {
+        'total': total,
+        'sizes': [
+            {'id': size_id, 'name': name, 'count': count}
+            for (size_id, name), count in sorted(size_counts.items(), key=lambda item: item[0][1])
+        ],
+        'categories': [
+            {'id': category_id, 'name': name, 'count': count}
+            for (category_id, name), count in sorted(category_counts.items(), key=lambda item: item[0][1])
+        ],
+        'price_buckets': [
+            {'min': str(lower), 'max': str(upper) if upper is not None else None, 'count': bucket_counts.get(index, 0)}
+            for index, (lower, upper) in enumerate(zip(PRICE_BUCKETS, bounds))
+        ],
+    }
+
+
+def get_facets(params):
+    filters = normalize_facet_filters(params)
+    return cached_value('facets', ('catalog',), sorted(filters.items()), lambda: compute_facets(filters))
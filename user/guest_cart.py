@@ -0,0 +1,193 @@
+"""
+Guest carts for anonymous shoppers, kept in the cache backend so browsing
+without an account never writes to the database.
+
+A guest cart is one cache entry under a random id, handed to the client as
+a signed token in the X-Cart-Token header. It expires GUEST_CART_TTL after
+its last change. Once the shopper logs in, `merge_guest_cart` folds it into
+their Cart with one set-based write and drops the cache entry.
+
+The cache has no compare-and-set, so writes are serialised with
+`cache.add`, which only one caller can win: a change claims the version it
+moves the cart to, and a merge claims the cart itself.
+"""
+import uuid
+
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+
+from .carts import CartVersionConflict, fold_cart_operations, merge_cart_lines, parse_cart_operations
+from .models import Cart, CartItem, ProductVariant
+from .pricing import price_lines
+
+
+GUEST_CART_TTL = 60 * 60 * 24 * 30
+# How long a claimed version blocks other writers from the same version;
+# far longer than a request takes to read, change and store the cart
+GUEST_CART_CLAIM_TTL = 60 * 5
+CART_TOKEN_HEADER = 'X-Cart-Token'
+
+_signer = signing.Signer(salt='user.guest_cart')
+
+
+class GuestCart:
+    """
+    Lines are {variant_id: {'uuid', 'quantity', 'created_at', 'updated_at'}};
+    the line uuid stands in for CartItem.uuid in the cart endpoints.
+    """
+
+    def __init__(self, cart_id, data=None):
+        data = data or {}
+        self.id = cart_id
+        self.version = data.get('version', 0)
+        self.lines = data.get('lines', {})
+        self.created_at = data.get('created_at') or timezone.now()
+        self.updated_at = data.get('updated_at') or self.created_at
+
+    @classmethod
+    def from_token(cls, token):
+        """The cart of a correctly signed `token` (empty once expired), or None."""
+        if not token:
+            return None
+        try:
+            cart_id = _signer.unsign(token)
+        except signing.BadSignature:
+            return None
+        stored = cache.get_many([cls.cache_key(cart_id), cls.merged_key(cart_id)])
+        if cls.merged_key(cart_id) in stored:
+            # merged into an account: the token starts a new cart
+            return None
+        return cls(cart_id, stored.get(cls.cache_key(cart_id)))
+
+    @classmethod
+    def for_request(cls, request):
+        return cls.from_token(request.headers.get(CART_TOKEN_HEADER)) or cls(uuid.uuid4().hex)
+
+    @staticmethod
+    def cache_key(cart_id):
+        return f'guest-cart:{cart_id}'
+
+    @staticmethod
+    def merged_key(cart_id):
+        return f'guest-cart-merged:{cart_id}'
+
+    def version_key(self, version):
+        return f'guest-cart-version:{self.id}:{version}'
+
+    @property
+    def token(self):
+        return _signer.sign(self.id)
+
+    @property
+    def quantities(self):
+        return {variant_id: line['quantity'] for variant_id, line in self.lines.items()}
+
+    def variant_for_item(self, item_uuid):
+        for variant_id, line in self.lines.items():
+            if line['uuid'] == str(item_uuid):
+                return variant_id
+        return None
+
+    def set_quantities(self, quantities):
+        """
+        Replace the lines with {variant_id: quantity}, bump the version and
+        store the cart. Raises CartVersionConflict when another request has
+        already changed the version this cart was loaded at.
+        """
+        if not cache.add(self.version_key(self.version + 1), True, GUEST_CART_CLAIM_TTL):
+            stored = cache.get(self.cache_key(self.id)) or {}
+            raise CartVersionConflict(stored.get('version', self.version + 1))
+        now = timezone.now()
+        lines = {}
+        for variant_id, quantity in quantities.items():
+            line = self.lines.get(variant_id) or {'uuid': str(uuid.uuid4()), 'created_at': now}
+            if line.get('quantity') != quantity:
+                line = {**line, 'quantity': quantity, 'updated_at': now}
+            lines[variant_id] = line
+        self.lines = lines
+        self.version += 1
+        self.updated_at = now
+        self.save()
+
+    def save(self):
+        cache.set(self.cache_key(self.id), {
+            'version': self.version,
+            'lines': self.lines,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+        }, GUEST_CART_TTL)
+
+    def delete(self):
+        cache.delete(self.cache_key(self.id))
+
+    def line_items(self, variants, variant_ids=None):
+        """
+        Unsaved CartItems of the lines (or only those of `variant_ids`),
+        their variants taken from the `variants` queryset in one query.
+        Lines of variants deleted meanwhile are left out.
+        """
+        wanted = set(self.lines if variant_ids is None else variant_ids)
+        by_id = variants.in_bulk(list(wanted))
+        return [
+            CartItem(
+                uuid=line['uuid'],
+                variant=by_id[variant_id],
+                quantity=line['quantity'],
+                created_at=line['created_at'],
+                updated_at=line['updated_at'],
+            )
+            for variant_id, line in self.lines.items() if variant_id in by_id
+        ]
+
+    def set_totals(self, prices):
+        """Totals from {variant_id: effective price}; guests cannot apply coupons."""
+        lines = [(prices[variant_id], line['quantity']) for variant_id, line in self.lines.items() if variant_id in prices]
+        priced = price_lines([price for price, _ in lines], quantities=[quantity for _, quantity in lines])
+        self.subtotal, self.discount, self.total = priced.subtotal, priced.discount, priced.total
+
+
+def apply_guest_cart_operations(guest, version, operations):
+    """
+    `user.carts.apply_cart_operations` for a guest cart: returns unsaved
+    CartItems of the added or changed lines and the UUIDs of the variants
+    whose lines were removed, with the guest's totals set.
+    """
+    operations = parse_cart_operations(operations)
+    if guest.version != version:
+        raise CartVersionConflict(guest.version)
+
+    before = guest.quantities
+    after = fold_cart_operations(before, operations)
+    guest.set_quantities(after)
+
+    variants = ProductVariant.objects.only('id', 'uuid', 'effective_price')
+    guest.set_totals(dict(variants.filter(id__in=list(after)).values_list('id', 'effective_price')))
+    variant_uuids = {variant_id: variant_uuid for _, variant_id, variant_uuid, _ in operations}
+    touched = [variant_id for variant_id, quantity in after.items() if before.get(variant_id) != quantity]
+    removed = [variant_uuids[variant_id] for variant_id in before if variant_id not in after]
+    return guest.line_items(variants, touched), removed
+
+
+def merge_guest_cart(request, user):
+    """
+    Fold the guest cart of the request's X-Cart-Token into `user`'s Cart,
+    then drop it. Call after authenticating a login; returns the Cart, or
+    None when there was nothing to merge.
+    """
+    guest = GuestCart.from_token(request.headers.get(CART_TOKEN_HEADER))
+    if guest is None or not guest.lines:
+        return None
+    # parallel requests carrying the token may all have read the lines;
+    # only the one that claims the cart merges them
+    if not cache.add(GuestCart.merged_key(guest.id), True, GUEST_CART_TTL):
+        return None
+
+    try:
+        cart, created = Cart.objects.get_or_create(user=user)
+        merge_cart_lines(cart, guest.quantities)
+    except Exception:
+        cache.delete(GuestCart.merged_key(guest.id))
+        raise
+    guest.delete()
+    return cart
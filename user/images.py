@@ -0,0 +1,250 @@
+"""
+Fixed-width WebP/JPEG renditions of uploaded images, rendered on a bounded
+pool in the web process after the upload commits. Jobs dropped when the
+queue is full or lost on a worker restart are filled in by the
+`generate_renditions` command, which should run after deploys and on a
+schedule.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .models import ImageRendition
+
+logger = logging.getLogger(__name__)
+
+
+# Output widths; images narrower than a preset are never upscaled
+RENDITION_PRESETS = {
+    'thumb': 160,
+    'card': 480,
+    'detail': 1080,
+}
+
+RENDITION_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+# Image fields that get renditions, per model label
+RENDITION_FIELDS = {
+    'user.ProductImage': 'image',
+    'user.ServiceImage': 'image',
+    'user.Categories': 'icon',
+    'dashboard.CustomAd': 'image',
+}
+
+# settings.IMAGE_RENDITION_WORKERS: size of the background pool; 0 renders
+# inline, in the request that saved the image
+DEFAULT_RENDITION_WORKERS = 2
+
+# settings.IMAGE_RENDITION_QUEUE: most jobs queued or running on the pool per
+# process; 0 generates nothing on save and leaves it to `generate_renditions`
+DEFAULT_RENDITION_QUEUE = 20
+
+PENDING_TIMEOUT = 60 * 10
+
+_executor = None
+_slots = None
+
+
+def rendition_workers():
+    return getattr(settings, 'IMAGE_RENDITION_WORKERS', DEFAULT_RENDITION_WORKERS)
+
+
+def rendition_queue_size():
+    return getattr(settings, 'IMAGE_RENDITION_QUEUE', DEFAULT_RENDITION_QUEUE)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=rendition_workers(), thread_name_prefix='renditions')
+    return _executor
+
+
+def get_slots():
+    global _slots
+    if _slots is None:
+        _slots = threading.BoundedSemaphore(max(1, rendition_queue_size()))
+    return _slots
+
+
+def resize(image, width):
+    if image.width <= width:
+        return image.copy()
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def encode(image, fmt):
+    options = dict(RENDITION_FORMATS[fmt])
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        # JPEG has no alpha: flatten onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def render_renditions(instance, field_name):
+    """
+    Render every preset/format of `instance.<field_name>` and replace the
+    rendition rows and files of the object's previous image.
+    """
+    field = getattr(instance, field_name)
+    content_type = ContentType.objects.get_for_model(instance)
+    existing = ImageRendition.objects.filter(
+        content_type=content_type, object_id=instance.pk, field_name=field_name
+    )
+    if not field:
+        for rendition in existing:
+            rendition.delete()
+        return []
+
+    with field.open('rb') as handle:
+        original = ImageOps.exif_transpose(Image.open(handle))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+
+    stem = os.path.splitext(os.path.basename(field.name))[0]
+    renditions = []
+    for preset, width in RENDITION_PRESETS.items():
+        resized = resize(original, width)
+        for fmt in RENDITION_FORMATS:
+            rendition = ImageRendition(
+                content_type=content_type,
+                object_id=instance.pk,
+                field_name=field_name,
+                source=field.name,
+                preset=preset,
+                format=fmt,
+                width=resized.width,
+                height=resized.height,
+            )
+            extension = 'jpg' if fmt == 'jpeg' else fmt
+            rendition.file.save(f"{stem}-{preset}.{extension}", ContentFile(encode(resized, fmt)), save=False)
+            renditions.append(rendition)
+
+    with transaction.atomic():
+        for rendition in existing:
+            rendition.delete()
+        ImageRendition.objects.bulk_create(renditions)
+    return renditions
+
+
+def _render_job(model, pk, field_name, slot=None):
+    from .cache import CACHE_GROUP_MODELS, bump_cache_groups
+
+    try:
+        instance = model._default_manager.filter(pk=pk).first()
+        if instance is not None:
+            render_renditions(instance, field_name)
+            label = model._meta.label
+            bump_cache_groups(*[group for group, labels in CACHE_GROUP_MODELS.items() if label in labels])
+    except Exception:
+        logger.exception("Rendition failed for %s #%s", model._meta.label, pk)
+    finally:
+        cache.delete(pending_key(model, pk, field_name))
+        if slot is not None:
+            slot.release()
+            close_old_connections()
+
+
+def pending_key(model, pk, field_name):
+    return f"rendition_pending:{model._meta.label}:{pk}:{field_name}"
+
+
+def schedule_renditions(instance, field_name):
+    """
+    Queue rendition generation once the saving transaction commits. Repeated
+    calls while a job is pending are ignored; when the queue is full the job
+    is dropped for a later request or `generate_renditions` to pick up.
+    """
+    model, pk = type(instance), instance.pk
+    if not rendition_queue_size():
+        return
+    if not cache.add(pending_key(model, pk, field_name), True, PENDING_TIMEOUT):
+        return
+
+    def submit():
+        if not rendition_workers():
+            _render_job(model, pk, field_name)
+            return
+        slot = get_slots()
+        if not slot.acquire(blocking=False):
+            cache.delete(pending_key(model, pk, field_name))
+            logger.warning("Rendition queue full, skipped %s #%s", model._meta.label, pk)
+            return
+        try:
+            get_executor().submit(_render_job, model, pk, field_name, slot)
+        except Exception:
+            slot.release()
+            cache.delete(pending_key(model, pk, field_name))
+            raise
+
+    transaction.on_commit(submit)
+
+
+def rendition_srcset(instance, field_name):
+    """
+    `{format: "url 160w, url 480w, ..."}` for the object's current image,
+    read from the (ideally prefetched) `renditions` relation. Images without
+    up-to-date renditions are queued and return an empty map meanwhile.
+    """
+    field = getattr(instance, field_name)
+    if not field:
+        return {}
+
+    current = [
+        rendition for rendition in instance.renditions.all()
+        if rendition.field_name == field_name and rendition.source == field.name
+    ]
+    if not current:
+        schedule_renditions(instance, field_name)
+        return {}
+
+    srcset, seen = {}, set()
+    for rendition in sorted(current, key=lambda r: r.width):
+        # small originals are not upscaled, so presets can share a width
+        if (rendition.format, rendition.width) in seen:
+            continue
+        seen.add((rendition.format, rendition.width))
+        srcset.setdefault(rendition.format, []).append(f"{rendition.file.url} {rendition.width}w")
+    return {fmt: ", ".join(entries) for fmt, entries in srcset.items()}
+
+
+def get_rendition_url(instance, field_name, preset, fmt='jpeg'):
+    """URL of one up-to-date rendition, or None if it is not generated yet."""
+    source = getattr(instance, field_name).name
+    for rendition in instance.renditions.all():
+        if rendition.source != source or rendition.field_name != field_name:
+            continue
+        if rendition.preset == preset and rendition.format == fmt:
+            return rendition.file.url
+    return None
+
+
+def needs_renditions(instance, field_name):
+    field = getattr(instance, field_name)
+    if not field:
+        return False
+    return not ImageRendition.objects.filter(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk,
+        field_name=field_name,
+        source=field.name,
+    ).exists()
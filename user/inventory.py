@@ -0,0 +1,103 @@
+"""
+Stock movement ledger.
+
+`ProductVariant.stock` stays the current level and is read directly; every
+change to it is also written to `StockMovement`, in bulk and in the same
+transaction. `StockSnapshot` rolls the ledger forward periodically, so
+reconciling ledger against stock sums only the movements since.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ProductVariant, StockMovement, StockSnapshot
+
+
+SNAPSHOT_BATCH_SIZE = 2000
+# Movement ids are taken before their transaction commits; snapshots stop
+# this far behind so a slow transaction cannot commit below the snapshot
+SNAPSHOT_LAG = timedelta(minutes=5)
+
+
+def record_movements(changes, reason, order=None):
+    """Write one movement per `{variant_id: signed quantity}`, skipping zeros."""
+    StockMovement.objects.bulk_create([
+        StockMovement(variant_id=variant_id, quantity=quantity, reason=reason, order=order)
+        for variant_id, quantity in sorted(changes.items()) if quantity
+    ])
+
+
+def ledger_levels(up_to=None):
+    """
+    Variants annotated with `ledger_stock`: their snapshot plus every
+    movement after it (up to movement id `up_to`), in one grouped query.
+    """
+    after_snapshot = Q(stock_movements__id__gt=Coalesce(F('stock_snapshot__last_movement_id'), Value(0)))
+    if up_to is not None:
+        after_snapshot &= Q(stock_movements__id__lte=up_to)
+    return ProductVariant.objects.annotate(
+        ledger_stock=Coalesce(F('stock_snapshot__stock'), Value(0))
+        + Coalesce(Sum('stock_movements__quantity', filter=after_snapshot), Value(0))
+    )
+
+
+def record_opening_balances():
+    """
+    Give every variant without an opening balance one: its stock less what
+    its ledger (snapshot plus movements) already holds, so variants created
+    before the ledger existed reconcile even when sales or edits were
+    ledgered before this ran. Zero balances are written too, which marks
+    the variant as opened. Returns the count.
+    """
+    opened = StockMovement.objects.filter(reason='opening').values('variant_id')
+    rows = ledger_levels().exclude(id__in=opened).values_list('id', 'stock', 'ledger_stock')
+    openings = [
+        StockMovement(variant_id=variant_id, quantity=stock - ledger_stock, reason='opening')
+        for variant_id, stock, ledger_stock in rows
+    ]
+    StockMovement.objects.bulk_create(openings, batch_size=SNAPSHOT_BATCH_SIZE)
+    return len(openings)
+
+
+def take_snapshots(now=None, batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Roll every variant's snapshot forward to the last movement older than
+    SNAPSHOT_LAG. Later movements are left for the next run, so writes
+    during the pass are neither lost nor counted twice. Returns the number
+    of snapshots written.
+    """
+    now = now or timezone.now()
+    last_id = StockMovement.objects.filter(created_at__lt=now - SNAPSHOT_LAG).aggregate(last=Max('id'))['last']
+    if last_id is None:
+        return 0
+
+    written = 0
+    batch = []
+    rows = ledger_levels(up_to=last_id).values_list('id', 'ledger_stock').order_by('id')
+    for variant_id, stock in rows.iterator(chunk_size=batch_size):
+        batch.append(StockSnapshot(variant_id=variant_id, stock=stock, last_movement_id=last_id))
+        if len(batch) >= batch_size:
+            written += save_snapshots(batch)
+            batch = []
+    return written + save_snapshots(batch)
+
+
+def save_snapshots(snapshots):
+    with transaction.atomic():
+        StockSnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=['variant'],
+            update_fields=['stock', 'last_movement_id', 'updated_at'],
+        )
+    return len(snapshots)
+
+
+def reconcile_stock():
+    """(variant_id, stock, ledger_stock) of every variant whose ledger disagrees with its stock."""
+    return list(
+        ledger_levels().exclude(ledger_stock=F('stock')).order_by('id').values_list('id', 'stock', 'ledger_stock')
+    )
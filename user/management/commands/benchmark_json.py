@@ -0,0 +1,72 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from authentication.models import Profile
+from leafin_backend.fastjson import ORJSONRenderer
+from user.models import Order
+from user.views import MyOrdersAPIView, ProductListAPIView
+
+
+RENDERERS = (
+    ('stdlib', JSONRenderer),
+    ('orjson', ORJSONRenderer),
+)
+
+
+class Command(BaseCommand):
+    help = "Compare JSON render time of the stdlib and orjson renderers on product list and order history payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200, help="Renders timed per payload and renderer.")
+        parser.add_argument('--page-size', type=int, default=100, help="Page size of both payloads.")
+        parser.add_argument('--user', help="Email of the customer whose orders are rendered (default: most orders).")
+
+    def get_payloads(self, page_size, email):
+        factory = APIRequestFactory()
+        params = {'page_size': page_size}
+
+        request = factory.get(reverse('product-variants'), params)
+        payloads = [('ProductListAPIView', ProductListAPIView.as_view()(request).data)]
+
+        user = self.get_user(email)
+        if user is not None:
+            request = factory.get(reverse('my-orders'), params)
+            force_authenticate(request, user=user)
+            payloads.append(('MyOrdersAPIView', MyOrdersAPIView.as_view()(request).data))
+        return payloads
+
+    def get_user(self, email):
+        if email:
+            user = Profile.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f"No user with email {email}.")
+            return user
+        top = Order.objects.values('user_id').annotate(orders=Count('id')).order_by('-orders').first()
+        return Profile.objects.get(pk=top['user_id']) if top else None
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        for name, data in self.get_payloads(options['page_size'], options['user']):
+            outputs = {}
+            timings = {}
+            for label, renderer_class in RENDERERS:
+                renderer = renderer_class()
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    output = renderer.render(data)
+                timings[label] = (time.perf_counter() - start) / repeat
+                outputs[label] = output
+
+            same = json.loads(outputs['stdlib']) == json.loads(outputs['orjson'])
+            self.stdout.write(
+                f"{name}: {len(outputs['stdlib'])} bytes, "
+                f"stdlib {timings['stdlib'] * 1000:.3f} ms, orjson {timings['orjson'] * 1000:.3f} ms "
+                f"({timings['stdlib'] / timings['orjson']:.1f}x), identical: {'yes' if same else 'NO'}"
+            )
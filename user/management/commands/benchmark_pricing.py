@@ -0,0 +1,66 @@
+import random
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.management.base import BaseCommand
+
+from user.models import OrderItem
+from user.pricing import price_lines
+
+
+def decimal_line_price(price, offer_type, offer):
+    """Row-at-a-time Decimal pricing, as variants were priced before user.pricing."""
+    offer = Decimal(str(offer or 0)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    if offer_type == 'percentage':
+        unit = price * (Decimal('1') - min(max(offer, Decimal('0')), Decimal('100')) / Decimal('100'))
+    elif offer_type == 'amount':
+        unit = max(price - offer, Decimal('0'))
+    else:
+        unit = price
+    return unit.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+class Command(BaseCommand):
+    help = "Time pricing an order export row by row with Decimal against the batched user.pricing engine."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=10000, help="Lines in the export.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs timed per implementation.")
+
+    def get_lines(self, count):
+        rows = list(
+            OrderItem.objects.values_list('variant__price', 'variant__offer_type', 'variant__offer', 'quantity')[:count]
+        )
+        if not rows:
+            # no orders yet: a reproducible synthetic export over a 500-variant catalog
+            rng = random.Random(0)
+            catalog = [
+                (Decimal(rng.randint(1000, 500000)).scaleb(-2), rng.choice([None, 'percentage', 'amount']), round(rng.uniform(0, 60), 2))
+                for _ in range(500)
+            ]
+            rows = [(*rng.choice(catalog), rng.randint(1, 5)) for _ in range(count)]
+        return [rows[index % len(rows)] for index in range(count)]
+
+    def handle(self, *args, **options):
+        lines = self.get_lines(options['lines'])
+        prices, offer_types, offers, quantities = (list(column) for column in zip(*lines))
+        repeat = options['repeat']
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decimal_total = sum(
+                (decimal_line_price(price, offer_type, offer) * quantity for price, offer_type, offer, quantity in lines),
+                Decimal('0.00'),
+            )
+        decimal_time = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            engine_total = price_lines(prices, offer_types, offers, quantities).total
+        engine_time = (time.perf_counter() - start) / repeat
+
+        self.stdout.write(
+            f"{len(lines)} lines: Decimal {decimal_time * 1000:.1f} ms, engine {engine_time * 1000:.1f} ms "
+            f"({decimal_time / engine_time:.1f}x), totals {decimal_total} / {engine_total}, "
+            f"identical: {'yes' if decimal_total == engine_total else 'NO'}"
+        )
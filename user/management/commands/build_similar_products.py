@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from user.similarity import SIMILAR_TOP_N, build_similar_products
+
+
+class Command(BaseCommand):
+    help = "Rebuild the similar products table from co-purchases, co-wishlists and variant attributes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=SIMILAR_TOP_N, help="Neighbours kept per variant.")
+
+    def handle(self, *args, **options):
+        count = build_similar_products(top_n=options['top'])
+        self.stdout.write(self.style.SUCCESS(f"Similar products rebuilt: {count} links."))
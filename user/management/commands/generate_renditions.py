@@ -0,0 +1,30 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from user.images import RENDITION_FIELDS, needs_renditions, render_renditions
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate missing or outdated image renditions for every image field that has them. "
+        "Run after deploys and on a schedule: renditions queued in web workers are dropped when "
+        "the queue is full or the worker restarts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate renditions that are up to date.")
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for label, field_name in RENDITION_FIELDS.items():
+            model = apps.get_model(label)
+            for instance in model._default_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).iterator():
+                if not options['force'] and not needs_renditions(instance, field_name):
+                    continue
+                try:
+                    render_renditions(instance, field_name)
+                    generated += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{label} #{instance.pk}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Renditions generated for {generated} images ({failed} failed)."))
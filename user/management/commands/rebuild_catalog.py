@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from user.catalog import rebuild_catalog
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized storefront catalog entries from product variants."
+
+    def handle(self, *args, **options):
+        count = rebuild_catalog()
+        self.stdout.write(self.style.SUCCESS(f"Catalog rebuilt: {count} entries."))
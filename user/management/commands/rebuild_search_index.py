@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from user.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search documents from product variants."
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt: {count} documents."))
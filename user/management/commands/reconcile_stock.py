@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from user.inventory import reconcile_stock
+
+
+class Command(BaseCommand):
+    help = "Compare every variant's stock with its ledger (snapshot plus later movements) in one query and list mismatches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help="Mismatches listed (all are counted).")
+
+    def handle(self, *args, **options):
+        mismatches = reconcile_stock()
+        for variant_id, stock, ledger_stock in mismatches[:options['limit']]:
+            self.stdout.write(f"Variant {variant_id}: stock {stock}, ledger {ledger_stock} ({stock - ledger_stock:+d})")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} variants do not match their stock ledger.")
+        self.stdout.write(self.style.SUCCESS("Stock matches the ledger for every variant."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from user.carts import recalculate_cart_totals
+from user.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored subtotal, discount and total of every cart, in batches. Run once after deploying the cart total columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Carts priced per query.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id, count = 0, 0
+        while True:
+            cart_ids = list(Cart.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not cart_ids:
+                break
+            recalculate_cart_totals(cart_ids)
+            count += len(cart_ids)
+            last_id = cart_ids[-1]
+        self.stdout.write(self.style.SUCCESS(f"Cart totals refreshed: {count} carts."))
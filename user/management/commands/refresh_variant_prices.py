@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from user.models import ProductVariant
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored effective price and offer percentage of every product variant."
+
+    def handle(self, *args, **options):
+        count = ProductVariant.objects.all().refresh_prices()
+        self.stdout.write(self.style.SUCCESS(f"Prices refreshed: {count} variants."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from user.stock import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Return the stock held by unpaid orders whose hold has expired and cancel those orders. Run every few minutes."
+
+    def handle(self, *args, **options):
+        count = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f"Released {count} expired stock reservations."))
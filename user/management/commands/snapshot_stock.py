@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from user.inventory import record_opening_balances, take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Roll the stock ledger snapshots forward, ledgering the stock of untracked variants first. Run hourly or nightly."
+
+    def handle(self, *args, **options):
+        opened = record_opening_balances()
+        if opened:
+            self.stdout.write(f"Recorded opening balances for {opened} variants.")
+        count = take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} stock snapshots."))
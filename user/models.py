@@ -1,7 +1,11 @@
 from django.utils import timezone
-from decimal import ROUND_HALF_UP, Decimal
-from django.db import models
+from django.db import models, transaction
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from authentication.models import Profile, BaseModel
+from .pricing import coupon_discount_paise, price_lines, set_derived_prices, to_paise, to_rupees
 import uuid
 
 
@@ -66,9 +70,49 @@ class ShippingAddress(BaseModel):
         super().save(*args, **kwargs)
 
 
+class ImageRendition(BaseModel):
+    """
+    Resized copy of an uploaded image, generated by `user.images`. Rows are
+    keyed by the owning object, its image field, the preset and the format;
+    `source` is the original file name they were rendered from.
+    """
+    PRESET_CHOICES = [
+        ('thumb', 'Thumbnail'),
+        ('card', 'Card'),
+        ('detail', 'Detail'),
+    ]
+    FORMAT_CHOICES = [
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, verbose_name="Content Type")
+    object_id = models.PositiveBigIntegerField(verbose_name="Object ID")
+    content_object = GenericForeignKey('content_type', 'object_id')
+    field_name = models.CharField(max_length=50, verbose_name="Image Field")
+    source = models.CharField(max_length=255, verbose_name="Source Image")
+    preset = models.CharField(max_length=10, choices=PRESET_CHOICES, verbose_name="Preset")
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, verbose_name="Format")
+    width = models.PositiveIntegerField(verbose_name="Width")
+    height = models.PositiveIntegerField(verbose_name="Height")
+    file = models.ImageField(upload_to='renditions/', max_length=255, verbose_name="File")
+
+    class Meta:
+        unique_together = ('content_type', 'object_id', 'field_name', 'preset', 'format')
+        indexes = [
+            models.Index(fields=['content_type', 'object_id']),
+        ]
+        verbose_name = "Image Rendition"
+        verbose_name_plural = "Image Renditions"
+
+    def __str__(self):
+        return f"{self.source} ({self.preset}, {self.format})"
+
+
 class Categories(BaseModel):
     category_name = models.CharField(max_length=255, db_index=True, verbose_name="Category Name")
     icon = models.ImageField(upload_to='category_icons/', blank=True, null=True, verbose_name="Category Icon")
+    renditions = GenericRelation(ImageRendition)
     
     class Meta:
         indexes = [
@@ -130,6 +174,39 @@ class Product(BaseModel):
         return self.name
 
 
+PRICE_DERIVED_FIELDS = ['effective_price', 'offer_percentage']
+
+
+class ProductVariantQuerySet(models.QuerySet):
+    def refresh_prices(self):
+        """
+        Recompute the stored effective price and offer percentage of every
+        variant in the queryset, then refresh their catalog entries, the
+        totals of carts holding them and the cached responses. Returns the
+        number of variants updated.
+        """
+        from .cache import bump_cache_groups
+        from .carts import recalculate_carts_for_variants
+        from .catalog import refresh_catalog_entries
+
+        variants = list(self.only('id', 'price', 'offer_type', 'offer'))
+        set_derived_prices(variants)
+        self.model.objects.bulk_update(variants, PRICE_DERIVED_FIELDS, batch_size=500)
+
+        variant_ids = [variant.id for variant in variants]
+        refresh_catalog_entries(variant_ids)
+        recalculate_carts_for_variants(variant_ids)
+        bump_cache_groups('catalog')
+        return len(variants)
+
+    def apply_offer(self, offer_type, offer):
+        """Set the same offer on every variant of the queryset in one UPDATE."""
+        variant_ids = list(self.values_list('id', flat=True))
+        variants = self.model.objects.filter(id__in=variant_ids)
+        variants.update(offer_type=offer_type, offer=offer, updated_at=timezone.now())
+        return variants.refresh_prices()
+
+
 class ProductVariant(BaseModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants', db_index=True, verbose_name="Product")
     color = models.ForeignKey(Colors, on_delete=models.CASCADE, related_name='variant_color', null=True, blank=True, db_index=True, verbose_name="Color")
@@ -147,6 +224,11 @@ class ProductVariant(BaseModel):
     growth_rate = models.CharField(max_length=100, blank=True, null=True, verbose_name="Growth Rate")
     is_featured_collection = models.BooleanField(default=False, db_index=True, verbose_name="Is Featured Collection")
     is_bestseller = models.BooleanField(default=False, db_index=True, verbose_name="Is Bestseller")
+    # Derived from price/offer_type/offer in save() and ProductVariantQuerySet.apply_offer()
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False, verbose_name="Effective Price")
+    offer_percentage = models.DecimalField(max_digits=6, decimal_places=2, default=0, editable=False, verbose_name="Offer Percentage")
+
+    objects = ProductVariantQuerySet.as_manager()
 
     class Meta:
         indexes = [
@@ -154,21 +236,74 @@ class ProductVariant(BaseModel):
             models.Index(fields=['stock']),
             models.Index(fields=['price']),
             models.Index(fields=['offer_type', 'offer']),
+            models.Index(fields=['active_status', '-id']),
+            models.Index(fields=['active_status', 'effective_price', 'id']),
         ]
         verbose_name = "Product Variant"
         verbose_name_plural = "Product Variants"
 
     def discounted_price(self):
-        price = self.price if self.price is not None else Decimal('0.00')
-        offer = Decimal(str(self.offer)) if self.offer is not None else Decimal('0.00')
+        return price_lines([self.price or 0], [self.offer_type], [self.offer]).unit_prices()[0]
 
-        if self.offer_type == 'percentage':
-            discount = price * (Decimal('1.0') - (offer / Decimal('100')))
-            return discount.quantize(Decimal('0.01'))
-        elif self.offer_type == 'amount':
-            discounted = price - offer
-            return max(discounted, Decimal('0.00')).quantize(Decimal('0.01'))
-        return price.quantize(Decimal('0.01'))
+    def calculate_offer_percentage(self):
+        return price_lines([self.price or 0], [self.offer_type], [self.offer]).offer_percentages()[0]
+
+    def update_derived_prices(self):
+        set_derived_prices([self])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.remember_loaded()
+
+    def remember_loaded(self):
+        # stock and price as last read or written, to tell what a save changes
+        deferred = self.get_deferred_fields()
+        self._loaded = {name: getattr(self, name) for name in ('stock', 'effective_price') if name not in deferred}
+
+    def save(self, *args, **kwargs):
+        self.update_derived_prices()
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(PRICE_DERIVED_FIELDS)
+        loaded = getattr(self, '_loaded', {})
+        adding = self._state.adding or self.pk is None
+
+        if update_fields is not None:
+            saves_stock = 'stock' in update_fields
+        elif not adding and 'stock' in loaded and loaded['stock'] == self.stock:
+            # stock untouched: leave the stored level, and concurrent sales, alone
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'stock'
+            ]
+            saves_stock = False
+        else:
+            saves_stock = True
+
+        with transaction.atomic():
+            previous = None
+            if saves_stock and not adding:
+                # compare against the stored row, not the one this instance
+                # was loaded with, so concurrent sales are not lost
+                previous = ProductVariant.objects.select_for_update().filter(pk=self.pk).values('stock', 'effective_price').first()
+            super().save(*args, **kwargs)
+
+            delta = self.stock - (previous['stock'] if previous else 0)
+            if (adding or previous) and delta:
+                reason = 'opening' if previous is None else 'restock' if delta > 0 else 'adjustment'
+                StockMovement.objects.create(variant=self, quantity=delta, reason=reason)
+
+            old_price = previous['effective_price'] if previous else loaded.get('effective_price')
+            if not adding and old_price != self.effective_price:
+                from .carts import recalculate_carts_for_variants
+
+                recalculate_carts_for_variants([self.pk])
+        self.remember_loaded()
 
     def __str__(self):
         return f"{self.product.name} -   {self.size or ''}".strip()
@@ -199,6 +334,7 @@ class ProductImage(BaseModel):
     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='images', db_index=True, verbose_name="Product Variant")
     image = models.ImageField(upload_to='product_images/', verbose_name="Image")
     order_by = models.IntegerField(default=1, db_index=True, verbose_name="Display Order")
+    renditions = GenericRelation(ImageRendition)
 
     class Meta:
         indexes = [
@@ -211,6 +347,84 @@ class ProductImage(BaseModel):
         return f"Image for {self.variant}"
 
 
+class CatalogEntry(BaseModel):
+    """
+    Flat, precomputed storefront card for a variant. Rows are maintained by
+    `user.catalog.refresh_catalog_entries`; never edit them directly.
+    """
+    variant = models.OneToOneField(ProductVariant, on_delete=models.CASCADE, related_name='catalog_entry', verbose_name="Product Variant")
+    name = models.CharField(max_length=512, verbose_name="Display Name")
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Effective Price")
+    original_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Original Price")
+    offer_percentage = models.DecimalField(max_digits=6, decimal_places=2, default=0, verbose_name="Offer Percentage")
+    image = models.ImageField(upload_to='product_images/', max_length=255, blank=True, null=True, verbose_name="Primary Image")
+    category = models.ForeignKey(Categories, on_delete=models.CASCADE, related_name='catalog_entries', null=True, blank=True, verbose_name="Category")
+    category_name = models.CharField(max_length=255, blank=True, verbose_name="Category Name")
+    size = models.ForeignKey(Sizes, on_delete=models.SET_NULL, related_name='catalog_entries', null=True, blank=True, verbose_name="Size")
+    size_name = models.CharField(max_length=100, blank=True, verbose_name="Size Name")
+    stock = models.PositiveIntegerField(default=0, verbose_name="Stock Quantity")
+    is_featured_collection = models.BooleanField(default=False, verbose_name="Is Featured Collection")
+    is_bestseller = models.BooleanField(default=False, verbose_name="Is Bestseller")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['active_status', '-variant']),
+            models.Index(fields=['active_status', 'category', '-variant']),
+            models.Index(fields=['active_status', 'size', '-variant']),
+        ]
+        verbose_name = "Catalog Entry"
+        verbose_name_plural = "Catalog Entries"
+
+    def __str__(self):
+        return self.name
+
+
+class ProductSearchDocument(BaseModel):
+    """
+    Search text of a variant, maintained by `user.search.reindex_variants`.
+    On PostgreSQL `search_vector` holds the weighted tsvector of `title` (A)
+    and `body` (B); the trigram index needs the pg_trgm extension
+    (`TrigramExtension()` in the migration).
+    """
+    variant = models.OneToOneField(ProductVariant, on_delete=models.CASCADE, related_name='search_document', verbose_name="Product Variant")
+    title = models.CharField(max_length=512, verbose_name="Title")
+    body = models.TextField(blank=True, verbose_name="Body")
+    search_vector = SearchVectorField(null=True, blank=True, verbose_name="Search Vector")
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='user_search_vector_gin'),
+            GinIndex(fields=['title'], name='user_search_title_trgm', opclasses=['gin_trgm_ops']),
+        ]
+        verbose_name = "Product Search Document"
+        verbose_name_plural = "Product Search Documents"
+
+    def __str__(self):
+        return self.title
+
+
+class SimilarProduct(BaseModel):
+    """
+    Top-N neighbours of a variant, rebuilt in batch by `user.similarity`
+    (`manage.py build_similar_products`). `rank` 0 is the closest match.
+    """
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='similar_products', verbose_name="Product Variant")
+    similar = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='similar_to', verbose_name="Similar Variant")
+    score = models.FloatField(default=0.0, verbose_name="Score")
+    rank = models.PositiveSmallIntegerField(default=0, verbose_name="Rank")
+
+    class Meta:
+        unique_together = ('variant', 'similar')
+        indexes = [
+            models.Index(fields=['variant', 'rank']),
+        ]
+        verbose_name = "Similar Product"
+        verbose_name_plural = "Similar Products"
+
+    def __str__(self):
+        return f"{self.variant_id} -> {self.similar_id} ({self.rank})"
+
+
 class ServiceCategory(BaseModel):
     name = models.CharField(max_length=255, db_index=True, verbose_name="Service Category Name")
     icon = models.ImageField(upload_to='service_category_icons/', blank=True, null=True, verbose_name="Service Category Icon")
@@ -263,6 +477,7 @@ class ServiceImage(BaseModel):
     service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='images', db_index=True, verbose_name="Service")
     image = models.ImageField(upload_to='service_images/', blank=True, null=True, verbose_name="Service Image")
     order_by = models.IntegerField(default=1, db_index=True, verbose_name="Display Order")
+    renditions = GenericRelation(ImageRendition)
     
     class Meta:
         indexes = [
@@ -300,6 +515,12 @@ class ServiceBooking(BaseModel):
 class Cart(BaseModel):
     user = models.OneToOneField(Profile, on_delete=models.CASCADE, related_name='cart', db_index=True, verbose_name="User")
     coupon = models.ForeignKey('Coupon', on_delete=models.SET_NULL, null=True, blank=True, related_name='carts', db_index=True, verbose_name="Applied Coupon")
+    # Maintained by user.carts.recalculate_cart_totals whenever items, the coupon or prices change
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Subtotal")
+    discount = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Coupon Discount")
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Total")
+    # Bumped on every change to the lines; cart batches must send the version they saw
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Version")
 
     class Meta:
         indexes = [
@@ -308,14 +529,18 @@ class Cart(BaseModel):
         verbose_name = "Shopping Cart"
         verbose_name_plural = "Shopping Carts"
 
-    def total(self):
-        total = sum(item.line_total() for item in self.items.all())
-        if self.coupon:
-            if self.coupon.offer_type == 'percentage':
-                total -= total * (self.coupon.offer / 100)
-            elif self.coupon.offer_type == 'amount':
-                total -= self.coupon.offer
-        return max(total, 0)
+    def recalculate_totals(self):
+        from .carts import recalculate_cart_totals
+
+        totals = recalculate_cart_totals([self.pk]).get(self.pk)
+        if totals:
+            self.subtotal, self.discount, self.total = totals
+
+    def lines_changed(self):
+        """Bump the version after items were added, changed or removed, then recompute the totals."""
+        Cart.objects.filter(pk=self.pk).update(version=models.F('version') + 1)
+        self.refresh_from_db(fields=['version'])
+        self.recalculate_totals()
 
     def __str__(self):
         return f"Cart for {self.user.email}"
@@ -336,7 +561,7 @@ class CartItem(BaseModel):
         verbose_name_plural = "Cart Items"
 
     def line_total(self):
-        return self.variant.discounted_price() * self.quantity
+        return self.variant.effective_price * self.quantity
 
     def __str__(self):
         return f"{self.variant} x{self.quantity}"
@@ -360,22 +585,46 @@ class Wishlist(BaseModel):
 
 class Coupon(BaseModel):
     name = models.CharField(max_length=255, db_index=True, verbose_name="Coupon Name")
-    code = models.CharField(max_length=50, unique=True, db_index=True, verbose_name="Coupon Code")
-    valid_from = models.DateTimeField(db_index=True, verbose_name="Valid From")
-    valid_to = models.DateTimeField(db_index=True, verbose_name="Valid To")
-    name=models.CharField(max_length=255)
-    code = models.CharField(max_length=50, unique=True)
-    active = models.BooleanField(default=True)
-    valid_from = models.DateTimeField()
-    valid_to = models.DateTimeField()
+    code = models.CharField(max_length=50, unique=True, verbose_name="Coupon Code")
+    active = models.BooleanField(default=True, verbose_name="Active")
+    valid_from = models.DateTimeField(verbose_name="Valid From")
+    valid_to = models.DateTimeField(verbose_name="Valid To")
     offer_type=models.CharField(max_length=255,null=True,choices=[('percentage', 'Percentage'), ('amount', 'Amount')])
     offer = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     max_price=models.FloatField(default=0.0)
     min_price=models.FloatField(default=0.0)
-    
+    usage_limit = models.PositiveIntegerField(null=True, blank=True, verbose_name="Total Uses Allowed")
+    per_user_limit = models.PositiveIntegerField(null=True, blank=True, verbose_name="Uses Allowed Per User")
+    # Counted by user.coupons.redeem_coupon when an order is placed
+    times_used = models.PositiveIntegerField(default=0, editable=False, verbose_name="Times Used")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['code', 'active', 'valid_from', 'valid_to']),
+        ]
+
     def __str__(self):
         return f"{self.code} - {self.offer_type}% off"
 
+    def discount_for(self, subtotal):
+        """Discount this coupon gives on `subtotal`, capped at max_price and at the subtotal."""
+        return to_rupees(coupon_discount_paise(to_paise(subtotal), self))
+
+
+
+class CouponRedemption(BaseModel):
+    """How many times a user has redeemed a coupon; see user.coupons.redeem_coupon."""
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='redemptions', verbose_name="Coupon")
+    user = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='coupon_redemptions', verbose_name="User")
+    times_used = models.PositiveIntegerField(default=0, verbose_name="Times Used")
+
+    class Meta:
+        unique_together = ('coupon', 'user')
+        verbose_name = "Coupon Redemption"
+        verbose_name_plural = "Coupon Redemptions"
+
+    def __str__(self):
+        return f"{self.coupon.code} x{self.times_used} by {self.user.email}"
 
 
 class Order(BaseModel):
@@ -399,46 +648,27 @@ class Order(BaseModel):
     def subtotal(self):
         return sum(item.price * item.quantity for item in self.items.all())
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.user.email}"
 
     def calculate_total(self):
-        total = self.subtotal
-        discount_amount = 0
-
-        if self.coupon:
-            offer_type = self.coupon.offer_type
-            offer_value = Decimal(str(self.coupon.offer or 0))
-            min_price = Decimal(str(self.coupon.min_price or 0))
-            max_price = Decimal(str(self.coupon.max_price or 0))
-            total_decimal = Decimal(str(total))
-
-            if offer_type == 'percentage':
-                discount_amount = (total_decimal * (offer_value / Decimal('100'))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            elif offer_type == 'amount':
-                discount_amount = offer_value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-                if discount_amount > total_decimal:
-                    discount_amount = total_decimal
-            else:
-                discount_amount = Decimal('0.00')
-
-            if total_decimal < min_price:
-                discount_amount = Decimal('0.00')
-
-            if max_price and discount_amount > max_price:
-                discount_amount = max_price
-
-            total_decimal -= discount_amount
-            return total_decimal.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        return Decimal(str(total)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        lines = list(self.items.values_list('price', 'quantity'))
+        return price_lines(
+            [price for price, _ in lines], quantities=[quantity for _, quantity in lines], coupon=self.coupon
+        ).total
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
         super().save(*args, **kwargs)
 
-        if not is_new or self.items.exists():
+        # a new order has no items yet; its creator sets total_amount
+        if not is_new:
             new_total = self.calculate_total()
-            print(new_total, 'total')
             if self.total_amount != new_total:
                 self.total_amount = new_total
                 Order.objects.filter(pk=self.pk).update(total_amount=new_total)
@@ -460,6 +690,85 @@ class OrderItem(BaseModel):
 
 
 
+class StockReservation(BaseModel):
+    """
+    Stock taken from a variant for an order by `user.stock.reserve_stock`.
+    Held reservations expire unless the order is paid; released ones have
+    given their quantity back to the variant.
+    """
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations', verbose_name="Order")
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='reservations', verbose_name="Product Variant")
+    quantity = models.PositiveIntegerField(verbose_name="Quantity")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held', db_index=True, verbose_name="Status")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Hold Expires At")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+            models.Index(fields=['order', 'status']),
+        ]
+        verbose_name = "Stock Reservation"
+        verbose_name_plural = "Stock Reservations"
+
+    def __str__(self):
+        return f"{self.variant_id} x{self.quantity} for Order #{self.order_id} ({self.status})"
+
+
+class StockMovement(BaseModel):
+    """
+    Append-only ledger of `ProductVariant.stock`: one row per change, with
+    the signed quantity and why it happened. Written in bulk alongside the
+    stock update by `user.inventory.record_movements`; never updated.
+    """
+    REASON_CHOICES = [
+        ('opening', 'Opening Balance'),
+        ('sale', 'Sale'),
+        ('cancellation', 'Cancellation'),
+        ('restock', 'Restock'),
+        ('adjustment', 'Manual Adjustment'),
+        ('import', 'Catalog Import'),
+    ]
+
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='stock_movements', verbose_name="Product Variant")
+    quantity = models.IntegerField(verbose_name="Quantity Change")
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name="Reason")
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, related_name='stock_movements', null=True, blank=True, verbose_name="Order")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['variant', 'id']),
+        ]
+        verbose_name = "Stock Movement"
+        verbose_name_plural = "Stock Movements"
+
+    def __str__(self):
+        return f"{self.variant_id} {self.quantity:+d} ({self.reason})"
+
+
+class StockSnapshot(BaseModel):
+    """
+    A variant's stock according to the ledger, up to and including
+    `last_movement_id`. Rolled forward by `user.inventory.take_snapshots`,
+    so reconciling only sums the movements written since.
+    """
+    variant = models.OneToOneField(ProductVariant, on_delete=models.CASCADE, related_name='stock_snapshot', verbose_name="Product Variant")
+    stock = models.IntegerField(default=0, verbose_name="Ledger Stock")
+    last_movement_id = models.BigIntegerField(default=0, verbose_name="Last Movement")
+
+    class Meta:
+        verbose_name = "Stock Snapshot"
+        verbose_name_plural = "Stock Snapshots"
+
+    def __str__(self):
+        return f"{self.variant_id}: {self.stock} at movement {self.last_movement_id}"
+
+
 class Notification(BaseModel):
     NOTIFICATION_TYPE_CHOICES = [
         ('order_placed', 'Order Placed'),
@@ -494,6 +803,9 @@ class Notification(BaseModel):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.user}"
@@ -0,0 +1,69 @@
+"""
+Order placement from a cart as one transactional pipeline: the cart and
+its lines are locked and priced in a fixed number of queries, the order
+and all of its items are written in two inserts with the total already
+set, stock and coupon are taken, and the cart is emptied with one delete.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .coupons import redeem_coupon, validate_coupon
+from .models import Cart, Order, OrderItem
+from .pricing import price_lines
+from .stock import reserve_stock
+
+
+class EmptyCart(Exception):
+    def __init__(self):
+        super().__init__("Cart is empty.")
+
+
+def place_order(user, shipping_address, hold=False):
+    """
+    Turn `user`'s cart into an order. Stock is reserved as in
+    `user.stock.reserve_stock` (`hold=False` commits it, for cash on
+    delivery) and the cart's coupon is checked again and redeemed.
+    Raises Cart.DoesNotExist, EmptyCart, InsufficientStock or CouponError,
+    leaving cart, stock and coupon untouched.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update(of=('self',)).select_related('coupon').get(user=user)
+        # lines in variant order, the order reserve_stock locks variants in
+        items = list(
+            cart.items.select_related('variant').select_for_update(of=('self', 'variant')).order_by('variant_id')
+        )
+        if not items:
+            raise EmptyCart()
+
+        coupon = cart.coupon
+        priced = price_lines(
+            [item.variant.effective_price for item in items],
+            quantities=[item.quantity for item in items],
+            coupon=coupon,
+        )
+        if coupon:
+            validate_coupon(coupon.code, user, priced.subtotal)
+
+        order = Order.objects.create(
+            user=user,
+            shipping_address=shipping_address,
+            status='pending',
+            coupon=coupon,
+            coupon_offer=coupon.offer if coupon else 0,
+            total_amount=priced.total,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, variant_id=item.variant_id, quantity=item.quantity, price=price)
+            for item, price in zip(items, priced.unit_prices())
+        ])
+
+        reserve_stock(order, hold=hold, lines={item.variant_id: item.quantity for item in items})
+        if coupon:
+            redeem_coupon(coupon, user)
+
+        cart.items.all().delete()
+        Cart.objects.filter(pk=cart.pk).update(
+            coupon=None, subtotal=0, discount=0, total=0, version=F('version') + 1, updated_at=timezone.now()
+        )
+    return order
@@ -0,0 +1,157 @@
+"""
+Price math shared by variants, carts and orders.
+
+All lines of a call are priced together with numpy in integer paise:
+amounts are converted to int64 paise once, offers to basis points, and
+results come back as Decimal rupees. Every rounding is ROUND_HALF_UP to
+the paisa, so a variant's stored effective price, a cart total and an order
+total computed from the same inputs always agree.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+
+OFFER_CODES = {'percentage': 1, 'amount': 2}
+
+_ONE = Decimal('1')
+
+
+def to_paise(value):
+    """Rupees (Decimal, float, str or None) as an int of paise, rounded half up."""
+    if value is None:
+        return 0
+    if value.__class__ is not Decimal:
+        value = Decimal(str(value))
+    return int(value.scaleb(2).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+
+def paise_array(values, count):
+    """int64 array of `values` in paise; each distinct value is converted once."""
+    converted = {}
+
+    def convert(value):
+        paise = converted.get(value)
+        if paise is None:
+            paise = converted[value] = to_paise(value)
+        return paise
+
+    return np.fromiter(map(convert, values), dtype=np.int64, count=count)
+
+
+def to_rupees(paise):
+    return Decimal(int(paise)).scaleb(-2)
+
+
+def divide_half_up(numerator, denominator):
+    """Round-half-up integer division of non-negative int64 arrays (or ints)."""
+    return (numerator * 2 + denominator) // (denominator * 2)
+
+
+class PricedLines:
+    """
+    Result of `price_lines`. `unit_paise`, `line_paise` and
+    `offer_basis_points` are int64 arrays in line order; `subtotal_paise`,
+    `discount_paise` and `total_paise` are ints.
+    """
+
+    def __init__(self, unit_paise, offer_basis_points, quantities, coupon=None):
+        self.unit_paise = unit_paise
+        self.offer_basis_points = offer_basis_points
+        self.line_paise = unit_paise * quantities
+        self.subtotal_paise = int(self.line_paise.sum())
+        self.discount_paise = coupon_discount_paise(self.subtotal_paise, coupon)
+        self.total_paise = self.subtotal_paise - self.discount_paise
+
+    def unit_prices(self):
+        return [to_rupees(value) for value in self.unit_paise.tolist()]
+
+    def line_totals(self):
+        return [to_rupees(value) for value in self.line_paise.tolist()]
+
+    def offer_percentages(self):
+        return [to_rupees(value) for value in self.offer_basis_points.tolist()]
+
+    @property
+    def subtotal(self):
+        return to_rupees(self.subtotal_paise)
+
+    @property
+    def discount(self):
+        return to_rupees(self.discount_paise)
+
+    @property
+    def total(self):
+        return to_rupees(self.total_paise)
+
+
+def coupon_discount_paise(subtotal_paise, coupon):
+    """
+    Discount `coupon` gives on a subtotal: a percentage or a fixed amount,
+    nothing below min_price, at most max_price (when set) and the subtotal.
+    """
+    if coupon is None or subtotal_paise <= 0:
+        return 0
+    if subtotal_paise < to_paise(coupon.min_price):
+        return 0
+
+    kind = OFFER_CODES.get(coupon.offer_type)
+    if kind == OFFER_CODES['percentage']:
+        discount = divide_half_up(subtotal_paise * to_paise(coupon.offer), 10000)
+    elif kind == OFFER_CODES['amount']:
+        discount = to_paise(coupon.offer)
+    else:
+        discount = 0
+
+    max_paise = to_paise(coupon.max_price)
+    if max_paise and discount > max_paise:
+        discount = max_paise
+    return min(discount, subtotal_paise)
+
+
+def price_lines(prices, offer_types=None, offers=None, quantities=None, coupon=None):
+    """
+    Price N lines in one pass. `prices` are list prices; `offer_types`
+    ('percentage', 'amount' or None) and `offers` are the per-line offers
+    (omit both for lines already at their net price); `quantities` default
+    to 1. `coupon` applies to the subtotal of all lines.
+    """
+    count = len(prices)
+    price = paise_array(prices, count)
+    quantity = (
+        np.ones(count, dtype=np.int64) if quantities is None
+        else np.fromiter((int(value) for value in quantities), dtype=np.int64, count=count)
+    )
+    if offer_types is None:
+        unit = price
+        basis_points = np.zeros(count, dtype=np.int64)
+    else:
+        kind = np.fromiter((OFFER_CODES.get(value, 0) for value in offer_types), dtype=np.int8, count=count)
+        # offers are hundredths of a percent or paise: both are x100 integers
+        offer = paise_array(offers, count)
+        percentage = kind == OFFER_CODES['percentage']
+        amount = kind == OFFER_CODES['amount']
+
+        kept = 10000 - np.clip(offer, 0, 10000)
+        unit = np.where(percentage, divide_half_up(price * kept, 10000), price)
+        unit = np.where(amount, np.maximum(price - offer, 0), unit)
+
+        has_offer = (offer != 0) & (price != 0)
+        basis_points = np.where(percentage & has_offer, offer, 0)
+        # an amount above the price takes at most all of it, as for the unit price
+        amount_share = divide_half_up(np.clip(offer, 0, price) * 10000, np.where(price != 0, price, 1))
+        basis_points = np.where(amount & has_offer, amount_share, basis_points)
+
+    return PricedLines(unit, basis_points, quantity, coupon)
+
+
+def set_derived_prices(variants):
+    """Set effective_price and offer_percentage of ProductVariant instances in one pass."""
+    priced = price_lines(
+        [variant.price for variant in variants],
+        [variant.offer_type for variant in variants],
+        [variant.offer for variant in variants],
+    )
+    for variant, unit, percentage in zip(variants, priced.unit_prices(), priced.offer_percentages()):
+        variant.effective_price = unit
+        variant.offer_percentage = percentage
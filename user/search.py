@@ -0,0 +1,131 @@
+from functools import reduce
+from operator import add, and_
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+from .models import ProductSearchDocument, ProductVariant
+
+
+SEARCH_CHUNK_SIZE = 500
+SEARCH_CONFIG = 'english'
+
+
+def is_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def build_search_document(variant):
+    """Build an unsaved ProductSearchDocument for a variant loaded with its relations."""
+    product = variant.product
+    category = product.category
+    body = [
+        variant.description or '',
+        product.name,
+        category.category_name if category else '',
+        variant.size.size if variant.size else '',
+    ]
+    return ProductSearchDocument(
+        uuid=variant.uuid,
+        variant=variant,
+        title=f"{product.name} {variant.variant}",
+        body="\n".join(part for part in body if part),
+    )
+
+
+def reindex_variants(variant_ids):
+    """
+    Upsert the search documents of the given variants. On PostgreSQL the
+    tsvector is recomputed by the database in the same pass.
+    """
+    variant_ids = list(set(variant_ids))
+    for start in range(0, len(variant_ids), SEARCH_CHUNK_SIZE):
+        chunk = variant_ids[start:start + SEARCH_CHUNK_SIZE]
+        variants = (
+            ProductVariant.objects
+            .filter(id__in=chunk)
+            .select_related('product__category', 'size')
+        )
+        documents = [build_search_document(variant) for variant in variants]
+        if not documents:
+            continue
+        ProductSearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['variant'],
+            update_fields=['title', 'body', 'updated_at'],
+        )
+        if is_postgres():
+            ProductSearchDocument.objects.filter(variant_id__in=chunk).update(
+                search_vector=(
+                    SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+                    SearchVector('body', weight='B', config=SEARCH_CONFIG)
+                )
+            )
+
+
+def reindex_variants_for(queryset):
+    """Reindex every variant in a ProductVariant queryset."""
+    reindex_variants(queryset.values_list('id', flat=True))
+
+
+def rebuild_search_index():
+    reindex_variants_for(ProductVariant.objects.all())
+    return ProductSearchDocument.objects.count()
+
+
+def search_variants(queryset, search_query, prefix=''):
+    """
+    Filter `queryset` down to the rows matching `search_query` and order them
+    by relevance. `prefix` is the lookup path from the queryset's model to
+    ProductVariant, e.g. 'variant__' for CatalogEntry.
+    """
+    document = f'{prefix}search_document__'
+    tie_breaker = f'-{prefix}id'
+
+    if is_postgres():
+        query = SearchQuery(search_query, search_type='websearch', config=SEARCH_CONFIG)
+        return (
+            queryset
+            .annotate(
+                search_rank=SearchRank(F(f'{document}search_vector'), query),
+                search_similarity=TrigramSimilarity(f'{document}title', search_query),
+            )
+            # `trigram_similar` is the `%` operator, served by the title's
+            # gin_trgm_ops index (pg_trgm.similarity_threshold, default 0.3);
+            # the similarity itself is only computed for ordering the matches
+            .filter(
+                Q(**{f'{document}search_vector': query}) | Q(**{f'{document}title__trigram_similar': search_query})
+            )
+            .order_by('-search_rank', '-search_similarity', tie_breaker)
+        )
+
+    # Fallback for databases without full-text search (SQLite in tests):
+    # every term must appear somewhere, title hits rank above body hits
+    terms = search_query.split()
+    if not terms:
+        return queryset
+    matches = [
+        Q(**{f'{document}title__icontains': term}) | Q(**{f'{document}body__icontains': term})
+        for term in terms
+    ]
+    rank = reduce(add, [
+        Case(
+            When(**{f'{document}title__icontains': term}, then=Value(1.0)),
+            default=Value(0.5),
+            output_field=FloatField(),
+        )
+        for term in terms
+    ])
+    return (
+        queryset
+        .filter(reduce(and_, matches))
+        .annotate(search_rank=rank)
+        .order_by('-search_rank', tie_breaker)
+    )
@@ -1,14 +1,83 @@
+import hashlib
+
+from django.db import models
 from rest_framework import serializers
+from .cache import cached_fragments
 from .models import Notification, Order, OrderItem, Product, ProductVariant, CareGuide, Categories
 from .models import ProductImage
 from .models import CompanyContact
 from dashboard.models import ContactUs, CustomAd  ,TermsCondition
 from decimal import Decimal
 from .models import ShippingAddress,ServiceCategory,Service,ServiceFeature,ServiceImage, Cart, CartItem, Wishlist
-
+from .models import CatalogEntry
+from .images import get_rendition_url, rendition_srcset
+
+
+class EagerLoadingMixin:
+    """
+    Maps serializer fields to the relations they read, so a view can load a
+    whole page of objects with a fixed number of queries. Given an explicit
+    field selection, the queryset also loads only the columns it renders.
+    """
+    select_related_map = {}
+    prefetch_related_map = {}
+    # Columns read by fields that are not concrete model fields; fields
+    # mapped to None need the whole row
+    only_fields_map = {}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None, prefix=''):
+        selected = fields
+        fields = cls.Meta.fields if fields is None else fields
+        select_related = set()
+        prefetch_related = set()
+        for field in fields:
+            select_related.update(cls.select_related_map.get(field, ()))
+            prefetch_related.update(cls.prefetch_related_map.get(field, ()))
+
+        if select_related:
+            queryset = queryset.select_related(*[prefix + name for name in sorted(select_related)])
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*[prefix + name for name in sorted(prefetch_related)])
+        if selected is not None and not prefix:
+            columns = cls.get_only_columns(selected)
+            if columns is not None:
+                queryset = queryset.only(*columns)
+        return queryset
+
+    @classmethod
+    def get_only_columns(cls, fields):
+        concrete = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        columns = {'id', 'updated_at'}
+        for field in fields:
+            if field in cls.only_fields_map:
+                if cls.only_fields_map[field] is None:
+                    return None
+                columns.update(cls.only_fields_map[field])
+            elif field in concrete:
+                columns.add(field)
+        return sorted(columns)
+
+
+class DynamicFieldsMixin:
+    """
+    Renders only the field names found in `context[fields_context_key]`
+    when it is set. Nested serializers read the root context, so one
+    selection applies to every variant in a cart, wishlist or order.
+    """
+    fields_context_key = None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get(self.fields_context_key) if self.fields_context_key else None
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
 
 
 class CategorySerializer(serializers.ModelSerializer):
+    icon_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Categories
         fields = [
@@ -16,11 +85,15 @@ class CategorySerializer(serializers.ModelSerializer):
             'id',
             'category_name',
             'icon',
+            'icon_srcset',
             'created_at',
             'updated_at',
         ]
         depth = 1   
 
+    def get_icon_srcset(self, obj):
+        return rendition_srcset(obj, 'icon')
+
 class AddressSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShippingAddress
@@ -58,15 +131,21 @@ class CareGuideSerializer(serializers.ModelSerializer):
         depth = 1
 
 class ProductVariantImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
         fields = [
             'uuid',
             'image',
+            'srcset',
             'created_at',
             'updated_at',
         ]
 
+    def get_srcset(self, obj):
+        return rendition_srcset(obj, 'image')
+
 
 class ContactUsSerializer(serializers.ModelSerializer):
     class Meta:
@@ -116,13 +195,35 @@ class CompanyContactSerializer(serializers.ModelSerializer):
             'updated_at',
         ]
 
-class ProductVariantSerializer(serializers.ModelSerializer):
+class VariantFragmentListSerializer(serializers.ListSerializer):
+    """
+    Loads the cached variant fragments of the whole list before rendering
+    it, so a page of variants (or of cart, wishlist or order lines holding
+    them, with `variant_attr` set) costs one cache round trip.
+    """
+    variant_attr = None
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        variants = items if self.variant_attr is None else [getattr(item, self.variant_attr) for item in items]
+        load_variant_fragments(variants, self.context)
+        return super().to_representation(items)
+
+
+class VariantLineListSerializer(VariantFragmentListSerializer):
+    variant_attr = 'variant'
+
+
+class ProductVariantSerializer(DynamicFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     care_guides = CareGuideSerializer(many=True, read_only=True)
     images = ProductVariantImageSerializer(many=True, read_only=True)
     price= serializers.SerializerMethodField()
     original_price= serializers.SerializerMethodField()
     offer_percentage= serializers.SerializerMethodField()    
     name= serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+
+    fields_context_key = 'variant_fields'
 
     class Meta:
         model = ProductVariant
@@ -147,23 +248,38 @@ class ProductVariantSerializer(serializers.ModelSerializer):
             'care_guides',
             'name',
             'images',  
+            'thumbnail',
             'created_at',
             'updated_at',
         ]
 
         depth = 1
-
+        list_serializer_class = VariantFragmentListSerializer
+
+    # care guides come back through the reverse prefetch with `variant`
+    # already cached, so their nested variant costs no extra query
+    select_related_map = {
+        'product': ('product',),
+        'name': ('product',),
+        'color': ('color',),
+        'size': ('size',),
+    }
+    prefetch_related_map = {
+        'care_guides': ('care_guides',),
+        'images': ('images__renditions',),
+        'thumbnail': ('images__renditions',),
+    }
+    # nested care guides render their variant in full
+    only_fields_map = {
+        'price': ('effective_price',),
+        'original_price': ('price',),
+        'name': ('product', 'variant'),
+        'care_guides': None,
+    }
+
+    # stored on the variant by ProductVariant.save(), exact to the paisa
     def get_price(self, obj):
-        offer_value = Decimal(str(obj.offer)) if obj.offer is not None else Decimal('0.00')
-        
-        if obj.offer_type == 'amount':
-            calculated_price = obj.price - offer_value
-        elif obj.offer_type == 'percentage':
-            percent_decimal = offer_value / Decimal('100.00')
-            calculated_price = obj.price - (obj.price * percent_decimal)
-        else:
-            calculated_price = obj.price
-        return max(Decimal('0.00'), calculated_price).quantize(Decimal('0.1'))
+        return obj.effective_price
 
 
     def get_original_price(self, obj):
@@ -171,22 +287,116 @@ class ProductVariantSerializer(serializers.ModelSerializer):
 
 
     def get_offer_percentage(self, obj):
-        offer_value = Decimal(str(obj.offer)) if obj.offer is not None else Decimal('0.00')
-        product_price = obj.price if obj.price is not None else Decimal('0.00')
-
-        if offer_value == Decimal('0.00') or product_price == Decimal('0.00'):
-            return Decimal('0.00')
-
-        if obj.offer_type == 'percentage':
-            return offer_value
-        elif obj.offer_type == 'amount':
-            return (offer_value / product_price) * Decimal('100.00')
-        else:
-            return Decimal('0.00')
+        return obj.offer_percentage
 
     def get_name(self, obj):
         return  f"{obj.product.name} {obj.variant}"
 
+    def get_thumbnail(self, obj):
+        images = sorted(obj.images.all(), key=lambda image: (image.order_by, image.id))
+        if not images:
+            return None
+        return get_rendition_url(images[0], 'image', 'thumb') or images[0].image.url
+
+    def to_representation(self, instance):
+        fragments = self.context.get('variant_fragments')
+        if fragments is not None and instance.pk in fragments:
+            return fragments[instance.pk]
+        return super().to_representation(instance)
+
+
+def variant_representation(context):
+    """Cache name of the variant payload shape selected by `context`."""
+    fields = context.get('variant_fields')
+    name = 'full' if fields is None else hashlib.md5(','.join(sorted(fields)).encode()).hexdigest()[:12]
+    request = context.get('request')
+    # file URLs are absolute when a request is available
+    return f"{name}@{request.get_host()}" if request is not None else name
+
+
+def load_variant_fragments(variants, context):
+    """
+    Fill `context['variant_fragments']` with the serialized `variants`, read
+    from the fragment cache in bulk. Variants already loaded are skipped, so
+    a view can load a whole response up front and nested lists add nothing.
+    """
+    fragments = context.setdefault('variant_fragments', {})
+    pending = {variant.pk: variant for variant in variants if variant is not None and variant.pk not in fragments}
+    if not pending:
+        return fragments
+
+    render_context = {key: value for key, value in context.items() if key != 'variant_fragments'}
+
+    def render(objects):
+        serializer = serializers.ListSerializer(objects, child=ProductVariantSerializer(), context=render_context)
+        return serializer.data
+
+    fragments.update(cached_fragments(
+        'variant', list(pending.values()), variant_representation(context), render, groups=('catalog',)
+    ))
+    return fragments
+
+
+# Named representations for `?view=`; `full` renders every field
+VARIANT_VIEWS = {
+    'card': [
+        'uuid',
+        'name',
+        'variant',
+        'price',
+        'original_price',
+        'offer_percentage',
+        'stock',
+        'thumbnail',
+        'updated_at',
+    ],
+    'full': None,
+}
+
+
+def get_variant_fields(params):
+    """
+    Variant fields requested with `?fields=a,b` or `?view=card|full`;
+    `None` means every field. Unknown names are ignored.
+    """
+    requested = params.get('fields')
+    if requested:
+        allowed = set(ProductVariantSerializer.Meta.fields)
+        return [name for name in (part.strip() for part in requested.split(',')) if name in allowed]
+    return VARIANT_VIEWS.get(params.get('view'))
+
+
+def get_catalog_fields(params):
+    """`get_variant_fields` for `?view=catalog`, selecting among CatalogEntrySerializer's fields."""
+    requested = params.get('fields')
+    if requested:
+        allowed = set(CatalogEntrySerializer.Meta.fields)
+        return [name for name in (part.strip() for part in requested.split(',')) if name in allowed]
+    return None
+
+
+class CatalogEntrySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    fields_context_key = 'catalog_fields'
+
+    class Meta:
+        model = CatalogEntry
+        fields = [
+            'uuid',
+            'name',
+            'price',
+            'original_price',
+            'offer_percentage',
+            'image',
+            'category',
+            'category_name',
+            'size',
+            'size_name',
+            'stock',
+            'is_featured_collection',
+            'is_bestseller',
+            'updated_at',
+        ]
+
 
 class ServiceCategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -213,15 +423,21 @@ class ServiceFeatureSerializer(serializers.ModelSerializer):
 
 
 class ServiceImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ServiceImage
         fields = [
             'uuid',
             'id',
             'image',
+            'srcset',
             'order_by',
         ]
 
+    def get_srcset(self, obj):
+        return rendition_srcset(obj, 'image')
+
 
 class ServiceSerializer(serializers.ModelSerializer):
     features = ServiceFeatureSerializer(many=True, read_only=True)
@@ -246,12 +462,15 @@ class ServiceSerializer(serializers.ModelSerializer):
 
 
 class CustomAdSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = CustomAd
         fields = [
             'id',
             'title',
             'image',
+            'srcset',
             'target_url',
             'ad_type',
             'start_date',
@@ -264,12 +483,16 @@ class CustomAdSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_srcset(self, obj):
+        return rendition_srcset(obj, 'image')
+
 
 class CartItemSerializer(serializers.ModelSerializer):
     variant = ProductVariantSerializer(read_only=True)
     
     class Meta:
         model = CartItem
+        list_serializer_class = VariantLineListSerializer
         fields = [
             'uuid',
             'variant',
@@ -279,22 +502,51 @@ class CartItemSerializer(serializers.ModelSerializer):
             'updated_at',
         ]
 
+class CartLineSerializer(serializers.ModelSerializer):
+    """A cart line without its nested variant, for cart batch deltas."""
+    variant_uuid = serializers.UUIDField(source='variant.uuid', read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = [
+            'uuid',
+            'variant_uuid',
+            'quantity',
+            'line_total',
+            'updated_at',
+        ]
+
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
-    total = serializers.SerializerMethodField()
+    coupon_code = serializers.CharField(source='coupon.code', read_only=True, default=None)
 
     class Meta:
         model = Cart
         fields = [
             'uuid',
             'items',
+            'coupon_code',
+            'subtotal',
+            'discount',
             'total',
+            'version',
             'created_at',
             'updated_at',
         ]
 
-    def get_total(self, obj):
-        return obj.total()
+
+class GuestCartSerializer(serializers.Serializer):
+    """CartSerializer's payload for a user.guest_cart.GuestCart."""
+    uuid = serializers.CharField(source='id', read_only=True)
+    items = CartItemSerializer(many=True, read_only=True)
+    coupon_code = serializers.CharField(default=None, read_only=True)
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    discount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    version = serializers.IntegerField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
 
 
 class WishlistSerializer(serializers.ModelSerializer):
@@ -302,6 +554,7 @@ class WishlistSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Wishlist
+        list_serializer_class = VariantLineListSerializer
         fields = [
             'uuid',
             'variant',
@@ -310,10 +563,11 @@ class WishlistSerializer(serializers.ModelSerializer):
         ]
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product_variant = ProductVariantSerializer(read_only=True)
+    product_variant = ProductVariantSerializer(source='variant', read_only=True)
 
     class Meta:
         model = OrderItem
+        list_serializer_class = VariantLineListSerializer
         fields = [
             'id',
             'product_variant',
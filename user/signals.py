@@ -0,0 +1,100 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import CACHE_GROUP_MODELS, bump_cache_groups
+from .carts import recalculate_cart_totals
+from .catalog import refresh_catalog_entries, refresh_catalog_entries_for
+from .images import RENDITION_FIELDS, needs_renditions, schedule_renditions
+from .models import Categories, Coupon, ImageRendition, Product, ProductImage, ProductVariant, Sizes
+from .search import reindex_variants, reindex_variants_for
+
+
+@receiver(post_save, sender=ProductVariant)
+def refresh_variant_catalog_entry(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_catalog_entries([instance.pk])
+    reindex_variants([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def refresh_image_catalog_entry(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_catalog_entries([instance.variant_id])
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_catalog_entries(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_catalog_entries_for(instance.variants.all())
+    reindex_variants_for(instance.variants.all())
+
+
+@receiver(post_save, sender=Categories)
+def refresh_category_catalog_entries(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    variants = ProductVariant.objects.filter(product__category=instance)
+    refresh_catalog_entries_for(variants)
+    reindex_variants_for(variants)
+
+
+@receiver(post_save, sender=Sizes)
+def refresh_size_catalog_entries(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    variants = ProductVariant.objects.filter(size=instance)
+    refresh_catalog_entries_for(variants)
+    reindex_variants_for(variants)
+
+
+@receiver(post_save, sender=Coupon)
+def recalculate_coupon_carts(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    recalculate_cart_totals(instance.carts.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Coupon)
+def remember_coupon_carts(sender, instance, **kwargs):
+    # the carts lose the coupon via SET_NULL, which sends no signal
+    instance._cart_ids = list(instance.carts.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Coupon)
+def recalculate_former_coupon_carts(sender, instance, **kwargs):
+    recalculate_cart_totals(getattr(instance, '_cart_ids', []))
+
+
+def bump_model_cache_groups(sender, raw=False, **kwargs):
+    if raw:
+        return
+    label = sender._meta.label
+    bump_cache_groups(*[group for group, models in CACHE_GROUP_MODELS.items() if label in models])
+
+
+for label in {label for models in CACHE_GROUP_MODELS.values() for label in models}:
+    post_save.connect(bump_model_cache_groups, sender=label, dispatch_uid=f'bump_cache_save_{label}')
+    post_delete.connect(bump_model_cache_groups, sender=label, dispatch_uid=f'bump_cache_delete_{label}')
+
+
+def queue_image_renditions(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    field_name = RENDITION_FIELDS[sender._meta.label]
+    if update_fields is not None and field_name not in update_fields:
+        return
+    if needs_renditions(instance, field_name):
+        schedule_renditions(instance, field_name)
+
+
+for label in RENDITION_FIELDS:
+    post_save.connect(queue_image_renditions, sender=label, dispatch_uid=f'queue_renditions_{label}')
+
+
+@receiver(post_delete, sender=ImageRendition)
+def delete_rendition_file(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
@@ -0,0 +1,152 @@
+import numpy as np
+from django.db import transaction
+
+from .cache import bump_cache_groups
+from .models import OrderItem, ProductVariant, SimilarProduct, Wishlist
+
+
+SIMILAR_TOP_N = 12
+
+# Score = ORDER_WEIGHT * co-purchase cosine + WISHLIST_WEIGHT * co-wishlist
+# cosine + attribute score (same category, nearby price, same size)
+ORDER_WEIGHT = 1.0
+WISHLIST_WEIGHT = 0.5
+CATEGORY_WEIGHT = 0.2
+SIZE_WEIGHT = 0.05
+
+# Same-category candidates are the variants this many places away in price
+PRICE_WINDOW = 10
+
+# Baskets bigger than this (bulk buyers, huge wishlists) say little about
+# similarity and cost O(n^2) pairs, so they are skipped
+MAX_BASKET_SIZE = 100
+
+
+def to_index(ids, variant_ids):
+    """Positions of `ids` in the sorted `variant_ids`, -1 where missing."""
+    positions = np.searchsorted(variant_ids, ids)
+    positions = np.minimum(positions, len(variant_ids) - 1)
+    return np.where(variant_ids[positions] == ids, positions, -1)
+
+
+def cooccurrence(baskets, items, n_items):
+    """
+    Cosine-normalised co-occurrence of items sharing a basket, as sparse
+    COO arrays (rows, cols, values) without the diagonal.
+    """
+    if not len(items):
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+
+    # one membership per (basket, item), sorted by basket
+    pairs = np.unique(np.stack([baskets, items], axis=1), axis=0)
+    _, starts, sizes = np.unique(pairs[:, 0], return_index=True, return_counts=True)
+    kept = sizes <= MAX_BASKET_SIZE
+    starts, sizes = starts[kept], sizes[kept]
+    items = pairs[:, 1]
+
+    # Every member paired with every member of its basket: member k of a
+    # basket of size s starting at p yields (items[p + k], items[p + j]) for j < s
+    member_index = np.repeat(starts, sizes) + (
+        np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    )
+    pair_count = np.repeat(sizes, sizes)
+    rows = np.repeat(items[member_index], pair_count)
+    pair_start = np.repeat(np.repeat(starts, sizes), pair_count)
+    pair_offset = np.arange(pair_count.sum()) - np.repeat(np.cumsum(pair_count) - pair_count, pair_count)
+    cols = items[pair_start + pair_offset]
+
+    keep = rows != cols
+    keys, counts = np.unique(rows[keep] * n_items + cols[keep], return_counts=True)
+    rows, cols = keys // n_items, keys % n_items
+
+    frequency = np.bincount(items[member_index], minlength=n_items)
+    values = counts / np.sqrt(frequency[rows] * frequency[cols])
+    return rows, cols, values
+
+
+def attribute_pairs(categories, sizes, prices):
+    """
+    Same-category neighbours within PRICE_WINDOW places in price order,
+    scored higher the closer they are and when they share a size.
+    """
+    order = np.lexsort((prices, categories))
+    rows, cols, values = [], [], []
+    for distance in range(1, min(PRICE_WINDOW, len(order) - 1) + 1):
+        a, b = order[:-distance], order[distance:]
+        same = categories[a] == categories[b]
+        a, b = a[same], b[same]
+        score = CATEGORY_WEIGHT * (1 - distance / (2 * PRICE_WINDOW)) + SIZE_WEIGHT * (
+            (sizes[a] == sizes[b]) & (sizes[a] >= 0)
+        )
+        rows += [a, b]
+        cols += [b, a]
+        values += [score, score]
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+
+
+def top_neighbours(rows, cols, values, n_items, top_n):
+    """Sum duplicate (row, col) scores and keep the `top_n` best cols per row."""
+    keys, inverse = np.unique(rows * n_items + cols, return_inverse=True)
+    scores = np.bincount(inverse, weights=values)
+    rows, cols = keys // n_items, keys % n_items
+
+    order = np.lexsort((-scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    ranks = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    keep = ranks < top_n
+    return rows[keep], cols[keep], scores[keep], ranks[keep]
+
+
+def build_similar_products(top_n=SIMILAR_TOP_N):
+    """Rebuild the SimilarProduct table for all active variants."""
+    variants = np.array(
+        list(
+            ProductVariant.objects.filter(active_status=True)
+            .order_by('id')
+            .values_list('id', 'product__category_id', 'size_id', 'effective_price')
+        ),
+        dtype=object,
+    ).reshape(-1, 4)
+    n_items = len(variants)
+    if n_items < 2:
+        with transaction.atomic():
+            SimilarProduct.objects.all().delete()
+            bump_cache_groups('catalog')
+        return 0
+
+    variant_ids = variants[:, 0].astype(np.int64)
+    categories = np.array([-1 if v is None else v for v in variants[:, 1]], dtype=np.int64)
+    sizes = np.array([-1 if v is None else v for v in variants[:, 2]], dtype=np.int64)
+    prices = variants[:, 3].astype(float)
+
+    parts = [attribute_pairs(categories, sizes, prices)]
+    for weight, memberships in (
+        (ORDER_WEIGHT, OrderItem.objects.exclude(order__status='cancelled').values_list('order_id', 'variant_id')),
+        (WISHLIST_WEIGHT, Wishlist.objects.values_list('user_id', 'variant_id')),
+    ):
+        memberships = np.array(list(memberships), dtype=np.int64).reshape(-1, 2)
+        items = to_index(memberships[:, 1], variant_ids)
+        known = items >= 0
+        rows, cols, values = cooccurrence(memberships[known, 0], items[known], n_items)
+        parts.append((rows, cols, weight * values))
+
+    rows, cols, scores, ranks = top_neighbours(
+        np.concatenate([p[0] for p in parts]),
+        np.concatenate([p[1] for p in parts]),
+        np.concatenate([p[2] for p in parts]),
+        n_items,
+        top_n,
+    )
+
+    links = [
+        SimilarProduct(variant_id=int(variant_ids[row]), similar_id=int(variant_ids[col]), score=float(score), rank=int(rank))
+        for row, col, score, rank in zip(rows, cols, scores, ranks)
+    ]
+    with transaction.atomic():
+        SimilarProduct.objects.all().delete()
+        SimilarProduct.objects.bulk_create(links, batch_size=1000)
+        bump_cache_groups('catalog')
+    return len(links)
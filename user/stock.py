@@ -0,0 +1,165 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+
+from .cache import bump_cache_groups
+from .catalog import refresh_catalog_entries
+from .inventory import record_movements
+from .models import Order, ProductVariant, StockMovement, StockReservation
+
+
+# How long an unpaid order keeps its stock before the sweeper releases it
+STOCK_HOLD_TTL = timedelta(minutes=15)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, variant_ids):
+        self.variant_ids = variant_ids
+        super().__init__("Some items do not have enough stock.")
+
+
+def order_lines(order):
+    """{variant_id: quantity} of an order, one entry per variant."""
+    return dict(
+        order.items.values('variant_id').annotate(quantity=Sum('quantity')).values_list('variant_id', 'quantity')
+    )
+
+
+def stock_changed(variant_ids):
+    # stock moves through queryset updates, which send no signals
+    refresh_catalog_entries(variant_ids)
+    bump_cache_groups('catalog')
+
+
+def reserve_stock(order, hold=True, ttl=STOCK_HOLD_TTL, lines=None):
+    """
+    Take the stock of every line of `order` in one transaction: the
+    variants are locked in id order, then one conditional
+    `UPDATE ... SET stock = stock - n WHERE stock >= n` takes every line,
+    so concurrent checkouts can never drive stock below zero. Held
+    reservations expire after `ttl`; `hold=False` commits them at once
+    (cash on delivery). `lines` ({variant_id: quantity}) saves reading the
+    order's items when the caller has them. Raises InsufficientStock,
+    taking nothing, when any line is short.
+    """
+    lines = order_lines(order) if lines is None else lines
+    now = timezone.now()
+    variant_ids = sorted(lines)
+    with transaction.atomic():
+        # a fixed lock order keeps concurrent reservations from deadlocking
+        stock = dict(
+            ProductVariant.objects.select_for_update().filter(pk__in=variant_ids).order_by('pk').values_list('pk', 'stock')
+        )
+        short = [variant_id for variant_id in variant_ids if stock.get(variant_id, 0) < lines[variant_id]]
+        if variant_ids and not short:
+            taken = Case(*[When(pk=variant_id, then=Value(lines[variant_id])) for variant_id in variant_ids])
+            updated = ProductVariant.objects.filter(pk__in=variant_ids, stock__gte=taken).update(
+                stock=F('stock') - taken, updated_at=now
+            )
+            if updated != len(variant_ids):
+                # only without row locks (SQLite) can stock move after the read;
+                # raising rolls back the lines that were taken
+                short = variant_ids
+        if short:
+            raise InsufficientStock(short)
+
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                order=order,
+                variant_id=variant_id,
+                quantity=quantity,
+                status='held' if hold else 'committed',
+                expires_at=now + ttl if hold else None,
+            )
+            for variant_id, quantity in lines.items()
+        ])
+        record_movements({variant_id: -quantity for variant_id, quantity in lines.items()}, 'sale', order=order)
+        stock_changed(variant_ids)
+
+
+def ensure_stock_held(order, ttl=STOCK_HOLD_TTL):
+    """
+    Hold the order's stock for a payment attempt: extend a live hold, or
+    reserve again when there is none (never reserved, or already released).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        active = order.reservations.filter(status__in=['held', 'committed'])
+        if not active.exists():
+            reserve_stock(order, hold=True, ttl=ttl)
+        else:
+            active.filter(status='held').update(expires_at=now + ttl, updated_at=now)
+
+
+def commit_reservations(order):
+    """
+    Make the order's held stock permanent once it is paid. A hold that
+    expired before the payment arrived is reserved again, which raises
+    InsufficientStock if the stock has been sold meanwhile.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        committed = order.reservations.filter(status='held').update(
+            status='committed', expires_at=None, updated_at=now
+        )
+        if not committed and not order.reservations.filter(status='committed').exists():
+            reserve_stock(order, hold=False)
+
+
+def release_reservations(reservations):
+    """
+    Give the stock of the held or committed `reservations` back to their
+    variants. Each reservation is flipped with its own conditional UPDATE
+    and only restocks if that flip won, so concurrent releases (sweeper and
+    payment failure) never return the same stock twice. Returns the number
+    of reservations released.
+    """
+    now = timezone.now()
+    quantities = defaultdict(int)
+    by_order = defaultdict(lambda: defaultdict(int))
+    released = 0
+    with transaction.atomic():
+        rows = reservations.filter(status__in=['held', 'committed']).values_list(
+            'id', 'order_id', 'variant_id', 'quantity'
+        )
+        for reservation_id, order_id, variant_id, quantity in list(rows):
+            flipped = StockReservation.objects.filter(id=reservation_id, status__in=['held', 'committed']).update(
+                status='released', expires_at=None, updated_at=now
+            )
+            if flipped:
+                quantities[variant_id] += quantity
+                by_order[order_id][variant_id] += quantity
+                released += 1
+
+        for variant_id, quantity in sorted(quantities.items()):
+            ProductVariant.objects.filter(pk=variant_id).update(stock=F('stock') + quantity, updated_at=now)
+        if quantities:
+            StockMovement.objects.bulk_create([
+                StockMovement(variant_id=variant_id, quantity=quantity, reason='cancellation', order_id=order_id)
+                for order_id, lines in by_order.items()
+                for variant_id, quantity in sorted(lines.items())
+            ])
+            stock_changed(list(quantities))
+    return released
+
+
+def release_order_stock(order):
+    return release_reservations(order.reservations.all())
+
+
+def release_expired_reservations(now=None):
+    """
+    Release holds whose payment never arrived and cancel their orders if
+    they are still pending. Returns the number of reservations released.
+    """
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(status='held', expires_at__lt=now)
+    order_ids = list(expired.values_list('order_id', flat=True).distinct())
+    released = release_reservations(expired)
+    Order.objects.filter(id__in=order_ids, status='pending').exclude(
+        reservations__status='committed'
+    ).update(status='cancelled', updated_at=now)
+    return released
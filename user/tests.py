@@ -1,3 +1,1214 @@
-from django.test import TestCase
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from PIL import Image
+
+from authentication.models import Profile
+
+from leafin_backend.fastjson import ORJSONRenderer
+
+from dashboard.models import CustomAd, TermsCondition
+
+from .models import Categories, Sizes, Product, ProductVariant, ProductImage, CareGuide, CatalogEntry, Notification
+from .models import Cart, CartItem, Coupon, ImageRendition, Order, OrderItem, ShippingAddress, SimilarProduct, StockMovement, StockReservation, Wishlist
+from .carts import CartVersionConflict, merge_cart_lines
+from .guest_cart import GuestCart, apply_guest_cart_operations, merge_guest_cart
+from .images import pending_key, rendition_srcset
+from .inventory import SNAPSHOT_LAG, reconcile_stock, record_opening_balances, take_snapshots
+from .pricing import price_lines
+from .serializers import VARIANT_VIEWS, ProductVariantSerializer
+from .similarity import build_similar_products
+from .stock import InsufficientStock, commit_reservations, release_expired_reservations, release_order_stock, reserve_stock
+
+
+def create_variant(product, size=None, price='100.00', offer_type=None, offer=0.0, stock=10, **extra):
+    return ProductVariant.objects.create(
+        product=product,
+        size=size,
+        price=Decimal(price),
+        offer_type=offer_type,
+        offer=offer,
+        stock=stock,
+        **extra
+    )
+
+
+class ProductListQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Categories.objects.create(category_name="Indoor")
+        self.size = Sizes.objects.create(size="Small")
+        self.product = Product.objects.create(category=self.category, name="Monstera")
+
+    def add_variants(self, count):
+        for i in range(count):
+            variant = create_variant(self.product, size=self.size, variant=f"V{i}")
+            ProductImage.objects.create(variant=variant, image=f"product_images/{i}.jpg")
+            CareGuide.objects.create(variant=variant, title="Water", content="Weekly")
+            CareGuide.objects.create(variant=variant, title="Light", content="Indirect")
+
+    def query_count(self, url):
+        cache.clear()  # measure the uncached response
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_product_list_query_count_is_constant(self):
+        """A page of variants costs the same number of queries regardless of size"""
+        self.add_variants(2)
+        small_page = self.query_count(reverse('product-variants'))
+        self.add_variants(8)
+        full_page = self.query_count(reverse('product-variants'))
+        self.assertEqual(small_page, full_page)
+
+    def test_product_collection_query_count_is_constant(self):
+        """Featured/bestseller collections are eager loaded"""
+        self.add_variants(2)
+        ProductVariant.objects.update(is_featured_collection=True, is_bestseller=True)
+        few = self.query_count(reverse('product-collection'))
+        self.add_variants(6)
+        ProductVariant.objects.update(is_featured_collection=True, is_bestseller=True)
+        many = self.query_count(reverse('product-collection'))
+        self.assertEqual(few, many)
+
+
+class CatalogEntryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Categories.objects.create(category_name="Indoor")
+        self.size = Sizes.objects.create(size="Small")
+        self.product = Product.objects.create(category=self.category, name="Monstera")
+        self.variant = create_variant(self.product, size=self.size, variant="Deliciosa",
+                                      offer_type='percentage', offer=10.0)
+
+    def test_entry_tracks_variant_edits(self):
+        """Saving a variant, its images or its category refreshes the catalog row"""
+        entry = CatalogEntry.objects.get(variant=self.variant)
+        self.assertEqual(entry.name, "Monstera Deliciosa")
+        self.assertEqual(entry.price, Decimal('90.00'))
+        self.assertEqual(entry.category_name, "Indoor")
+        self.assertFalse(entry.image)
+
+        self.variant.offer_type = 'amount'
+        self.variant.offer = 25.0
+        self.variant.save()
+        ProductImage.objects.create(variant=self.variant, image="product_images/a.jpg", order_by=2)
+        ProductImage.objects.create(variant=self.variant, image="product_images/b.jpg", order_by=1)
+        self.category.category_name = "Houseplants"
+        self.category.save()
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.price, Decimal('75.00'))
+        self.assertEqual(entry.offer_percentage, Decimal('25.00'))
+        self.assertEqual(entry.image.name, "product_images/b.jpg")
+        self.assertEqual(entry.category_name, "Houseplants")
+
+    def test_catalog_view_reads_catalog(self):
+        """`view=catalog` lists catalog entries in a single page query"""
+        response = self.client.get(reverse('product-variants'), {'view': 'catalog', 'size': self.size.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        card = response.data['results'][0]
+        self.assertEqual(card['uuid'], str(self.variant.uuid))
+        self.assertEqual(card['size_name'], "Small")
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Categories.objects.create(category_name="Succulents")
+        self.aloe = create_variant(Product.objects.create(category=category, name="Aloe"), variant="Vera")
+        self.jade = create_variant(Product.objects.create(category=category, name="Jade"), variant="Mini",
+                                   description="Pairs well with aloe in a sunny window")
+        ferns = Categories.objects.create(category_name="Ferns")
+        create_variant(Product.objects.create(category=ferns, name="Fern"), variant="Boston")
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('product-variants'), {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['uuid'] for item in response.data['results']]
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.search("aloe"), [str(self.aloe.uuid), str(self.jade.uuid)])
+        self.assertEqual(self.search("aloe", view='catalog'), [str(self.aloe.uuid), str(self.jade.uuid)])
+
+    def test_search_document_follows_edits(self):
+        """Renaming a product reindexes its variants"""
+        self.assertEqual(self.search("succulents jade"), [str(self.jade.uuid)])
+        product = self.jade.product
+        product.name = "Crassula"
+        product.save()
+        self.assertEqual(self.search("crassula"), [str(self.jade.uuid)])
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="reader@example.com", password="secret")
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, **params):
+        """Follow `next` links to the end, returning ids and the SQL issued"""
+        seen, queries = [], []
+        params = {'pagination': 'cursor', 'page_size': 3, **params}
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            queries += [query['sql'] for query in ctx.captured_queries]
+            seen += [item.get('id') or item.get('uuid') for item in response.data['results']]
+            url, params = response.data['next'], {}
+        return seen, queries
+
+    def test_notifications_cursor_walks_every_row_once(self):
+        notifications = [
+            Notification.objects.create(user=self.user, title=f"N{i}", message="-", notification_type='system')
+            for i in range(7)
+        ]
+        seen, queries = self.walk(reverse('notification-list'))
+        self.assertEqual(seen, [n.id for n in reversed(notifications)])
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql or 'OFFSET' in sql])
+
+    def test_product_cursor_walks_every_row_once(self):
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Pothos")
+        variants = [create_variant(product, variant=f"V{i}") for i in range(5)]
+        seen, _ = self.walk(reverse('product-variants'))
+        self.assertEqual(seen, [str(v.uuid) for v in reversed(variants)])
+        seen, _ = self.walk(reverse('product-variants'), view='catalog')
+        self.assertEqual(seen, [str(v.uuid) for v in reversed(variants)])
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item.get('category_name') or item.get('title') for item in response.data]
+
+    def test_cached_until_model_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Categories.objects.create(category_name="Indoor")
+        self.assertEqual(self.get_names(reverse('categories')), ["Indoor"])
+        with self.assertNumQueries(0):  # validators and response both cached
+            self.assertEqual(self.get_names(reverse('categories')), ["Indoor"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category.category_name = "Outdoor"
+            category.save()
+        self.assertEqual(self.get_names(reverse('categories')), ["Outdoor"])
+
+    def test_groups_are_independent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Categories.objects.create(category_name="Indoor")
+        self.get_names(reverse('categories'))
+        with self.captureOnCommitCallbacks(execute=True):
+            TermsCondition.objects.create(title="Returns", content="30 days")
+        self.assertEqual(self.get_names(reverse('terms-condition-api')), ["Returns"])
+        with self.assertNumQueries(0):
+            self.get_names(reverse('categories'))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Categories.objects.create(category_name="Indoor")
+
+    def test_unchanged_payload_is_not_modified(self):
+        response = self.client.get(reverse('categories'))
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):  # validators cached until the next catalog bump
+            response = self.client.get(reverse('categories'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_edit_delete_and_params_change_etag(self):
+        etag = self.client.get(reverse('categories'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Categories.objects.create(category_name="Outdoor").delete()
+        response = self.client.get(reverse('categories'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        response = self.client.get(reverse('categories'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        first = self.client.get(reverse('categories'), {'page': 1})['ETag']
+        self.assertNotEqual(self.client.get(reverse('categories'), {'page': 2})['ETag'], first)
+
+
+class EffectivePriceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Palm")
+        self.cheap = create_variant(product, variant="S", price='100.00', offer_type='amount', offer=40.0)
+        self.mid = create_variant(product, variant="M", price='150.00', offer_type='percentage', offer=33.33)
+        self.dear = create_variant(product, variant="L", price='120.00')
+
+    def list_uuids(self, **params):
+        response = self.client.get(reverse('product-variants'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['uuid'] for item in response.data['results']]
+
+    def test_stored_prices_follow_save(self):
+        # 150 x 66.67% = 100.005, rounded half up like every other price
+        self.assertEqual(self.mid.effective_price, Decimal('100.01'))
+        self.assertEqual(self.mid.offer_percentage, Decimal('33.33'))
+        self.dear.offer_type = 'percentage'
+        self.dear.offer = 50.0
+        self.dear.save(update_fields=['offer_type', 'offer'])
+        self.dear.refresh_from_db()
+        self.assertEqual(self.dear.effective_price, Decimal('60.00'))
+
+    def test_price_range_and_ordering(self):
+        expected = [str(v.uuid) for v in (self.cheap, self.mid, self.dear)]
+        self.assertEqual(self.list_uuids(ordering='price'), expected)
+        self.assertEqual(self.list_uuids(ordering='-price', view='catalog'), expected[::-1])
+        self.assertEqual(self.list_uuids(min_price='100', max_price='120'), expected[:0:-1])
+
+    def test_apply_offer_updates_prices_in_bulk(self):
+        ProductVariant.objects.filter(id__in=[self.cheap.id, self.dear.id]).apply_offer('percentage', 10.0)
+        self.assertEqual(
+            list(ProductVariant.objects.order_by('id').values_list('effective_price', flat=True)),
+            [Decimal('90.00'), Decimal('100.01'), Decimal('108.00')],
+        )
+        self.assertEqual(CatalogEntry.objects.get(variant=self.dear).price, Decimal('108.00'))
+
+
+class PricingEngineTests(TestCase):
+    def test_lines_offers_and_coupon_in_one_pass(self):
+        coupon = Coupon(offer_type='percentage', offer=Decimal('10.00'), max_price=25.0, min_price=100.0)
+        priced = price_lines(
+            [Decimal('150.00'), Decimal('100.00'), Decimal('30.00'), Decimal('20.00')],
+            ['percentage', 'amount', None, 'amount'],
+            [33.33, 40.0, 0.0, 50.0],
+            [1, 2, 3, 1],
+            coupon=coupon,
+        )
+        self.assertEqual(priced.unit_prices(), [Decimal('100.01'), Decimal('60.00'), Decimal('30.00'), Decimal('0.00')])
+        self.assertEqual(priced.offer_percentages(), [Decimal('33.33'), Decimal('40.00'), Decimal('0.00'), Decimal('100.00')])
+        self.assertEqual((priced.subtotal, priced.discount, priced.total), (Decimal('310.01'), Decimal('25.00'), Decimal('285.01')))
+
+        self.assertEqual(price_lines([Decimal('90.00')], coupon=coupon).discount, Decimal('0.00'))
+        self.assertEqual(price_lines([]).total, Decimal('0.00'))
+
+    def test_amount_offer_above_price_is_capped_at_the_price(self):
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        variant = create_variant(product, price='1.50', offer_type='amount', offer=200)
+        variant.refresh_from_db()
+        self.assertEqual((variant.effective_price, variant.offer_percentage), (Decimal('0.00'), Decimal('100.00')))
+
+    def test_benchmark_matches_decimal_pricing(self):
+        out = StringIO()
+        call_command('benchmark_pricing', lines=500, repeat=1, stdout=out)
+        self.assertIn("identical: yes", out.getvalue())
+
+
+class ProductFacetsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.indoor = Categories.objects.create(category_name="Indoor")
+        self.outdoor = Categories.objects.create(category_name="Outdoor")
+        self.small = Sizes.objects.create(size="Small")
+        self.large = Sizes.objects.create(size="Large")
+        fern = Product.objects.create(category=self.indoor, name="Fern")
+        rose = Product.objects.create(category=self.outdoor, name="Rose")
+        create_variant(fern, size=self.small, variant="Boston", price='200.00')
+        create_variant(fern, size=self.large, variant="Bird's nest", price='600.00')
+        create_variant(rose, size=self.small, variant="Climbing", price='300.00')
+
+    def facets(self, **params):
+        response = self.client.get(reverse('product-facets'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_counts_are_disjunctive_per_facet(self):
+        with self.assertNumQueries(9):  # 8 ETag aggregates + 1 grouped query
+            data = self.facets(size=self.small.id)
+        self.assertEqual(data['total'], 2)
+        self.assertEqual([(s['name'], s['count']) for s in data['sizes']], [("Large", 1), ("Small", 2)])
+        self.assertEqual([(c['name'], c['count']) for c in data['categories']], [("Indoor", 1), ("Outdoor", 1)])
+        self.assertEqual([b['count'] for b in data['price_buckets']], [1, 1, 0, 0, 0])
+
+        data = self.facets(category_id=self.indoor.id, q="fern")
+        self.assertEqual(data['total'], 2)
+        self.assertEqual([(c['name'], c['count']) for c in data['categories']], [("Indoor", 2)])
+
+    def test_normalized_filters_share_cache(self):
+        self.facets(q="Fern ", size=[self.large.id, self.small.id])
+        with self.assertNumQueries(8):
+            self.facets(q="fern", size=[self.small.id, self.large.id])
+
+
+class SimilarProductTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        plants = Categories.objects.create(category_name="Plants")
+        pots = Categories.objects.create(category_name="Pots")
+        self.fern = create_variant(Product.objects.create(category=plants, name="Fern"), variant="Boston")
+        self.palm = create_variant(Product.objects.create(category=plants, name="Palm"), variant="Areca")
+        self.cactus = create_variant(Product.objects.create(category=plants, name="Cactus"), variant="Moon")
+        self.pot = create_variant(Product.objects.create(category=pots, name="Pot"), variant="Clay")
+
+        buyers = [Profile.objects.create_user(email=f"b{i}@example.com") for i in range(2)]
+        for buyer in buyers:
+            order = Order.objects.create(user=buyer, status='delivered')
+            OrderItem.objects.create(order=order, variant=self.fern, price=Decimal('100.00'))
+            OrderItem.objects.create(order=order, variant=self.pot, price=Decimal('100.00'))
+        Wishlist.objects.create(user=buyers[0], variant=self.fern)
+        Wishlist.objects.create(user=buyers[0], variant=self.cactus)
+
+    def similar(self, variant):
+        response = self.client.get(reverse('similar-product'), {'uuid': str(variant.uuid)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['uuid'] for item in response.data]
+
+    def test_build_ranks_co_purchases_first(self):
+        build_similar_products()
+        self.assertEqual(
+            self.similar(self.fern),
+            [str(self.pot.uuid), str(self.cactus.uuid), str(self.palm.uuid)],
+        )
+        self.assertFalse(SimilarProduct.objects.filter(variant=self.fern, similar=self.fern).exists())
+
+    def test_unindexed_variant_falls_back_to_category(self):
+        self.assertEqual(
+            self.similar(self.fern),
+            [str(self.cactus.uuid), str(self.palm.uuid)],
+        )
+
+
+class VariantFieldSelectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.variant = create_variant(product, variant="Boston", price='80.00')
+        ProductImage.objects.create(variant=self.variant, image="product_images/second.jpg", order_by=2)
+        ProductImage.objects.create(variant=self.variant, image="product_images/first.jpg", order_by=1)
+
+    def test_fields_param_limits_payload_and_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('product-variants'), {'fields': 'uuid,price,bogus'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'uuid', 'price'})
+        listing = [q['sql'] for q in ctx.captured_queries if 'FROM "user_productvariant"' in q['sql']][-1]
+        self.assertNotIn('"description"', listing)
+
+    def test_card_view_in_cart_wishlist_and_orders(self):
+        card = set(VARIANT_VIEWS['card'])
+        response = self.client.post(reverse('add-to-cart') + '?view=card', {'variant_uuid': str(self.variant.uuid)})
+        variant = response.data['items'][0]['variant']
+        self.assertEqual(set(variant), card)
+        self.assertEqual(variant['thumbnail'], '/media/product_images/first.jpg')
+
+        Wishlist.objects.create(user=self.user, variant=self.variant)
+        response = self.client.get(reverse('wishlist'), {'view': 'card'})
+        self.assertEqual(set(response.data[0]['variant']), card)
+
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, variant=self.variant, price=Decimal('80.00'))
+        response = self.client.get(reverse('my-orders'), {'view': 'card'})
+        self.assertEqual(set(response.data['results'][0]['items'][0]['product_variant']), card)
+
+        response = self.client.get(reverse('my-orders'))
+        self.assertIn('care_guides', response.data['results'][0]['items'][0]['product_variant'])
+
+        response = self.client.get(reverse('product-variants'), {'view': 'card'})
+        self.assertEqual(set(response.data['results'][0]), card)
+
+    def test_fields_param_on_catalog_view(self):
+        response = self.client.get(reverse('product-variants'), {'view': 'catalog', 'fields': 'uuid,price,thumbnail'})
+        self.assertEqual(set(response.data['results'][0]), {'uuid', 'price'})
+
+
+class VariantFragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.boston = create_variant(product, variant="Boston", price='80.00')
+        self.kimberly = create_variant(product, variant="Kimberly", price='90.00')
+
+    def test_fragments_are_shared_between_serializers(self):
+        Wishlist.objects.create(user=self.user, variant=self.boston)
+        Wishlist.objects.create(user=self.user, variant=self.kimberly)
+        self.assertEqual(len(self.client.get(reverse('wishlist'), {'view': 'card'}).data), 2)
+
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, variant=self.boston, price=Decimal('80.00'))
+        OrderItem.objects.create(order=order, variant=self.kimberly, price=Decimal('90.00'))
+        with patch.object(ProductVariantSerializer, 'get_name', autospec=True) as get_name:
+            response = self.client.get(reverse('my-orders'), {'view': 'card'})
+        get_name.assert_not_called()
+        names = [item['product_variant']['name'] for item in response.data['results'][0]['items']]
+        self.assertEqual(sorted(names), ["Fern Boston", "Fern Kimberly"])
+
+    def test_representations_and_updates_get_their_own_fragments(self):
+        Wishlist.objects.create(user=self.user, variant=self.boston)
+        self.assertIn('care_guides', self.client.get(reverse('wishlist')).data[0]['variant'])
+        self.assertNotIn('care_guides', self.client.get(reverse('wishlist'), {'view': 'card'}).data[0]['variant'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.boston.price = Decimal('60.00')
+            self.boston.save()
+        variant = self.client.get(reverse('wishlist'), {'view': 'card'}).data[0]['variant']
+        self.assertEqual(variant['price'], Decimal('60.00'))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_RENDITION_WORKERS=0)
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.variant = create_variant(product, variant="Boston")
+
+    def upload(self, size=(1600, 1200), mode='RGBA'):
+        buffer = BytesIO()
+        Image.new(mode, size, (10, 120, 40, 255) if mode == 'RGBA' else (10, 120, 40)).save(buffer, 'PNG')
+        return SimpleUploadedFile("fern.png", buffer.getvalue(), content_type="image/png")
+
+    def test_upload_generates_fixed_width_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(variant=self.variant, image=self.upload())
+
+        renditions = {(r.preset, r.format): r for r in ImageRendition.objects.filter(object_id=image.pk)}
+        self.assertEqual(len(renditions), 6)
+        self.assertEqual((renditions['card', 'webp'].width, renditions['card', 'webp'].height), (480, 360))
+        self.assertEqual(renditions['detail', 'jpeg'].width, 1080)
+
+        data = ProductVariantSerializer(ProductVariant.objects.prefetch_related('images__renditions').get()).data
+        self.assertEqual(data['images'][0]['srcset']['webp'].count('w, '), 2)
+        self.assertTrue(data['thumbnail'].endswith('-thumb.jpg'))
+
+    def test_existing_images_are_rendered_lazily(self):
+        with patch('user.signals.schedule_renditions'):
+            image = ProductImage.objects.create(variant=self.variant, image=self.upload(size=(300, 200), mode='RGB'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rendition_srcset(image, 'image'), {})
+
+        image = ProductImage.objects.prefetch_related('renditions').get(pk=image.pk)
+        # smaller than the card/detail presets: kept at its own width once
+        self.assertEqual(rendition_srcset(image, 'image')['jpeg'].count(' 300w'), 1)
+
+    @override_settings(IMAGE_RENDITION_QUEUE=0)
+    def test_queue_off_leaves_renditions_to_the_command(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(variant=self.variant, image=self.upload())
+        self.assertFalse(ImageRendition.objects.exists())
+
+        call_command('generate_renditions', stdout=StringIO())
+        self.assertEqual(ImageRendition.objects.filter(object_id=image.pk).count(), 6)
+
+    @override_settings(IMAGE_RENDITION_WORKERS=1, IMAGE_RENDITION_QUEUE=1)
+    def test_full_queue_drops_jobs(self):
+        slot = threading.BoundedSemaphore(1)
+        slot.acquire()
+        with patch('user.images._slots', slot), patch('user.images.get_executor') as executor:
+            with self.assertLogs('user.images', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+                image = ProductImage.objects.create(variant=self.variant, image=self.upload())
+
+        executor.return_value.submit.assert_not_called()
+        self.assertFalse(ImageRendition.objects.exists())
+        # dropped jobs can be queued again by the next request
+        self.assertIsNone(cache.get(pending_key(ProductImage, image.pk, 'image')))
+
+
+class CurrentAdsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.live = CustomAd.objects.create(title="Spring sale", priority=1, start_date=self.now - timedelta(days=1))
+        self.top = CustomAd.objects.create(title="Monsoon", priority=5, end_date=self.now + timedelta(hours=2))
+        self.upcoming = CustomAd.objects.create(title="Diwali", priority=9, start_date=self.now + timedelta(hours=1))
+        CustomAd.objects.create(title="Paused", is_active=False)
+        CustomAd.objects.create(title="Over", end_date=self.now - timedelta(minutes=1))
+
+    def test_active_window_and_order_in_sql(self):
+        self.assertEqual(list(CustomAd.objects.currently_active(self.now)), [self.top, self.live])
+        later = self.now + timedelta(hours=1, seconds=1)
+        self.assertEqual(list(CustomAd.objects.currently_active(later)), [self.upcoming, self.top, self.live])
+        self.assertEqual(CustomAd.objects.next_boundary(self.now), self.upcoming.start_date)
+
+    def test_snapshot_expires_at_next_boundary(self):
+        with patch('user.cache.cache.set', wraps=cache.set) as cache_set:
+            response = self.client.get(reverse('custom-ads-api'))
+        self.assertEqual([ad['title'] for ad in response.data], ["Monsoon", "Spring sale"])
+        timeout = cache_set.call_args.args[2]
+        self.assertTrue(3590 <= timeout <= 3600)
+
+        with self.assertNumQueries(0):  # validators and snapshot both cached
+            self.client.get(reverse('custom-ads-api'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.live.is_active = False
+            self.live.save()
+        self.assertEqual([ad['title'] for ad in self.client.get(reverse('custom-ads-api')).data], ["Monsoon"])
+
+
+class FastJSONTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.variant = create_variant(product, variant="Boston", price='80.00')
+
+    def test_renderer_output_matches_stdlib(self):
+        data = {
+            'price': Decimal('80.50'),
+            'uuid': self.variant.uuid,
+            'created_at': self.variant.created_at,
+            'name': "Fern ₹",
+            1: [None, True, 1.5],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+        listing = self.client.get(reverse('product-variants')).data
+        self.assertEqual(ORJSONRenderer().render(listing), JSONRenderer().render(listing))
+
+    def test_json_requests_and_responses(self):
+        response = self.client.post(
+            reverse('add-to-cart'), {'variant_uuid': str(self.variant.uuid), 'quantity': 2}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['items'][0]['quantity'], 2)
+
+        response = self.client.post(reverse('add-to-cart'), '{"variant_uuid": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_benchmark_command(self):
+        Order.objects.create(user=self.user)
+        out = StringIO()
+        call_command('benchmark_json', repeat=1, stdout=out)
+        self.assertIn("ProductListAPIView", out.getvalue())
+        self.assertIn("MyOrdersAPIView", out.getvalue())
+        self.assertNotIn("identical: NO", out.getvalue())
+
+
+def create_order(user, *lines):
+    order = Order.objects.create(user=user)
+    for variant, quantity in lines:
+        OrderItem.objects.create(order=order, variant=variant, quantity=quantity, price=variant.price)
+    return order
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.boston = create_variant(product, variant="Boston", price='80.00')
+        self.kimberly = create_variant(product, variant="Kimberly", price='100.00', offer_type='percentage', offer=10)
+        self.coupon = Coupon.objects.create(
+            name="Spring", code="SPRING", valid_from=timezone.now(), valid_to=timezone.now() + timedelta(days=7),
+            offer_type='amount', offer=Decimal('50.00'),
+        )
+
+    def totals(self):
+        cart = Cart.objects.get(user=self.user)
+        return cart.subtotal, cart.discount, cart.total
+
+    def test_cart_mutations_store_totals(self):
+        self.client.post(reverse('add-to-cart'), {'variant_uuid': str(self.boston.uuid), 'quantity': 2})
+        response = self.client.post(reverse('add-to-cart'), {'variant_uuid': str(self.kimberly.uuid)})
+        self.assertEqual((response.data['subtotal'], response.data['total']), ('250.00', '250.00'))
+        self.assertEqual(response.data['items'][1]['line_total'], Decimal('90.00'))
+
+        item = CartItem.objects.get(variant=self.boston)
+        response = self.client.patch(reverse('update-cart-item', args=[item.uuid]), {'quantity': 1})
+        self.assertEqual(response.data['total'], '170.00')
+        self.client.delete(reverse('remove-from-cart', args=[item.uuid]))
+        self.assertEqual(self.totals(), (Decimal('90.00'), 0, Decimal('90.00')))
+
+    def test_refresh_cart_totals_backfills_existing_carts(self):
+        self.client.post(reverse('add-to-cart'), {'variant_uuid': str(self.boston.uuid), 'quantity': 2})
+        Cart.objects.update(subtotal=0, total=0)
+        call_command('refresh_cart_totals', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.totals(), (Decimal('160.00'), 0, Decimal('160.00')))
+
+    def test_reading_cart_does_not_price_items(self):
+        self.client.post(reverse('add-to-cart'), {'variant_uuid': str(self.boston.uuid)})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('cart'))
+        self.assertFalse([q for q in ctx.captured_queries if 'SUM(' in q['sql'].upper()])
+
+    def test_price_and_coupon_changes_recalculate(self):
+        self.client.post(reverse('add-to-cart'), {'variant_uuid': str(self.boston.uuid), 'quantity': 2})
+        cart = Cart.objects.get(user=self.user)
+        cart.coupon = self.coupon
+        cart.save()
+        cart.recalculate_totals()
+        self.assertEqual((cart.subtotal, cart.discount, cart.total), (Decimal('160.00'), Decimal('50.00'), Decimal('110.00')))
+
+        self.boston.price = Decimal('60.00')
+        self.boston.save()
+        self.assertEqual(self.totals(), (Decimal('120.00'), Decimal('50.00'), Decimal('70.00')))
+
+        ProductVariant.objects.filter(pk=self.boston.pk).apply_offer('amount', 10)
+        self.assertEqual(self.totals(), (Decimal('100.00'), Decimal('50.00'), Decimal('50.00')))
+
+        self.coupon.min_price = 150
+        self.coupon.save()
+        self.assertEqual(self.totals(), (Decimal('100.00'), 0, Decimal('100.00')))
+
+        self.coupon.min_price = 0
+        self.coupon.save()
+        self.assertEqual(self.totals()[1], Decimal('50.00'))
+        self.coupon.delete()
+        self.assertEqual(self.totals(), (Decimal('100.00'), 0, Decimal('100.00')))
+
+
+class CouponTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.boston = create_variant(product, variant="Boston", price='80.00')
+        self.coupon = Coupon.objects.create(
+            name="Spring", code="SPRING", valid_from=timezone.now() - timedelta(days=1),
+            valid_to=timezone.now() + timedelta(days=7), offer_type='percentage', offer=Decimal('10.00'),
+            min_price=Decimal('100.00'),
+        )
+        self.address = ShippingAddress.objects.create(
+            user=self.user, address_line_1="1 Main St", city="Kochi", state="Kerala", pin_code="682001", country="India"
+        )
+
+    def fill_cart(self, quantity=2):
+        # by id, so the authenticated user does not cache a stale cart
+        cart, _ = Cart.objects.get_or_create(user_id=self.user.pk)
+        CartItem.objects.create(cart=cart, variant=self.boston, quantity=quantity)
+        cart.lines_changed()
+        return cart
+
+    def apply(self, code):
+        return self.client.post(reverse('cart-coupon'), {'code': code})
+
+    def checkout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('order-cod'), {'shipping_address_id': str(self.address.uuid)})
+
+    def test_apply_and_remove_update_totals(self):
+        self.fill_cart()
+        response = self.apply("SPRING")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            (response.data['coupon_code'], response.data['discount'], response.data['total']),
+            ("SPRING", '16.00', '144.00'),
+        )
+        response = self.client.delete(reverse('cart-coupon'))
+        self.assertEqual((response.data['coupon_code'], response.data['total']), (None, '160.00'))
+
+    def test_unknown_expired_and_short_carts_are_rejected(self):
+        self.fill_cart(quantity=1)
+        self.assertEqual(self.apply("NOPE").status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.apply("SPRING")
+        self.assertEqual(response.data['error'], "Add items worth 20.00 more to use this coupon.")
+
+        Coupon.objects.filter(pk=self.coupon.pk).update(valid_to=timezone.now() - timedelta(minutes=1))
+        CartItem.objects.update(quantity=2)
+        self.assertEqual(self.apply("SPRING").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsNone(Cart.objects.get(user=self.user).coupon)
+
+    def test_checkout_counts_redemptions_within_limits(self):
+        Coupon.objects.filter(pk=self.coupon.pk).update(per_user_limit=1, usage_limit=5)
+        self.fill_cart()
+        self.apply("SPRING")
+        response = self.checkout()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 1)
+        self.assertEqual(self.coupon.redemptions.get(user=self.user).times_used, 1)
+
+        self.fill_cart()
+        self.assertEqual(self.apply("SPRING").data['error'], "You have already used this coupon.")
+
+    def test_coupon_used_up_meanwhile_fails_checkout(self):
+        Coupon.objects.filter(pk=self.coupon.pk).update(usage_limit=1)
+        self.fill_cart()
+        self.apply("SPRING")
+        Coupon.objects.filter(pk=self.coupon.pk).update(times_used=1)
+
+        response = self.checkout()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], "This coupon has been fully redeemed.")
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.boston.stock, 10)
+
+
+class SyncCartTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.variants = [create_variant(product, variant=f"V{i}", price='10.00') for i in range(30)]
+
+    def sync(self, items):
+        return self.client.post(reverse('sync-cart'), {'items': items}, format='json')
+
+    def test_sync_applies_the_difference_and_reports_rejections(self):
+        first, second, third = self.variants[:3]
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, variant=first, quantity=1)
+        CartItem.objects.create(cart=cart, variant=second, quantity=5)
+        kept = CartItem.objects.get(variant=first)
+
+        response = self.sync([
+            {'variantUuid': str(first.uuid), 'quantity': 3},
+            {'variantUuid': str(third.uuid), 'quantity': 1},
+            {'variantUuid': str(uuid.uuid4()), 'quantity': 1},
+            {'variantUuid': 'not-a-uuid', 'quantity': 1},
+            {'variantUuid': str(third.uuid), 'quantity': 0},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(cart.items.values_list('variant_id', 'quantity')), {first.id: 3, third.id: 1}
+        )
+        self.assertEqual(cart.items.get(variant=first).uuid, kept.uuid)
+        self.assertEqual(
+            [item['error'] for item in response.data['rejected']],
+            ["Invalid variant UUID.", "Quantity must be a whole number of at least 1.", "Product Variant not found."],
+        )
+        self.assertEqual(response.data['total'], '40.00')
+
+    def test_sync_query_count_does_not_grow_with_items(self):
+        items = [{'variantUuid': str(variant.uuid), 'quantity': 2} for variant in self.variants]
+        Cart.objects.create(user=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.sync(items[:3])
+        with CaptureQueriesContext(connection) as big:
+            self.sync(items)
+        self.assertEqual(len(big.captured_queries), len(ctx.captured_queries))
+        self.assertEqual(Cart.objects.get(user=self.user).items.count(), 30)
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.boston = create_variant(product, variant="Boston", price='80.00')
+        self.kimberly = create_variant(product, variant="Kimberly", price='20.00')
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, variant=self.kimberly, quantity=1)
+
+    def batch(self, version, *operations):
+        return self.client.post(reverse('cart-batch'), {'version': version, 'operations': list(operations)}, format='json')
+
+    def test_batch_returns_only_changed_lines(self):
+        response = self.batch(
+            0,
+            {'op': 'add', 'variantUuid': str(self.boston.uuid), 'quantity': 2},
+            {'op': 'add', 'variantUuid': str(self.boston.uuid)},
+            {'op': 'remove', 'variantUuid': str(self.kimberly.uuid)},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['version'], 1)
+        self.assertEqual([(line['variant_uuid'], line['quantity']) for line in response.data['items']], [(str(self.boston.uuid), 3)])
+        self.assertNotIn('variant', response.data['items'][0])
+        self.assertEqual(response.data['removed'], [str(self.kimberly.uuid)])
+        self.assertEqual(response.data['total'], '240.00')
+
+        response = self.batch(1, {'op': 'update', 'variantUuid': str(self.boston.uuid), 'quantity': 1})
+        self.assertEqual((response.data['version'], response.data['total']), (2, '80.00'))
+
+    def test_stale_version_conflicts(self):
+        self.client.post(reverse('add-to-cart'), {'variant_uuid': str(self.boston.uuid)})
+        response = self.batch(0, {'op': 'update', 'variantUuid': str(self.kimberly.uuid), 'quantity': 5})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['version'], 1)
+        self.assertEqual(CartItem.objects.get(variant=self.kimberly).quantity, 1)
+
+    def test_invalid_operation_applies_nothing(self):
+        response = self.batch(
+            0,
+            {'op': 'update', 'variantUuid': str(self.kimberly.uuid), 'quantity': 5},
+            {'op': 'update', 'variantUuid': str(self.boston.uuid), 'quantity': 0},
+            {'op': 'clear', 'variantUuid': str(self.boston.uuid)},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(CartItem.objects.get(variant=self.kimberly).quantity, 1)
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).version, 0)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.boston = create_variant(product, variant="Boston", price='80.00')
+        self.kimberly = create_variant(product, variant="Kimberly", price='20.00')
+
+    def add(self, variant, quantity=1, token=None):
+        headers = {'HTTP_X_CART_TOKEN': token} if token else {}
+        return self.client.post(reverse('add-to-cart'), {'variant_uuid': str(variant.uuid), 'quantity': quantity}, **headers)
+
+    def test_guest_cart_lives_in_the_cache(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.add(self.boston, 2)
+            token = response['X-Cart-Token']
+            response = self.add(self.kimberly, token=token)
+        self.assertFalse([q for q in ctx.captured_queries if not q['sql'].startswith('SELECT')])
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual((response.data['total'], response.data['version']), ('180.00', 2))
+        self.assertEqual([item['quantity'] for item in response.data['items']], [2, 1])
+
+        item_uuid = response.data['items'][0]['uuid']
+        response = self.client.patch(reverse('update-cart-item', args=[item_uuid]), {'quantity': 1}, HTTP_X_CART_TOKEN=token)
+        self.assertEqual(response.data['total'], '100.00')
+        response = self.client.post(
+            reverse('cart-batch'),
+            {'version': 3, 'operations': [{'op': 'remove', 'variantUuid': str(self.boston.uuid)}]},
+            format='json', HTTP_X_CART_TOKEN=token,
+        )
+        self.assertEqual((response.data['removed'], response.data['total']), ([str(self.boston.uuid)], '20.00'))
+        self.assertEqual(self.client.get(reverse('cart'), HTTP_X_CART_TOKEN=token).data['version'], 4)
+
+    def test_tampered_token_starts_a_new_cart(self):
+        token = self.add(self.boston)['X-Cart-Token']
+        response = self.client.get(reverse('cart'), HTTP_X_CART_TOKEN=token + 'x')
+        self.assertEqual(response.data['items'], [])
+        self.assertNotEqual(response['X-Cart-Token'], token)
+
+    def test_login_merges_guest_cart(self):
+        user = Profile.objects.create_user(email="shopper@example.com", password="secret-pass")
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, variant=self.boston, quantity=1)
+        token = self.add(self.boston, 2)['X-Cart-Token']
+        self.add(self.kimberly, token=token)
+
+        response = self.client.post(
+            reverse('login_api'), {'email': "shopper@example.com", 'password': "secret-pass"}, HTTP_X_CART_TOKEN=token
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(dict(cart.items.values_list('variant_id', 'quantity')), {self.boston.id: 3, self.kimberly.id: 1})
+        cart.refresh_from_db()
+        self.assertEqual(cart.total, Decimal('260.00'))
+
+        # the guest cart is gone, so carrying the token again merges nothing
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('cart'), HTTP_X_CART_TOKEN=token)
+        self.assertEqual(response.data['total'], '260.00')
+
+    def test_bad_guest_quantities_never_reach_an_account(self):
+        self.assertEqual(self.add(self.boston, -3).status_code, status.HTTP_400_BAD_REQUEST)
+
+        user = Profile.objects.create_user(email="shopper@example.com", password="secret-pass")
+        cart = Cart.objects.create(user=user)
+        merge_cart_lines(cart, {self.boston.id: -3, self.kimberly.id: 2})
+        self.assertEqual(dict(cart.items.values_list('variant_id', 'quantity')), {self.kimberly.id: 2})
+
+        token = self.add(self.boston)['X-Cart-Token']
+        with patch('authentication.views.merge_guest_cart', side_effect=RuntimeError), self.assertLogs('authentication.views'):
+            response = self.client.post(
+                reverse('login_api'), {'email': "shopper@example.com", 'password': "secret-pass"}, HTTP_X_CART_TOKEN=token
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_parallel_merges_fold_the_guest_cart_once(self):
+        user = Profile.objects.create_user(email="shopper@example.com")
+        token = self.add(self.boston, 2)['X-Cart-Token']
+        request = RequestFactory().get('/', HTTP_X_CART_TOKEN=token)
+        # both requests read the lines before either dropped the cache entry
+        with patch.object(GuestCart, 'delete'):
+            self.assertIsNotNone(merge_guest_cart(request, user))
+            self.assertIsNone(merge_guest_cart(request, user))
+        self.assertEqual(list(CartItem.objects.values_list('quantity', flat=True)), [2])
+        self.assertIsNone(GuestCart.from_token(token))
+
+    def test_concurrent_guest_batches_conflict(self):
+        token = self.add(self.boston)['X-Cart-Token']
+        first, second = GuestCart.from_token(token), GuestCart.from_token(token)
+        operations = [{'op': 'add', 'variantUuid': str(self.kimberly.uuid), 'quantity': 1}]
+        apply_guest_cart_operations(first, 1, operations)
+        with self.assertRaises(CartVersionConflict) as conflict:
+            apply_guest_cart_operations(second, 1, operations)
+        self.assertEqual(conflict.exception.version, 2)
+        self.assertEqual(GuestCart.from_token(token).quantities, {self.boston.id: 1, self.kimberly.id: 1})
+
+
+class WishlistBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.variants = [create_variant(product, variant=f"V{i}") for i in range(4)]
+        Wishlist.objects.create(user=self.user, variant=self.variants[1])
+
+    def test_membership_of_a_page_in_one_query(self):
+        variants = ','.join(str(variant.uuid) for variant in self.variants)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('wishlist-membership'), {'variants': variants})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['flags'], [False, True, False, False])
+        self.assertEqual(response.data['wishlisted'], [str(self.variants[1].uuid)])
+        self.assertEqual(len([q for q in ctx.captured_queries if 'user_wishlist' in q['sql']]), 1)
+
+        response = self.client.get(reverse('wishlist-membership'), {'variants': 'nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_add_and_remove(self):
+        missing = uuid.uuid4()
+        response = self.client.post(reverse('wishlist-bulk'), {
+            'add': [str(self.variants[0].uuid), str(self.variants[1].uuid), str(missing)],
+            'remove': [str(self.variants[1].uuid), str(self.variants[3].uuid)],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['removed'], response.data['not_found']), (1, [str(missing)]))
+        self.assertEqual(
+            set(Wishlist.objects.filter(user=self.user).values_list('variant', flat=True)), {self.variants[0].id}
+        )
+
+        self.client.post(reverse('wishlist-bulk'), {'add': [str(self.variants[0].uuid)]}, format='json')
+        self.assertEqual(Wishlist.objects.filter(user=self.user).count(), 1)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.boston = create_variant(product, variant="Boston", stock=3)
+        self.kimberly = create_variant(product, variant="Kimberly", stock=1)
+        self.address = ShippingAddress.objects.create(
+            user=self.user, address_line_1="1 Main St", city="Kochi", state="Kerala", pin_code="682001", country="India"
+        )
+
+    def stock(self, variant):
+        variant.refresh_from_db()
+        return variant.stock
+
+    def checkout(self, *lines):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        for variant, quantity in lines:
+            CartItem.objects.create(cart=cart, variant=variant, quantity=quantity)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('order-cod'), {'shipping_address_id': str(self.address.uuid)})
+
+    def checkout_queries(self, *lines):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, variant=variant, quantity=quantity) for variant, quantity in lines])
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('order-cod'), {'shipping_address_id': str(self.address.uuid)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return [query['sql'] for query in ctx.captured_queries]
+
+    def test_cash_on_delivery_commits_stock(self):
+        response = self.checkout((self.boston, 2), (self.kimberly, 1))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((self.stock(self.boston), self.stock(self.kimberly)), (1, 0))
+        self.assertEqual(set(StockReservation.objects.values_list('status', flat=True)), {'committed'})
+        self.assertEqual(CatalogEntry.objects.get(variant=self.boston).stock, 1)
+
+    def test_short_line_rolls_back_whole_checkout(self):
+        response = self.checkout((self.boston, 2), (self.kimberly, 2))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['out_of_stock'], [str(self.kimberly.uuid)])
+        self.assertEqual((self.stock(self.boston), self.stock(self.kimberly)), (3, 1))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_checkout_queries_do_not_grow_with_lines(self):
+        product = self.boston.product
+        extra = [create_variant(product, variant=f"V{i}", price='10.00') for i in range(25)]
+        few = self.checkout_queries((self.boston, 1), (self.kimberly, 1))
+        many = self.checkout_queries(*[(variant, 2) for variant in extra])
+        self.assertEqual(len(many), len(few))
+
+        order = Order.objects.latest('id')
+        self.assertEqual((order.total_amount, order.items.count()), (Decimal('500.00'), 25))
+        self.assertFalse(CartItem.objects.exists())
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.total, cart.version), (0, 2))
+
+    def test_checkouts_from_stale_reads_cannot_oversell(self):
+        # both shoppers saw one Kimberly in stock before either reserved it
+        first = create_order(self.user, (self.kimberly, 1))
+        second = create_order(self.user, (self.kimberly, 1))
+        self.assertEqual(self.kimberly.stock, 1)
+        reserve_stock(first)
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(second)
+        self.assertEqual(self.stock(self.kimberly), 0)
+        self.assertFalse(second.reservations.exists())
+
+    def test_expired_holds_are_released_once(self):
+        order = create_order(self.user, (self.boston, 2))
+        reserve_stock(order, ttl=timedelta(minutes=-1))
+        self.assertEqual(self.stock(self.boston), 1)
+
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(release_expired_reservations(), 0)
+        self.assertEqual(release_order_stock(order), 0)
+        self.assertEqual(self.stock(self.boston), 3)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+
+    def test_payment_after_expiry_reserves_again(self):
+        order = create_order(self.user, (self.kimberly, 1))
+        reserve_stock(order, ttl=timedelta(minutes=-1))
+        release_expired_reservations()
+
+        commit_reservations(order)
+        self.assertEqual(self.stock(self.kimberly), 0)
+        self.assertEqual(order.reservations.filter(status='committed').count(), 1)
+
+        with self.assertRaises(InsufficientStock):
+            commit_reservations(create_order(self.user, (self.kimberly, 1)))
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.user = Profile.objects.create_user(email="shopper@example.com")
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        self.variant = create_variant(product, variant="Boston", stock=5)
+
+    def movements(self):
+        return list(self.variant.stock_movements.order_by('id').values_list('reason', 'quantity'))
+
+    def test_every_stock_change_is_ledgered(self):
+        order = create_order(self.user, (self.variant, 2))
+        reserve_stock(order)
+        release_order_stock(order)
+
+        self.variant.refresh_from_db()
+        self.variant.stock = 9
+        self.variant.save()
+        self.variant.stock = 7
+        self.variant.save(update_fields=['stock'])
+        self.variant.save(update_fields=['price'])
+
+        self.assertEqual(self.movements(), [
+            ('opening', 5), ('sale', -2), ('cancellation', 2), ('restock', 4), ('adjustment', -2),
+        ])
+        self.assertEqual(StockMovement.objects.filter(order=order).count(), 2)
+        self.assertEqual(reconcile_stock(), [])
+
+    def test_manual_edit_from_stale_instance_ledgers_stored_difference(self):
+        stale = ProductVariant.objects.get(pk=self.variant.pk)
+        reserve_stock(create_order(self.user, (self.variant, 2)))
+        stale.stock = 6
+        stale.save()
+        self.assertEqual(self.movements()[-1], ('restock', 3))
+        self.assertEqual(reconcile_stock(), [])
+
+    def test_saves_without_stock_changes_take_no_lock(self):
+        stale = ProductVariant.objects.get(pk=self.variant.pk)
+        reserve_stock(create_order(self.user, (self.variant, 2)))
+        stale.description = "Likes shade"
+        with CaptureQueriesContext(connection) as ctx:
+            stale.save()
+        locking = 'SELECT "user_productvariant"."stock", "user_productvariant"."effective_price"'
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith(locking)])
+        stale.refresh_from_db()
+        self.assertEqual((stale.stock, stale.description), (3, "Likes shade"))
+        self.assertEqual(reconcile_stock(), [])
+
+    def test_snapshots_roll_forward_and_reconcile_finds_drift(self):
+        reserve_stock(create_order(self.user, (self.variant, 1)))
+        later = timezone.now() + SNAPSHOT_LAG + timedelta(seconds=1)
+        self.assertEqual(take_snapshots(now=later), 1)
+        self.assertEqual(self.variant.stock_snapshot.stock, 4)
+
+        reserve_stock(create_order(self.user, (self.variant, 1)))
+        self.assertEqual(reconcile_stock(), [])
+
+        ProductVariant.objects.filter(pk=self.variant.pk).update(stock=10)
+        self.assertEqual(reconcile_stock(), [(self.variant.pk, 10, 3)])
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_stock', stdout=out)
+        self.assertIn("stock 10, ledger 3 (+7)", out.getvalue())
+
+    def test_opening_balances_cover_untracked_variants(self):
+        StockMovement.objects.all().delete()
+        self.assertEqual(reconcile_stock(), [(self.variant.pk, 5, 0)])
+        self.assertEqual(record_opening_balances(), 1)
+        self.assertEqual(record_opening_balances(), 0)
+        self.assertEqual(reconcile_stock(), [])
+
+    def test_sale_before_first_snapshot_keeps_opening_balance(self):
+        # the variant predates the ledger, then sells one before snapshot_stock runs
+        StockMovement.objects.all().delete()
+        reserve_stock(create_order(self.user, (self.variant, 1)))
+        self.assertEqual(reconcile_stock(), [(self.variant.pk, 4, -1)])
+
+        call_command('snapshot_stock', stdout=StringIO())
+        self.assertEqual(self.movements(), [('sale', -1), ('opening', 5)])
+        self.assertEqual(reconcile_stock(), [])
+
+
+class ParallelCheckoutTests(TransactionTestCase):
+    """Real concurrent checkouts; needs a database with row locks (PostgreSQL)."""
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_checkouts_never_oversell(self):
+        user = Profile.objects.create_user(email="shopper@example.com")
+        product = Product.objects.create(category=Categories.objects.create(category_name="Indoor"), name="Fern")
+        variant = create_variant(product, variant="Boston", stock=5)
+        orders = [create_order(user, (variant, 1)) for _ in range(12)]
+        barrier = threading.Barrier(len(orders))
+
+        def checkout(order):
+            try:
+                barrier.wait()
+                reserve_stock(order)
+                return True
+            except InsufficientStock:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(orders)) as executor:
+            results = list(executor.map(checkout, orders))
+
+        variant.refresh_from_db()
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(variant.stock, 0)
+        self.assertEqual(StockReservation.objects.aggregate(total=Sum('quantity'))['total'], 5)
@@ -49,6 +49,7 @@ urlpatterns = [
 
     # Product
     path('product-variants/', views.ProductListAPIView.as_view(), name='product-variants'),
+    path('product-facets/', views.ProductFacetsAPIView.as_view(), name='product-facets'),
     path('product-details/', views.ProductSingleAPIView.as_view(), name='product-details'),
 
     path('similar-product/', views.SimilarProductListAPIView.as_view(), name='similar-product'),
@@ -72,6 +73,8 @@ urlpatterns = [
     path('add-to-cart/', views.AddToCartAPIView.as_view(), name='add-to-cart'),
     path('remove-from-cart/<str:uuid>/', views.RemoveFromCartAPIView.as_view(), name='remove-from-cart'),
     path('update-cart-item/<str:uuid>/', views.UpdateCartItemAPIView.as_view(), name='update-cart-item'),
+    path('cart/batch/', views.CartBatchAPIView.as_view(), name='cart-batch'),
+    path('cart/coupon/', views.CartCouponAPIView.as_view(), name='cart-coupon'),
 
     path('sync-cart/', views.SyncCartAPIView.as_view(), name='sync-cart'),
 
@@ -88,4 +91,6 @@ urlpatterns = [
 
     # Wishlist
     path('wishlist/', views.WishlistAPIView.as_view(), name='wishlist'),
+    path('wishlist/membership/', views.WishlistMembershipAPIView.as_view(), name='wishlist-membership'),
+    path('wishlist/bulk/', views.WishlistBulkAPIView.as_view(), name='wishlist-bulk'),
 ]
@@ -1,14 +1,27 @@
-from django.db.models import Q
+import math
+
+from django.db import transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
 from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny,IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.pagination import PageNumberPagination
-
-
-from .models import Notification, Order, Product, ProductVariant, CareGuide, Categories, ShippingAddress, Cart, CartItem, Wishlist
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+from .models import Notification, Order, OrderItem, Product, ProductVariant, CareGuide, Categories, ShippingAddress, Cart, CartItem, Wishlist
+from .models import CatalogEntry, Colors, ImageRendition, ProductImage, SimilarProduct, Sizes
+from .cache import cached_response, cached_value, conditional_get
+from .facets import get_facets
+from .search import search_variants
+from .carts import CartVersionConflict, InvalidCartOperations, apply_cart_operations, parse_cart_lines, sync_cart
+from .coupons import CouponError, apply_coupon, remove_coupon
+from .orders import EmptyCart, place_order
+from .wishlists import InvalidWishlistRequest, add_to_wishlist, parse_variant_uuids, remove_from_wishlist, wishlist_membership
+from .guest_cart import CART_TOKEN_HEADER, GuestCart, apply_guest_cart_operations, merge_guest_cart
+from .stock import InsufficientStock
 from .serializers import *
 
 from dashboard.models import ContactUs, TermsCondition,CustomAd
@@ -20,11 +33,127 @@ class CustomPageNumberPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class CustomCursorPagination(CursorPagination):
+    """
+    Keyset pagination: pages are fetched with `WHERE key < cursor LIMIT n`
+    instead of COUNT + OFFSET, so every page costs the same. The ordering
+    must be backed by an index and end in a unique column.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def __init__(self, ordering='-id'):
+        self.ordering = ordering
+
+
+# Upper bound on the ads snapshot lifetime when no boundary is scheduled
+ADS_SNAPSHOT_MAX_AGE = 60 * 60 * 24
+
+
+# Tables a serialized ProductVariant (depth=1) is built from
+VARIANT_SOURCES = (ProductVariant, Product, ProductImage, CareGuide, Colors, Sizes, ImageRendition)
+
+
+def current_ads(request):
+    return CustomAd.objects.currently_active()
+
+
+def until_next_ads_boundary(now=None):
+    """Seconds until the next start or end date of any ad, the moment the live ads can change on their own."""
+    now = now or timezone.now()
+    boundary = CustomAd.objects.next_boundary(now)
+    if boundary is None:
+        return ADS_SNAPSHOT_MAX_AGE
+    return min(ADS_SNAPSHOT_MAX_AGE, max(1, math.ceil((boundary - now).total_seconds())))
+
+
+def current_ads_snapshot():
+    """
+    Serialized live ads, cached until the next start or end date of any ad.
+    Edits bump the `ads` group.
+    """
+    now = timezone.now()
+
+    def build():
+        ads = CustomAd.objects.currently_active(now).prefetch_related('renditions')
+        return CustomAdSerializer(ads, many=True).data
+
+    return cached_value('current_ads', ('ads',), '', build, timeout=lambda: until_next_ads_boundary(now))
+
+
+def variant_context(request):
+    # `?fields=` / `?view=card|full` for every variant in the response
+    return {'variant_fields': get_variant_fields(request.query_params)}
+
+
+def cart_serializer(cart, request):
+    """CartSerializer with the cart's items and variants loaded in bulk."""
+    context = variant_context(request)
+    items = ProductVariantSerializer.setup_eager_loading(
+        CartItem.objects.select_related('variant'), context['variant_fields'], prefix='variant__'
+    )
+    prefetch_related_objects([cart], Prefetch('items', queryset=items))
+    return CartSerializer(cart, context=context)
+
+
+def user_cart(request):
+    """The user's Cart, with the guest cart the request may still carry merged in."""
+    return merge_guest_cart(request, request.user) or Cart.objects.get_or_create(user=request.user)[0]
+
+
+def guest_cart_response(guest, request, **extra):
+    """A guest cart in CartSerializer's shape, with its token in the X-Cart-Token header."""
+    context = variant_context(request)
+    # a cart has few lines: load whole variants so line totals need no extra query
+    variants = ProductVariantSerializer.setup_eager_loading(
+        ProductVariant.objects.all(), context['variant_fields']
+    ).defer(None)
+    guest.items = guest.line_items(variants)
+    guest.set_totals({item.variant_id: item.variant.effective_price for item in guest.items})
+    response = Response({**GuestCartSerializer(guest, context=context).data, **extra}, status=status.HTTP_200_OK)
+    response[CART_TOKEN_HEADER] = guest.token
+    return response
+
+
+def order_queryset(request):
+    items = ProductVariantSerializer.setup_eager_loading(
+        OrderItem.objects.select_related('variant'), get_variant_fields(request.query_params), prefix='variant__'
+    )
+    return Order.objects.select_related('user', 'shipping_address', 'coupon').prefetch_related(
+        Prefetch('items', queryset=items)
+    )
+
+
+def order_context(orders, request):
+    """Variant context with the fragments of every line of `orders` loaded at once."""
+    context = variant_context(request)
+    load_variant_fragments([item.variant for order in orders for item in order.items.all()], context)
+    return context
+
+
+def out_of_stock_response(error):
+    variants = ProductVariant.objects.filter(id__in=error.variant_ids).values_list('uuid', flat=True)
+    return Response(
+        {"error": str(error), "out_of_stock": [str(uuid) for uuid in variants]},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def get_paginator(request, ordering):
+    # `?pagination=cursor` opts into keyset pagination for infinite scroll
+    if request.query_params.get('pagination') == 'cursor':
+        return CustomCursorPagination(ordering)
+    return CustomPageNumberPagination()
+
+
 class CategoryListAPIView(APIView):
     permission_classes = [AllowAny]
+    @conditional_get(Categories, ImageRendition, groups=('catalog',))
+    @cached_response('catalog')
     def get(self, request): 
         try:
-            categories = Categories.objects.filter(active_status=True).order_by('-id')
+            categories = Categories.objects.filter(active_status=True).prefetch_related('renditions').order_by('-id')
             serializer = CategorySerializer(categories, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
@@ -33,13 +162,18 @@ class CategoryListAPIView(APIView):
 
 class ProductCollectionListAPIView(APIView):
     permission_classes = [AllowAny]
+    @conditional_get(*VARIANT_SOURCES, groups=('catalog',))
+    @cached_response('catalog')
     def get(self, request):
         try:
-            products = ProductVariant.objects.filter(active_status=True)
+            context = variant_context(request)
+            products = ProductVariantSerializer.setup_eager_loading(
+                ProductVariant.objects.filter(active_status=True), context['variant_fields']
+            )
             featured_products = products.filter(is_featured_collection=True)
             bestseller_products = products.filter(is_bestseller=True)   
-            featured_serializer = ProductVariantSerializer(featured_products, many=True)
-            bestseller_serializer = ProductVariantSerializer(bestseller_products, many=True)
+            featured_serializer = ProductVariantSerializer(featured_products, many=True, context=context)
+            bestseller_serializer = ProductVariantSerializer(bestseller_products, many=True, context=context)
 
             response_data = {
                 "featured_products": featured_serializer.data,
@@ -53,62 +187,131 @@ class ProductCollectionListAPIView(APIView):
 class ProductListAPIView(APIView):
     permission_classes = [AllowAny]
 
+    def get_variant_queryset(self, params):
+        products = ProductVariant.objects.filter(active_status=True)
+        return self.filter_products(
+            products, params, category='product__category_id', price='effective_price', key='id', prefix=''
+        )
+
+    def get_catalog_queryset(self, params):
+        # `view=catalog` reads the precomputed catalog entries: one indexed
+        # query per page, no joins and no per-row price math
+        products = CatalogEntry.objects.filter(active_status=True)
+        return self.filter_products(
+            products, params, category='category_id', price='price', key='variant_id', prefix='variant__'
+        )
+
+    def filter_products(self, products, params, category, price, key, prefix):
+        """
+        Apply the listing filters in SQL and return the queryset with its
+        ordering, or `None` as ordering when results are ranked by relevance.
+        """
+        sizes = params.getlist('size')
+        category_id = params.get('category_id')
+        min_price = params.get('min_price')
+        max_price = params.get('max_price')
+        search_query = params.get('q', None)
+
+        if sizes:
+            products = products.filter(size__in=sizes)
+        if category_id:
+            products = products.filter(**{category: category_id})
+        if min_price:
+            products = products.filter(**{f'{price}__gte': min_price})
+        if max_price:
+            products = products.filter(**{f'{price}__lte': max_price})
+
+        if params.get('ordering') == 'price':
+            ordering = (price, key)
+        elif params.get('ordering') == '-price':
+            ordering = (f'-{price}', f'-{key}')
+        elif search_query:
+            ordering = None
+        else:
+            ordering = (f'-{key}',)
+
+        if search_query:
+            products = search_variants(products, search_query, prefix=prefix)
+        if ordering:
+            products = products.order_by(*ordering)
+        return products, ordering
+
+    @conditional_get(*VARIANT_SOURCES, CatalogEntry, groups=('catalog',))
     def get(self, request):
         try:
-            products = ProductVariant.objects.filter(active_status=True).order_by('-id')
-
-            sizes = request.query_params.getlist('size')
-            category_id = request.query_params.get('category_id')
-            search_query = request.query_params.get('q', None)
-
-            # Apply search filtering
-            if search_query:
-                products = products.filter(
-                    Q(variant__icontains=search_query) |
-                    Q(product__name__icontains=search_query) |
-                    Q(description__icontains=search_query)
-                )
-
-            if sizes:
-                products = products.filter(size__in=sizes)
-            if category_id:
-                products = products.filter(product__category_id=category_id)
+            # `view=catalog` serves catalog entries in their own shape;
+            # `view=card` is the variant card every other endpoint returns
+            context = variant_context(request)
+            if request.query_params.get('view') == 'catalog':
+                products, ordering = self.get_catalog_queryset(request.query_params)
+                serializer_class = CatalogEntrySerializer
+                context['catalog_fields'] = get_catalog_fields(request.query_params)
+            else:
+                products, ordering = self.get_variant_queryset(request.query_params)
+                serializer_class = ProductVariantSerializer
+                products = ProductVariantSerializer.setup_eager_loading(products, context['variant_fields'])
+
+            # Results ranked by relevance have no stable key, so they are
+            # always paginated by page number
+            if ordering:
+                paginator = get_paginator(request, ordering)
+            else:
+                paginator = CustomPageNumberPagination()
+            paginated_products = paginator.paginate_queryset(products, request)
 
-            if not products.exists():
+            if not paginated_products:
                 return Response({"error": "No products found"}, status=status.HTTP_404_NOT_FOUND)
 
-            # Apply pagination
-            paginator = CustomPageNumberPagination()
-            paginated_products = paginator.paginate_queryset(products, request)
-
-            if paginated_products is not None:
-                serializer = ProductVariantSerializer(paginated_products, many=True)
-                return paginator.get_paginated_response(serializer.data)
+            serializer = serializer_class(paginated_products, many=True, context=context)
+            return paginator.get_paginated_response(serializer.data)
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = ProductVariantSerializer(products, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class ProductFacetsAPIView(APIView):
+    permission_classes = [AllowAny]
+    @conditional_get(*VARIANT_SOURCES, CatalogEntry, groups=('catalog',))
+    def get(self, request):
+        try:
+            facets = get_facets(request.query_params)
+            return Response(facets, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class SimilarProductListAPIView(APIView):
     permission_classes = [AllowAny]
+    @conditional_get(*VARIANT_SOURCES, SimilarProduct, groups=('catalog',))
     def get(self, request):
         try:
             uuid = request.query_params.get('uuid')
             if not uuid:
                 return Response({"error": "No uuid(s) provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-            product_variants = ProductVariant.objects.filter(uuid=uuid)
-            if not product_variants.exists():
-                return Response({"error": "Product(s) not found"}, status=status.HTTP_404_NOT_FOUND)
-
-            similar_products = ProductVariant.objects.filter(
-
-                product__category_id=product_variants.first().product.category_id
-            ).exclude(uuid=uuid)[:6]
-            serializer = ProductVariantSerializer(similar_products, many=True)
+            context = variant_context(request)
+
+            # Precomputed neighbours (`manage.py build_similar_products`)
+            similar_products = list(ProductVariantSerializer.setup_eager_loading(
+                ProductVariant.objects.filter(
+                    similar_to__variant__uuid=uuid, active_status=True
+                ).order_by('similar_to__rank'),
+                context['variant_fields']
+            )[:6])
+
+            # Variants added since the last build fall back to their category
+            if not similar_products:
+                variant = ProductVariant.objects.select_related('product').filter(uuid=uuid).first()
+                if variant is None:
+                    return Response({"error": "Product(s) not found"}, status=status.HTTP_404_NOT_FOUND)
+
+                similar_products = ProductVariantSerializer.setup_eager_loading(
+                    ProductVariant.objects.filter(
+                        product__category_id=variant.product.category_id, active_status=True
+                    ).exclude(uuid=uuid).order_by('-id'),
+                    context['variant_fields']
+                )[:6]
+            serializer = ProductVariantSerializer(similar_products, many=True, context=context)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -116,6 +319,7 @@ class SimilarProductListAPIView(APIView):
 
 class ProductSingleAPIView(APIView):
     permission_classes = [AllowAny]
+    @conditional_get(*VARIANT_SOURCES, groups=('catalog',))
     def get(self, request):
         try:
             uuids = request.query_params.getlist('uuid')
@@ -125,8 +329,10 @@ class ProductSingleAPIView(APIView):
             product_variants = ProductVariant.objects.filter(uuid__in=uuids)
             if not product_variants.exists():
                 return Response({"error": "Product(s) not found"}, status=status.HTTP_404_NOT_FOUND)
-            
-            serializer = ProductVariantSerializer(product_variants, many=True)
+
+            context = variant_context(request)
+            product_variants = ProductVariantSerializer.setup_eager_loading(product_variants, context['variant_fields'])
+            serializer = ProductVariantSerializer(product_variants, many=True, context=context)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -136,6 +342,8 @@ class ProductSingleAPIView(APIView):
 ## contact us api
 class CompanyContactAPIView(APIView):
     permission_classes = [AllowAny]
+    @conditional_get(CompanyContact, groups=('content',))
+    @cached_response('content')
     def get(self, request):
         try:
             company_contact = CompanyContact.objects.first()
@@ -161,6 +369,8 @@ class ContactUsAPIView(APIView):
 
 class TermsConditionAPIView(APIView):   
     permission_classes = [AllowAny]
+    @conditional_get(TermsCondition, groups=('content',))
+    @cached_response('content')
     def get(self, request):
         try:
             terms = TermsCondition.objects.all()
@@ -174,14 +384,10 @@ class TermsConditionAPIView(APIView):
 class CustomAdListAPIView(APIView):
     permission_classes = [AllowAny]
 
+    @conditional_get(CustomAd, current_ads, ImageRendition, groups=('ads',), timeout=until_next_ads_boundary)
     def get(self, request):
         try:
-            ads = CustomAd.objects.filter(active_status=True)
-            ads = [ad for ad in ads if ad.is_currently_active()]
-
-            ads.sort(key=lambda ad: (-(ad.priority or 0), -(ad.start_date.timestamp() if ad.start_date else 0), -ad.created_at.timestamp()))
-            serializer = CustomAdSerializer(ads, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return Response(current_ads_snapshot(), status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -259,6 +465,8 @@ class AddressDeleteAPIView(APIView):
 ## Service Management
 class ListServiceCategoryAPIView(APIView):
     permission_classes = [AllowAny]
+    @conditional_get(ServiceCategory, groups=('services',))
+    @cached_response('services')
     def get(self, request):
         try:
             categories = ServiceCategory.objects.filter(active_status=True)
@@ -270,9 +478,11 @@ class ListServiceCategoryAPIView(APIView):
 
 class ListServiceAPIView(APIView):
     permission_classes = [AllowAny]
+    @conditional_get(Service, ServiceFeature, ServiceImage, ImageRendition, groups=('services',))
+    @cached_response('services')
     def get(self, request):
         try:
-            services = Service.objects.filter(active_status=True)
+            services = Service.objects.filter(active_status=True).prefetch_related('features', 'images__renditions')
             serializer = ServiceSerializer(services, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
@@ -281,24 +491,29 @@ class ListServiceAPIView(APIView):
 
 ## Cart Management
 class CartAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def get(self, request):
         try:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-            serializer = CartSerializer(cart)
+            if not request.user.is_authenticated:
+                return guest_cart_response(GuestCart.for_request(request), request)
+
+            cart = user_cart(request)
+            serializer = cart_serializer(cart, request)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class AddToCartAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def post(self, request):
         try:
             variant_uuid = request.data.get('variant_uuid')
             quantity = int(request.data.get('quantity', 1))
+            if quantity < 1:
+                return Response({"error": "Quantity must be at least 1"}, status=status.HTTP_400_BAD_REQUEST)
 
             if not variant_uuid:
                 return Response({"error": "Variant UUID is required"}, status=status.HTTP_400_BAD_REQUEST)
@@ -308,7 +523,14 @@ class AddToCartAPIView(APIView):
             except ProductVariant.DoesNotExist:
                 return Response({"error": "Product Variant not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            cart, created = Cart.objects.get_or_create(user=request.user)
+            if not request.user.is_authenticated:
+                guest = GuestCart.for_request(request)
+                quantities = guest.quantities
+                quantities[variant.id] = quantities.get(variant.id, 0) + quantity
+                guest.set_quantities(quantities)
+                return guest_cart_response(guest, request)
+
+            cart = user_cart(request)
             
             cart_item, item_created = CartItem.objects.get_or_create(cart=cart, variant=variant)
             
@@ -318,8 +540,9 @@ class AddToCartAPIView(APIView):
                 cart_item.quantity = quantity
             
             cart_item.save()
+            cart.lines_changed()
 
-            serializer = CartSerializer(cart)
+            serializer = cart_serializer(cart, request)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -327,18 +550,27 @@ class AddToCartAPIView(APIView):
 
 
 class RemoveFromCartAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def delete(self, request, uuid):
         try:
+            if not request.user.is_authenticated:
+                guest = GuestCart.for_request(request)
+                variant_id = guest.variant_for_item(uuid)
+                if variant_id is None:
+                    return Response({"error": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND)
+                guest.set_quantities({key: value for key, value in guest.quantities.items() if key != variant_id})
+                return guest_cart_response(guest, request)
+
             cart = Cart.objects.get(user=request.user)
             try:
                 # Assuming uuid passed is the CartItem UUID.
                 cart_item = CartItem.objects.get(uuid=uuid, cart=cart)
                 cart_item.delete()
+                cart.lines_changed()
                 
                 # Return updated cart
-                serializer = CartSerializer(cart)
+                serializer = cart_serializer(cart, request)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             except CartItem.DoesNotExist:
                  return Response({"error": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND)
@@ -350,7 +582,7 @@ class RemoveFromCartAPIView(APIView):
 
 
 class UpdateCartItemAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def patch(self, request, uuid):
         try:
@@ -358,12 +590,21 @@ class UpdateCartItemAPIView(APIView):
             if quantity < 1:
                  return Response({"error": "Quantity must be at least 1"}, status=status.HTTP_400_BAD_REQUEST)
 
+            if not request.user.is_authenticated:
+                guest = GuestCart.for_request(request)
+                variant_id = guest.variant_for_item(uuid)
+                if variant_id is None:
+                    return Response({"error": "Cart item not found"}, status=status.HTTP_404_NOT_FOUND)
+                guest.set_quantities({**guest.quantities, variant_id: quantity})
+                return guest_cart_response(guest, request)
+
             cart_item = CartItem.objects.get(uuid=uuid, cart__user=request.user)
             cart_item.quantity = quantity
             cart_item.save()
 
             cart = cart_item.cart
-            serializer = CartSerializer(cart)
+            cart.lines_changed()
+            serializer = cart_serializer(cart, request)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except CartItem.DoesNotExist:
             return Response({"error": "Cart item not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -371,14 +612,95 @@ class UpdateCartItemAPIView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class CartBatchAPIView(APIView):
+    """
+    Apply a list of add/update/remove operations to the cart in one
+    transaction. The request carries the cart version the client last saw;
+    a stale version gets 409 with the current one. Only the changed lines,
+    the removed variants and the new totals and version are returned.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        try:
+            operations = request.data.get('operations')
+            version = request.data.get('version')
+            if not isinstance(operations, list) or not operations:
+                return Response({"error": "operations must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(version, int) or isinstance(version, bool):
+                return Response({"error": "version is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                if request.user.is_authenticated:
+                    cart = user_cart(request)
+                    lines, removed = apply_cart_operations(cart, version, operations)
+                else:
+                    cart = GuestCart.for_request(request)
+                    lines, removed = apply_guest_cart_operations(cart, version, operations)
+            except InvalidCartOperations as e:
+                return Response({"error": str(e), "errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+            except CartVersionConflict as e:
+                return Response({"error": str(e), "version": e.version}, status=status.HTTP_409_CONFLICT)
+
+            response = Response({
+                "version": cart.version,
+                "items": CartLineSerializer(lines, many=True).data,
+                "removed": [str(variant_uuid) for variant_uuid in removed],
+                "subtotal": str(cart.subtotal),
+                "discount": str(cart.discount),
+                "total": str(cart.total),
+            }, status=status.HTTP_200_OK)
+            if not request.user.is_authenticated:
+                response[CART_TOKEN_HEADER] = cart.token
+            return response
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class CartCouponAPIView(APIView):
+    """Apply a coupon code to the cart (POST) or take it off (DELETE)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            code = request.data.get('code')
+            if not code:
+                return Response({"error": "Coupon code is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+            cart = user_cart(request)
+            try:
+                apply_coupon(cart, code)
+            except CouponError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = cart_serializer(cart, request)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def delete(self, request):
+        try:
+            cart = user_cart(request)
+            remove_coupon(cart)
+            serializer = cart_serializer(cart, request)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 ## Wishlist Management
 class WishlistAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         try:
-            wishlist_items = Wishlist.objects.filter(user=request.user)
-            serializer = WishlistSerializer(wishlist_items, many=True)
+            context = variant_context(request)
+            wishlist_items = ProductVariantSerializer.setup_eager_loading(
+                Wishlist.objects.filter(user=request.user).select_related('variant'),
+                context['variant_fields'],
+                prefix='variant__'
+            )
+            serializer = WishlistSerializer(wishlist_items, many=True, context=context)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -425,6 +747,52 @@ class WishlistAPIView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class WishlistMembershipAPIView(APIView):
+    """
+    Which of the variants in `?variants=<uuid>,<uuid>,...` are wishlisted,
+    as `wishlisted` UUIDs and `flags` in request order, for a product grid.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            try:
+                variant_uuids = parse_variant_uuids(request.query_params.get('variants', ''))
+            except InvalidWishlistRequest as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            wishlisted = wishlist_membership(request.user, variant_uuids)
+            return Response({
+                "wishlisted": [str(key) for key in variant_uuids if key in wishlisted],
+                "flags": [key in wishlisted for key in variant_uuids],
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class WishlistBulkAPIView(APIView):
+    """Add (`add`) and remove (`remove`) lists of variant UUIDs in one request; removals win."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            try:
+                to_add = parse_variant_uuids(request.data.get('add', []))
+                to_remove = parse_variant_uuids(request.data.get('remove', []))
+            except InvalidWishlistRequest as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            with transaction.atomic():
+                not_found = add_to_wishlist(request.user, to_add) if to_add else []
+                removed = remove_from_wishlist(request.user, to_remove)
+
+            return Response({
+                "removed": removed,
+                "not_found": [str(key) for key in not_found],
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
 
 class CreateCashOnDeliveryOrderAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -452,46 +820,24 @@ class CreateCashOnDeliveryOrderAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            # 2️ Get user cart
+            # 2️ Place the order from the cart; it rolls back unless all of its
+            # stock is taken and the coupon, checked again now, is within its limits
             try:
-                cart = profile.cart
+                # cash on delivery needs no payment: commit the stock now
+                order = place_order(profile, shipping_address, hold=False)
             except Cart.DoesNotExist:
                 return Response(
                     {'error': 'Cart not found.'},
                     status=status.HTTP_404_NOT_FOUND
                 )
-
-            cart_items = cart.items.all()
-            if not cart_items.exists():
-                return Response(
-                    {'error': 'Cart is empty.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # 3️ Create Order
-            order = Order.objects.create(
-                user=profile,
-                shipping_address=shipping_address,
-                status="pending",
-                coupon=cart.coupon,
-                coupon_offer=cart.coupon.offer if cart.coupon else 0,
-            )
-
-            for item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    variant=item.variant,
-                    quantity=item.quantity,
-                    price=item.variant.discounted_price()
-                )
-
-            order.save()  # triggers calculate_total() automatically
-            
-            cart.items.all().delete()
-            cart.coupon = None
-            cart.save()
-
-            serializer = OrderSerializer(order)
+            except EmptyCart as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except InsufficientStock as e:
+                return out_of_stock_response(e)
+            except CouponError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = OrderSerializer(order_queryset(request).get(pk=order.pk), context=variant_context(request))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         except Exception as e:
@@ -505,16 +851,16 @@ class MyOrdersAPIView(APIView):
     def get(self, request):
         try:
             profile = request.user
-            orders = Order.objects.filter(user=profile).order_by('-created_at')
-            paginator = CustomPageNumberPagination()
+            orders = order_queryset(request).filter(user=profile).order_by('-created_at', '-id')
+            paginator = get_paginator(request, ('-created_at', '-id'))
             paginated_orders = paginator.paginate_queryset(orders, request)
             from .serializers import OrderSerializer  # If not already imported
 
             if paginated_orders is not None:
-                serializer = OrderSerializer(paginated_orders, many=True)
+                serializer = OrderSerializer(paginated_orders, many=True, context=order_context(paginated_orders, request))
                 return paginator.get_paginated_response(serializer.data)
 
-            serializer = OrderSerializer(orders, many=True)
+            serializer = OrderSerializer(orders, many=True, context=order_context(orders, request))
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -528,8 +874,8 @@ class NotificationListAPIView(APIView):
     def get(self, request):
         try:
             user_profile = request.user
-            notifications = Notification.objects.filter(user=user_profile).order_by('-created_at')
-            paginator = CustomPageNumberPagination()
+            notifications = Notification.objects.filter(user=user_profile).order_by('-created_at', '-id')
+            paginator = get_paginator(request, ('-created_at', '-id'))
             page = paginator.paginate_queryset(notifications, request)
             from .serializers import NotificationSerializer
 
@@ -576,7 +922,7 @@ class NotificationMarkAllAsReadAPIView(APIView):
 
 
 class SyncCartAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def post(self, request):
         user = request.user
@@ -589,37 +935,17 @@ class SyncCartAPIView(APIView):
             return Response({"error": "No items to sync"}, status=400)
 
         try:
-            from .models import Cart, CartItem, ProductVariant  
-        except ImportError:
-            return Response({"error": "Cart, CartItem or ProductVariant models not found"}, status=500)
-
-        cart, created = Cart.objects.get_or_create(user=user, defaults={})
-
-        updated_variant_uuids = set()
-        for item in items:
-            variant_uuid = item.get("variantUuid")
-            quantity = item.get("quantity")
-            if not variant_uuid or not isinstance(quantity, int) or quantity < 1:
-                continue 
-
-            try:
-                variant = ProductVariant.objects.get(uuid=variant_uuid)
-            except ProductVariant.DoesNotExist:
-                continue 
-
-            cart_item, _ = CartItem.objects.get_or_create(cart=cart, variant=variant, defaults={'quantity': quantity})
-            if cart_item.quantity != quantity:
-                cart_item.quantity = quantity
-                cart_item.save()
-            updated_variant_uuids.add(variant_uuid)
+            if not user.is_authenticated:
+                guest = GuestCart.for_request(request)
+                lines, rejected = parse_cart_lines(items)
+                guest.set_quantities(lines)
+                return guest_cart_response(guest, request, rejected=rejected)
 
-     
-        CartItem.objects.filter(cart=cart).exclude(variant__uuid__in=updated_variant_uuids).delete()
+            cart = user_cart(request)
+            rejected = sync_cart(cart, items)
 
-        try:
-            from .serializers import CartSerializer
-            serializer = CartSerializer(cart)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except ImportError:
-            return Response({"success": True, "cart_id": str(cart.uuid)}, status=status.HTTP_200_OK)
+            serializer = cart_serializer(cart, request)
+            return Response({**serializer.data, "rejected": rejected}, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
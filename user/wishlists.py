@@ -0,0 +1,65 @@
+"""
+Set-based wishlist reads and writes for product grids: membership of a
+page of variants in one query on the (user, variant) index, and bulk
+add/remove with one insert and one delete.
+"""
+import uuid
+
+from .models import ProductVariant, Wishlist
+
+
+# Upper bound on the variants one membership or bulk request may name
+MAX_WISHLIST_BATCH = 100
+
+
+class InvalidWishlistRequest(Exception):
+    pass
+
+
+def parse_variant_uuids(values):
+    """
+    Distinct variant UUIDs of `values` (a list, or a comma separated string),
+    in request order. Raises InvalidWishlistRequest for malformed input.
+    """
+    if isinstance(values, str):
+        values = [value for value in values.split(',') if value.strip()]
+    if not isinstance(values, list):
+        raise InvalidWishlistRequest("Variant UUIDs must be a list.")
+    if len(values) > MAX_WISHLIST_BATCH:
+        raise InvalidWishlistRequest(f"At most {MAX_WISHLIST_BATCH} variants can be sent at once.")
+    try:
+        keys = [uuid.UUID(str(value).strip()) for value in values]
+    except ValueError:
+        raise InvalidWishlistRequest("Invalid variant UUID.")
+    return list(dict.fromkeys(keys))
+
+
+def wishlist_membership(user, variant_uuids):
+    """The subset of `variant_uuids` on `user`'s wishlist."""
+    if not variant_uuids:
+        return set()
+    return set(
+        Wishlist.objects.filter(user=user, variant__uuid__in=variant_uuids).values_list('variant__uuid', flat=True)
+    )
+
+
+def add_to_wishlist(user, variant_uuids):
+    """
+    Wishlist every existing variant of `variant_uuids` with one bulk insert;
+    ones already there are skipped by the (user, variant) constraint.
+    Returns the UUIDs that matched no variant.
+    """
+    variant_ids = dict(ProductVariant.objects.filter(uuid__in=variant_uuids).values_list('uuid', 'id'))
+    Wishlist.objects.bulk_create(
+        [Wishlist(user=user, variant_id=variant_id) for variant_id in variant_ids.values()],
+        ignore_conflicts=True,
+    )
+    return [key for key in variant_uuids if key not in variant_ids]
+
+
+def remove_from_wishlist(user, variant_uuids):
+    """Drop `variant_uuids` from `user`'s wishlist in one delete; returns how many were removed."""
+    if not variant_uuids:
+        return 0
+    deleted, _ = Wishlist.objects.filter(user=user, variant__uuid__in=variant_uuids).delete()
+    return deleted